@@ -0,0 +1,242 @@
+import re
+import html
+from array import array
+
+# Tags, comments, character references and text runs of the raw HTML
+HTML_TOKEN_PATTERN = re.compile(
+    r"<!--.*?-->|<[^>]*>|&(?:#[0-9]+|#[xX][0-9a-fA-F]+|[A-Za-z][A-Za-z0-9]*);|[^<&]+|[<&]",
+    flags=re.DOTALL
+)
+NON_WHITESPACE_PATTERN = re.compile(r"\S+")
+# Compact serialization (paper_serializer): math tags, replaced by their LaTeX alttext
+MATH_TAG_PATTERN = re.compile(r"<math\b[^>]*>", flags=re.IGNORECASE)
+MATH_END_PATTERN = re.compile(r"</math\s*>", flags=re.IGNORECASE)
+ALTTEXT_PATTERN = re.compile(r"""\balttext\s*=\s*(?:"([^"]*)"|'([^']*)')""", flags=re.IGNORECASE)
+# Compact serialization: paragraph id markers, heading and list item prefixes, math and table delimiters
+COMPACT_MARKUP_PATTERN = re.compile(r"\[p\d+\]|(?:^|\n)[ \t]*(?:#{1,6}|-)[ \t]|\\\||[$|]")
+COMPACT_DELIMITERS = str.maketrans("$|", "  ")
+# Typographic variants the model often writes differently from the paper
+CHARACTER_VARIANTS = str.maketrans({
+    "‘": "'", "’": "'", "‚": "'", "‛": "'",
+    "“": '"', "”": '"', "„": '"', "‟": '"',
+    "‐": "-", "‑": "-", "‒": "-", "–": "-", "—": "-", "−": "-",
+    "…": "...",
+    "ﬁ": "fi", "ﬂ": "fl",
+})
+# Fuzzy matching: anchors shorter than this are only matched exactly
+MIN_FUZZY_LENGTH = 12
+# Fuzzy matching: maximum number of candidate positions checked per anchor piece
+MAX_FUZZY_CANDIDATES = 200
+# Fuzzy matching: the end anchor is searched within this many normalized characters after the start
+MAX_FUZZY_FLAW_LENGTH = 20000
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalized form of a text used to compare anchors with the paper: entities decoded,
+    whitespace removed, typographic quotes/dashes replaced and lower-cased.
+    """
+    text = html.unescape(text)
+    return "".join(_normalize_token(token) for token in text.split())
+
+
+def _normalize_token(token):
+    normalized = token.translate(CHARACTER_VARIANTS).lower()
+    if len(normalized) == len(token):
+        return normalized
+    # Replacements of different length (e.g. '…' -> '...'), normalize character by character
+    return "".join(_normalize_character(character) for character in token)
+
+
+def _normalize_character(character):
+    normalized = character.translate(CHARACTER_VARIANTS)
+    lowered = normalized.lower()
+    # Lower-casing a few characters changes their length (e.g. 'İ'), keep them as they are
+    return lowered if len(lowered) == len(normalized) else normalized
+
+
+class AnchorIndex:
+
+    def __init__(self, html_content: str, fuzzy: bool = True, max_error_ratio: float = 0.1, compact: bool = False):
+        """
+        Index of the visible text of an HTML paper to locate flaw anchors.
+
+        The visible text (tags and comments stripped, entities decoded, whitespace removed,
+        see `normalize_text`) is built once per paper together with the raw HTML offsets of
+        each of its characters, so every anchor lookup is a substring search in the normalized
+        text mapped back to raw offsets. Anchors that span a tag, an entity or a line break are
+        found this way. With `fuzzy`, anchors that are still not found are matched with at most
+        `max_error_ratio` edits per character (small wording differences).
+
+        Args:
+            html_content (str): The cleaned HTML of the paper.
+            fuzzy (bool): Enable the bounded fuzzy match.
+            max_error_ratio (float): Maximum number of edits per anchor character of a fuzzy match.
+            compact (bool): Index the text as the compact serialization shows it (paper_serializer),
+                for anchors quoted from a compact prompt: each math element is its LaTeX alttext,
+                mapped to the offsets of the whole element, and the markup the serialization adds
+                ('[p12]' markers, '#' and '-' prefixes, '$' and '|' delimiters) is ignored.
+        """
+        self.html_content = html_content
+        self.fuzzy = fuzzy
+        self.compact = compact
+        self.max_error_ratio = max_error_ratio
+        self.stats = {"normalized": 0, "fuzzy": 0, "missed": 0}
+        self.text, self.starts, self.ends = self._build(html_content)
+
+    def find(self, start_text: str, end_text: str):
+        """
+        Locate the text of a flaw from its start and end anchors.
+
+        Args:
+            start_text (str): The start anchor of the flaw.
+            end_text (str): The end anchor of the flaw.
+
+        Returns:
+            tuple: (start offset, end offset) of the flaw in the raw HTML, or None if it is not found.
+        """
+        start_pattern = self._normalize_anchor(start_text)
+        end_pattern = self._normalize_anchor(end_text)
+        if not start_pattern or not end_pattern:
+            self.stats["missed"] += 1
+            return None
+
+        fuzzy = False
+        start = self.text.find(start_pattern)
+        start_end = start + len(start_pattern)
+        if start < 0 and self.fuzzy:
+            match = self._fuzzy_find(start_pattern, 0, len(self.text))
+            if match is not None:
+                start, start_end = match
+                fuzzy = True
+        if start < 0:
+            self.stats["missed"] += 1
+            return None
+
+        end = self.text.find(end_pattern, start_end)
+        end_end = end + len(end_pattern)
+        if end < 0 and self.fuzzy:
+            match = self._fuzzy_find(end_pattern, start_end, min(len(self.text), start_end + MAX_FUZZY_FLAW_LENGTH))
+            if match is not None:
+                end, end_end = match
+                fuzzy = True
+        if end < 0:
+            self.stats["missed"] += 1
+            return None
+
+        self.stats["fuzzy" if fuzzy else "normalized"] += 1
+        return self.starts[start], self.ends[end_end - 1]
+
+    def _normalize_anchor(self, text):
+        if self.compact:
+            text = COMPACT_MARKUP_PATTERN.sub(" ", text)
+        return normalize_text(text)
+
+    def _build(self, html_content):
+        # One pass over the raw HTML: normalized visible text and the raw [start, end) of each character
+        parts = []
+        starts = array("l")
+        ends = array("l")
+        # End of the math element being skipped (compact), its alttext stands for its content
+        skip_until = 0
+        for token in HTML_TOKEN_PATTERN.finditer(html_content):
+            value = token.group()
+            offset = token.start()
+            if offset < skip_until:
+                continue
+            if self.compact and MATH_TAG_PATTERN.match(value):
+                alttext = ALTTEXT_PATTERN.search(value)
+                alttext = alttext and (alttext.group(1) if alttext.group(1) is not None else alttext.group(2))
+                math_end = MATH_END_PATTERN.search(html_content, token.end())
+                if alttext and math_end is not None:
+                    normalized = "".join(normalize_text(alttext).translate(COMPACT_DELIMITERS).split())
+                    starts.extend([offset] * len(normalized))
+                    ends.extend([math_end.end()] * len(normalized))
+                    parts.append(normalized)
+                    skip_until = math_end.end()
+                continue
+            if value[0] == "<" and len(value) > 1:
+                continue
+            if value[0] == "&" and len(value) > 1:
+                normalized = normalize_text(value)
+                if self.compact:
+                    normalized = "".join(normalized.translate(COMPACT_DELIMITERS).split())
+                for _ in normalized:
+                    starts.append(offset)
+                    ends.append(token.end())
+                parts.append(normalized)
+                continue
+            if self.compact:
+                # Same length, the offsets of the words are unchanged
+                value = value.translate(COMPACT_DELIMITERS)
+            for word in NON_WHITESPACE_PATTERN.finditer(value):
+                word_text = word.group()
+                normalized = _normalize_token(word_text)
+                word_start = offset + word.start()
+                if len(normalized) == len(word_text):
+                    starts.extend(range(word_start, word_start + len(word_text)))
+                    ends.extend(range(word_start + 1, word_start + len(word_text) + 1))
+                else:
+                    for position, character in enumerate(word_text):
+                        for _ in _normalize_character(character):
+                            starts.append(word_start + position)
+                            ends.append(word_start + position + 1)
+                    normalized = "".join(_normalize_character(character) for character in word_text)
+                parts.append(normalized)
+        return "".join(parts), starts, ends
+
+    def _fuzzy_find(self, pattern, low, high):
+        # Pigeonhole: a match with at most k edits contains one of k + 1 pieces of the pattern exactly
+        if len(pattern) < MIN_FUZZY_LENGTH:
+            return None
+        max_errors = max(1, int(len(pattern) * self.max_error_ratio))
+        piece_length = len(pattern) // (max_errors + 1)
+        candidates = set()
+        for piece_index in range(max_errors + 1):
+            piece_start = piece_index * piece_length
+            piece = pattern[piece_start:piece_start + piece_length]
+            position = self.text.find(piece, low, high)
+            count = 0
+            while position >= 0 and count < MAX_FUZZY_CANDIDATES:
+                candidates.add(position - piece_start)
+                position = self.text.find(piece, position + 1, high)
+                count += 1
+
+        best = None
+        for candidate in sorted(candidates):
+            window_start = max(low, candidate - max_errors)
+            window_end = min(high, candidate + len(pattern) + max_errors)
+            distance, match_start, match_end = _best_alignment(
+                pattern, self.text[window_start:window_end], max_errors
+            )
+            if distance <= max_errors and (best is None or distance < best[0]):
+                best = (distance, window_start + match_start, window_start + match_end)
+        if best is None:
+            return None
+        return best[1], best[2]
+
+
+def _best_alignment(pattern, text, max_errors):
+    # Edit distance between the pattern and its best matching substring of text (free start and end),
+    # stopped as soon as it exceeds max_errors
+    previous = [0] * (len(text) + 1)
+    previous_starts = list(range(len(text) + 1))
+    for i, pattern_character in enumerate(pattern, 1):
+        current = [i] + [0] * len(text)
+        current_starts = [0] + [0] * len(text)
+        for j, text_character in enumerate(text, 1):
+            substitution = previous[j - 1] + (pattern_character != text_character)
+            deletion = previous[j] + 1
+            insertion = current[j - 1] + 1
+            if substitution <= deletion and substitution <= insertion:
+                current[j], current_starts[j] = substitution, previous_starts[j - 1]
+            elif deletion <= insertion:
+                current[j], current_starts[j] = deletion, previous_starts[j]
+            else:
+                current[j], current_starts[j] = insertion, current_starts[j - 1]
+        if min(current) > max_errors:
+            return max_errors + 1, 0, 0
+        previous, previous_starts = current, current_starts
+
+    end = min(range(len(text) + 1), key=lambda j: previous[j])
+    return previous[end], previous_starts[end], end
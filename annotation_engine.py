@@ -0,0 +1,152 @@
+import re
+import html
+from html_downloader import PARAGRAPH_ID_TAGS, PARAGRAPH_ID_ATTRIBUTE
+
+# Comments, and opening/closing tags of the elements that can carry a paragraph id
+PARAGRAPH_TAG_PATTERN = re.compile(
+    r"<!--.*?-->|<(/?)(" + "|".join(PARAGRAPH_ID_TAGS) + r")(?=[\s>/])([^>]*)>",
+    flags=re.DOTALL | re.IGNORECASE
+)
+PARAGRAPH_ID_VALUE_PATTERN = re.compile(PARAGRAPH_ID_ATTRIBUTE + r"""=["']([^"']*)["']""")
+
+
+def find_flaw_span(html_content: str, start_text: str, end_text: str):
+    """
+    Locate the text of a flaw in the HTML: the first occurrence of `start_text` and the first
+    occurrence of `end_text` after it, like the regex `start(.*?)end` with DOTALL but without
+    backtracking. Anchors quoted from plain text (compact serialization) are retried with
+    '&', '<', '>' escaped.
+
+    Args:
+        html_content (str): The HTML to search.
+        start_text (str): The start anchor of the flaw.
+        end_text (str): The end anchor of the flaw.
+
+    Returns:
+        tuple: (start offset, end offset) of the flaw text, or None if it is not found.
+    """
+    span = _find_span(html_content, start_text, end_text)
+    if span is None:
+        span = _find_span(html_content, html.escape(start_text, quote=False), html.escape(end_text, quote=False))
+    return span
+
+
+def _find_span(html_content, start_text, end_text):
+    # The first start occurrence is enough: if it has no end after it, no later one has
+    start = html_content.find(start_text)
+    if start < 0:
+        return None
+    end = html_content.find(end_text, start + len(start_text))
+    if end < 0:
+        return None
+    return start, end + len(end_text)
+
+
+def index_paragraph_ids(html_content: str) -> dict:
+    """
+    Lookup table of the paragraph ids of the HTML (see html_downloader.stamp_paragraph_ids),
+    built in one pass over its tags.
+
+    Args:
+        html_content (str): The HTML stamped with paragraph ids.
+
+    Returns:
+        dict: Paragraph id -> (start offset, end offset) of the content of its element,
+            between its opening and closing tags.
+    """
+    spans = {}
+    # (tag name, paragraph id, content start offset) of the open elements
+    stack = []
+    for match in PARAGRAPH_TAG_PATTERN.finditer(html_content):
+        closing, name, attributes = match.groups()
+        if name is None:
+            continue
+        name = name.lower()
+        if not closing:
+            if attributes.rstrip().endswith("/"):
+                continue
+            paragraph_id = PARAGRAPH_ID_VALUE_PATTERN.search(attributes)
+            stack.append((name, paragraph_id.group(1) if paragraph_id else None, match.end()))
+            continue
+        # Close the innermost open element with this name (and any unclosed element inside it)
+        while stack:
+            open_name, paragraph_id, content_start = stack.pop()
+            if paragraph_id is not None:
+                spans[paragraph_id] = (content_start, match.start() if open_name == name else content_start)
+            if open_name == name:
+                break
+    return spans
+
+
+def find_paragraph_span(paragraph_spans: dict, start_id: str, end_id: str = None):
+    """
+    Locate a flaw from the ids of its first and last paragraphs.
+
+    Args:
+        paragraph_spans (dict): Lookup table of `index_paragraph_ids`.
+        start_id (str): Id of the first paragraph of the flaw.
+        end_id (str): Id of the last paragraph of the flaw (defaults to `start_id`).
+
+    Returns:
+        tuple: (start offset, end offset) from the content of the first paragraph to the end of
+            the content of the last one, or None if `start_id` is unknown.
+    """
+    start_span = paragraph_spans.get(start_id)
+    if start_span is None:
+        return None
+    # An unknown end id only marks the first paragraph, ids given in reverse order are swapped
+    end_span = paragraph_spans.get(end_id or start_id, start_span)
+    return min(start_span[0], end_span[0]), max(start_span[1], end_span[1])
+
+
+def splice_spans(html_content: str, spans: list) -> str:
+    """
+    Wrap several spans of the HTML in tags, building the output once.
+
+    Spans are (start offset, end offset, opening tag) in the original HTML and every span is
+    closed with '</span>'. Nested spans are nested in the output (at the same offset the longer
+    span is opened first, then the earlier one in the list). A span that partially overlaps an
+    open span is closed and re-opened around the end of the open span, so the output stays
+    well-formed.
+
+    Args:
+        html_content (str): The HTML to annotate.
+        spans (list): (start offset, end offset, opening tag) tuples.
+
+    Returns:
+        str: The HTML with the spans wrapped.
+    """
+    # Offset -> spans (by their index in `spans`) opening/closing there
+    openings = {}
+    closings = {}
+    for index, (start, end, _) in enumerate(spans):
+        openings.setdefault(start, []).append(index)
+        closings.setdefault(end, []).append(index)
+
+    parts = []
+    stack = []
+    position = 0
+    for offset in sorted(set(openings) | set(closings)):
+        parts.append(html_content[position:offset])
+        position = offset
+
+        ending = set(closings.get(offset, ()))
+        if ending:
+            reopened = []
+            while ending:
+                index = stack.pop()
+                parts.append("</span>")
+                if index in ending:
+                    ending.discard(index)
+                else:
+                    reopened.append(index)
+            for index in reversed(reopened):
+                parts.append(spans[index][2])
+                stack.append(index)
+
+        for index in sorted(openings.get(offset, ()), key=lambda i: (-spans[i][1], i)):
+            parts.append(spans[index][2])
+            stack.append(index)
+
+    parts.append(html_content[position:])
+    return "".join(parts)
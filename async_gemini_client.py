@@ -0,0 +1,555 @@
+import time
+import random
+import asyncio
+from llm_cache import LLMResponseCache
+from context_cache import PromptPrefixCache, is_cached_content_error, build_request
+from flaw_schema import FlawResponseParser, structured_output_config
+from utils import estimate_tokens, genai_errors
+from metrics import metrics, usage_values
+
+# Transient errors worth retrying: quota (429) and server side errors
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        """
+        Async token bucket refilled continuously at `rate_per_minute`.
+
+        Args:
+            rate_per_minute (float): Number of tokens added per minute.
+            capacity (float): Maximum number of stored tokens (defaults to one minute of tokens).
+        """
+        self.rate_per_second = rate_per_minute / 60
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1) -> None:
+        """
+        Wait until `amount` tokens are available and take them.
+        Amounts over the capacity are capped so that large requests still go through.
+        """
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate_per_second)
+
+    def debit(self, amount: float) -> None:
+        """
+        Take tokens without waiting (e.g. output tokens known only after the response).
+        The bucket may go negative, which delays the next requests.
+        """
+        self._refill()
+        self.tokens -= amount
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+
+class AsyncGeminiClient:
+
+    def __init__(
+        self,
+        api_key: str = None,
+        model: str = None,
+        cache: LLMResponseCache = None,
+        max_concurrency: int = 8,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+        max_retries: int = 5,
+        backoff_factor: float = 1.0,
+        max_backoff: float = 60,
+        timeout: float = None,
+        client=None,
+        context_cache_ttl: int = None
+    ):
+        """
+        Async Gemini API client with bounded concurrency, rate limiting and retries.
+
+        At most `max_concurrency` requests run at once. Requests wait for a token bucket of
+        `requests_per_minute` and one of `tokens_per_minute` (prompt tokens are estimated
+        before the call, output tokens are taken from the usage metadata afterwards). 429 and
+        5xx errors and attempt timeouts are retried with jittered exponential backoff, using
+        the delay suggested by the API when there is one.
+
+        Args:
+            api_key (str): Google Gemini API key. Not needed when `client` is given.
+            model (str): Default Gemini model to use.
+            cache (LLMResponseCache): Optional persistent cache of responses.
+            max_concurrency (int): Maximum number of concurrent requests.
+            requests_per_minute (float): Requests per minute limit. None disables it.
+            tokens_per_minute (float): Tokens per minute limit. None disables it.
+            max_retries (int): Number of retries of a retryable error.
+            backoff_factor (float): Base delay of the exponential backoff in seconds.
+            max_backoff (float): Maximum delay between two attempts in seconds.
+            timeout (float): Timeout of one attempt in seconds. None waits forever.
+            client: Object with the `genai.Client` interface (e.g. FakeGeminiClient for offline tests).
+            context_cache_ttl (int): Enable context caching of prompt prefixes with this TTL in seconds
+                (see PromptPrefixCache). None sends every prompt in full.
+        """
+        self.api_key = api_key
+        self.model = model
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        if client is None and not self.api_key:
+            raise ValueError("api_key is required. Set GEMINI_API_KEY in `.env` and pass api_key argument.")
+        if not self.model:
+            raise ValueError("model is required. Set GEMINI_MODEL in `config.py` and pass model argument.")
+
+        # Created on first use (see `client`)
+        self._client = client
+        # Created with the client by the first request with a prefix (see `context_cache`)
+        self.context_cache_ttl = context_cache_ttl
+        self._context_cache = None
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # Created lazily: asyncio primitives must belong to the running event loop
+        self._semaphore = None
+        self._request_bucket = None
+        self._token_bucket = None
+        self._loop = None
+        # Usage metadata of the last generate_text call and whether it was served from the cache
+        self.last_usage_metadata = {}
+        self.last_from_cache = False
+        # Calls, seconds and token counts summed over all calls (cached responses count no tokens)
+        self.usage_totals = {"calls": 0, "seconds": 0.0, **usage_values(None)}
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "cache_hits": 0}
+        self.flaw_parser = FlawResponseParser()
+
+    async def generate_text(
+        self,
+        prompt: str,
+        config: dict = None,
+        bypass_cache: bool = False,
+        deadline: float = None,
+        prefix: str = None
+    ) -> str:
+        """
+        Generate text response for a given prompt.
+
+        Args:
+            prompt (str): Input prompt text.
+            config (dict): Optional generation config (e.g. {"temperature": 0.2}).
+            bypass_cache (bool): Always call the model, the new response still replaces the cached one.
+            deadline (float): Maximum time in seconds for the whole call, retries included.
+            prefix (str): Static text in front of the prompt (see utils.split_prompt), sent through
+                the context cache when it is enabled.
+
+        Returns:
+            str: Generated text response.
+        """
+        text, cache_key, usage_metadata = await self._generate_text(prompt, config, bypass_cache, deadline, prefix)
+        self._cache_response(cache_key, text, usage_metadata)
+        return text
+
+    async def generate_flaws(
+        self,
+        prompt: str,
+        config: dict = None,
+        structured: bool = True,
+        max_rerequests: int = 1,
+        bypass_cache: bool = False,
+        deadline: float = None,
+        prefix: str = None,
+        paragraph_ids: bool = False
+    ) -> list:
+        """
+        Generate the flaw array of a prompt_1-style prompt.
+
+        With `structured`, the response is constrained to FLAW_RESPONSE_SCHEMA so it is valid JSON.
+        Otherwise (models without response schema support) it is parsed by the tolerant
+        FlawResponseParser, and re-requested up to `max_rerequests` times if nothing can be
+        recovered. The counters are in `self.flaw_parser.stats`. Only a response that parses is
+        cached, so an unparsable one is never served again.
+
+        Args:
+            prompt (str): Input prompt text.
+            config (dict): Optional generation config (e.g. {"temperature": 0.2}).
+            structured (bool): Ask for schema-constrained JSON output.
+            max_rerequests (int): Number of new requests when a response cannot be parsed.
+            bypass_cache (bool): Always call the model, the new response still replaces the cached one.
+            deadline (float): Maximum time in seconds of each request, retries included.
+            prefix (str): Static text in front of the prompt, see `generate_text`.
+            paragraph_ids (bool): The prompt asks for paragraph ids (prompt_1_ids), use FLAW_ID_RESPONSE_SCHEMA.
+
+        Returns:
+            list: The valid flaws.
+        """
+        if structured:
+            config = structured_output_config(config, paragraph_ids=paragraph_ids)
+        for attempt in range(max_rerequests + 1):
+            # A re-request bypasses the cache, which may still hold an unparsable response from an older version
+            text, cache_key, usage_metadata = await self._generate_text(
+                prompt, config, bypass_cache or attempt > 0, deadline, prefix
+            )
+            try:
+                flaws = self.flaw_parser.parse(text)
+            except ValueError as e:
+                if attempt == max_rerequests:
+                    raise
+                self.flaw_parser.stats["re_requested"] += 1
+                print(f"{e}, requesting again")
+                continue
+            # Only responses that parse are cached, a bad response must not be replayed
+            self._cache_response(cache_key, text, usage_metadata)
+            return flaws
+
+    async def generate_text_stream(
+        self,
+        prompt: str,
+        config: dict = None,
+        bypass_cache: bool = False,
+        prefix: str = None,
+        deadline: float = None
+    ):
+        """
+        Generate a text response chunk by chunk as the model produces it.
+
+        Opening the stream is retried like `generate_text`. Once text has been yielded an error
+        is raised as is, since the chunks already consumed cannot be taken back. The full text
+        is cached once the stream ends, and a cached response is yielded in one chunk.
+
+        The client `timeout` bounds the wait for the first chunk and for each next chunk, so a
+        stalled stream fails (and is retried before any text was yielded) instead of hanging.
+        `deadline` bounds every wait of the call, retries included; the time the caller spends
+        between two chunks is not counted.
+
+        Args:
+            prompt (str): Input prompt text.
+            config (dict): Optional generation config (e.g. {"temperature": 0.2}).
+            bypass_cache (bool): Always call the model, the new response still replaces the cached one.
+            prefix (str): Static text in front of the prompt, see `generate_text`.
+            deadline (float): Maximum time in seconds spent waiting for the model, retries included.
+
+        Yields:
+            str: The next chunk of the response text.
+        """
+        start = time.perf_counter()
+        cache_key = None
+        if self.cache is not None:
+            cache_key = LLMResponseCache.make_key(self.model, (prefix or "") + prompt, config)
+            if not bypass_cache:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    self.stats["cache_hits"] += 1
+                    self.last_usage_metadata = cached["usage_metadata"]
+                    self.last_from_cache = True
+                    self._record_metrics(start, self.last_usage_metadata, from_cache=True, streamed=True)
+                    yield cached["text"]
+                    return
+
+        self.last_from_cache = False
+        # Local copy: other concurrent calls update self.last_usage_metadata between the chunks
+        usage_metadata = {}
+        self._setup_limits()
+        prompt_tokens = estimate_tokens((prefix or "") + prompt)
+        deadline_at = time.monotonic() + deadline if deadline is not None else None
+        attempt = 0
+        parts = []
+        while True:
+            acquired = False
+            try:
+                # Waiting for a slot and the rate limits counts towards the deadline only
+                await self._stream_wait(self._semaphore.acquire(), deadline, deadline_at, idle=False)
+                acquired = True
+                if self._request_bucket is not None:
+                    await self._stream_wait(self._request_bucket.acquire(1), deadline, deadline_at, idle=False)
+                if self._token_bucket is not None:
+                    await self._stream_wait(self._token_bucket.acquire(prompt_tokens), deadline, deadline_at, idle=False)
+                self.stats["requests"] += 1
+                stream = await self._stream_wait(self._open_stream(prompt, config, prefix), deadline, deadline_at)
+                stream = aiter(stream)
+                last_response = None
+                while True:
+                    response = await self._stream_wait(anext(stream, None), deadline, deadline_at)
+                    if response is None:
+                        break
+                    last_response = response
+                    if getattr(response, "usage_metadata", None) is not None:
+                        usage_metadata = self._usage_to_dict(response.usage_metadata)
+                        self.last_usage_metadata = usage_metadata
+                    text = getattr(response, "text", "") or ""
+                    if text:
+                        parts.append(text)
+                        yield text
+            except Exception as e:
+                if parts or self._deadline_passed(deadline_at):
+                    self.stats["failures"] += 1
+                    description = f"deadline of {deadline}s exceeded" if self._deadline_passed(deadline_at) else self._describe_error(e)
+                    metrics.record("llm_failure", labels={"model": self.model}, error=description)
+                    raise
+                error = e
+            else:
+                if last_response is not None:
+                    self._debit_output_tokens(last_response, prompt_tokens)
+                break
+            finally:
+                if acquired:
+                    self._semaphore.release()
+
+            attempt += 1
+            if attempt > self.max_retries or not self._is_retryable(error):
+                self.stats["failures"] += 1
+                metrics.record("llm_failure", labels={"model": self.model}, error=self._describe_error(error))
+                raise error
+            self.stats["retries"] += 1
+            metrics.record("llm_retry", labels={"model": self.model}, error=self._describe_error(error))
+            delay = self._backoff_delay(attempt, error)
+            if deadline_at is not None:
+                delay = min(delay, max(deadline_at - time.monotonic(), 0))
+            print(f"[-] Gemini stream failed ({self._describe_error(error)}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        self._record_metrics(start, usage_metadata, from_cache=False, streamed=True)
+        if cache_key is not None and parts:
+            self.cache.put(cache_key, self.model, "".join(parts), usage_metadata)
+
+    async def generate_many(self, prompts: list, config: dict = None, deadline: float = None) -> list:
+        """
+        Generate the responses of several prompts concurrently (within the concurrency and rate limits).
+
+        Returns:
+            list: One entry per prompt, the response text or the exception raised for it.
+        """
+        return await asyncio.gather(
+            *(self.generate_text(prompt, config=config, deadline=deadline) for prompt in prompts),
+            return_exceptions=True
+        )
+
+    async def _generate_text(self, prompt, config, bypass_cache, deadline, prefix):
+        """
+        Returns:
+            tuple: (text, cache key or None if there is nothing to cache, usage metadata)
+        """
+        start = time.perf_counter()
+        cache_key = None
+        if self.cache is not None:
+            cache_key = LLMResponseCache.make_key(self.model, (prefix or "") + prompt, config)
+            if not bypass_cache:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    self.stats["cache_hits"] += 1
+                    self.last_usage_metadata = cached["usage_metadata"]
+                    self.last_from_cache = True
+                    self._record_metrics(start, self.last_usage_metadata, from_cache=True)
+                    return cached["text"], None, cached["usage_metadata"]
+
+        if deadline is not None:
+            deadline_at = time.monotonic() + deadline
+            try:
+                response = await asyncio.wait_for(self._generate_with_retries(prompt, config, prefix), deadline)
+            except asyncio.TimeoutError:
+                if not self._deadline_passed(deadline_at):
+                    # The attempt timeouts ran out of retries first, already counted as a failure
+                    raise
+                self.stats["failures"] += 1
+                metrics.record("llm_failure", labels={"model": self.model}, error=f"deadline of {deadline}s exceeded")
+                raise TimeoutError(f"[-] Gemini call exceeded its deadline of {deadline} seconds")
+        else:
+            response = await self._generate_with_retries(prompt, config, prefix)
+
+        text = getattr(response, "text", "") or ""
+        usage_metadata = self._usage_to_dict(getattr(response, "usage_metadata", None))
+        self.last_usage_metadata = usage_metadata
+        self.last_from_cache = False
+        self._record_metrics(start, usage_metadata, from_cache=False)
+        return text, cache_key, usage_metadata
+
+    def _cache_response(self, cache_key, text, usage_metadata):
+        # Empty responses (e.g. blocked prompts) are not cached
+        if cache_key is not None and text:
+            self.cache.put(cache_key, self.model, text, usage_metadata)
+
+    async def _generate_with_retries(self, prompt, config, prefix=None):
+        self._setup_limits()
+        prompt_tokens = estimate_tokens((prefix or "") + prompt)
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                if self._request_bucket is not None:
+                    await self._request_bucket.acquire(1)
+                if self._token_bucket is not None:
+                    await self._token_bucket.acquire(prompt_tokens)
+                self.stats["requests"] += 1
+                try:
+                    response = await self._call(prompt, config, prefix)
+                except Exception as e:
+                    error = e
+                else:
+                    self._debit_output_tokens(response, prompt_tokens)
+                    return response
+
+            attempt += 1
+            if attempt > self.max_retries or not self._is_retryable(error):
+                self.stats["failures"] += 1
+                metrics.record("llm_failure", labels={"model": self.model}, error=self._describe_error(error))
+                raise error
+            self.stats["retries"] += 1
+            metrics.record("llm_retry", labels={"model": self.model}, error=self._describe_error(error))
+            delay = self._backoff_delay(attempt, error)
+            print(f"[-] Gemini request failed ({self._describe_error(error)}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    @property
+    def client(self):
+        # google.genai takes most of the start-up time of the scripts, it is imported by the first request
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    @property
+    def context_cache(self):
+        # PromptPrefixCache needs `client`, both are created by the first request that uses them
+        if self.context_cache_ttl and self._context_cache is None:
+            self._context_cache = PromptPrefixCache(self.client, self.model, ttl_seconds=self.context_cache_ttl)
+        return self._context_cache
+
+    async def _call(self, prompt, config, prefix):
+        handle = await self._get_context_handle(prefix)
+        try:
+            return await self._with_timeout(
+                self.client.aio.models.generate_content(model=self.model, **build_request(prompt, config, prefix, handle))
+            )
+        except genai_errors().APIError as e:
+            if handle is None or not is_cached_content_error(e):
+                raise
+            # The cached prefix is gone (expired or deleted), send the full prompt
+            print(f"[-] Cached prompt prefix rejected ({e.code}), sending the full prompt")
+            self.context_cache.invalidate(handle)
+            return await self._with_timeout(
+                self.client.aio.models.generate_content(model=self.model, **build_request(prompt, config, prefix, None))
+            )
+
+    async def _open_stream(self, prompt, config, prefix):
+        handle = await self._get_context_handle(prefix)
+        try:
+            return await self.client.aio.models.generate_content_stream(
+                model=self.model, **build_request(prompt, config, prefix, handle)
+            )
+        except genai_errors().APIError as e:
+            if handle is None or not is_cached_content_error(e):
+                raise
+            print(f"[-] Cached prompt prefix rejected ({e.code}), sending the full prompt")
+            self.context_cache.invalidate(handle)
+            return await self.client.aio.models.generate_content_stream(
+                model=self.model, **build_request(prompt, config, prefix, None)
+            )
+
+    async def _get_context_handle(self, prefix):
+        if not prefix or self.context_cache is None:
+            return None
+        # Creating the cached content is a blocking call, made once per prefix
+        return await asyncio.to_thread(self.context_cache.get_handle, prefix)
+
+    async def _with_timeout(self, request):
+        if self.timeout is None:
+            return await request
+        return await asyncio.wait_for(request, self.timeout)
+
+    async def _stream_wait(self, request, deadline, deadline_at, idle=True):
+        # One wait of a stream: bounded by the client timeout when waiting for the model (idle),
+        # and by what is left of the deadline of the call
+        timeout = self.timeout if idle else None
+        if deadline_at is not None:
+            remaining = max(deadline_at - time.monotonic(), 0)
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        if timeout is None:
+            return await request
+        try:
+            return await asyncio.wait_for(request, timeout)
+        except asyncio.TimeoutError:
+            if self._deadline_passed(deadline_at):
+                raise TimeoutError(f"[-] Gemini stream exceeded its deadline of {deadline} seconds") from None
+            raise
+
+    def _deadline_passed(self, deadline_at):
+        return deadline_at is not None and time.monotonic() >= deadline_at
+
+    def _setup_limits(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._request_bucket = TokenBucket(self.requests_per_minute) if self.requests_per_minute else None
+        self._token_bucket = TokenBucket(self.tokens_per_minute) if self.tokens_per_minute else None
+
+    def _debit_output_tokens(self, response, prompt_tokens):
+        # Only the prompt estimate was taken before the call, take the rest of the real usage now
+        if self._token_bucket is None:
+            return
+        usage = getattr(response, "usage_metadata", None)
+        total_tokens = getattr(usage, "total_token_count", None) if usage is not None else None
+        if total_tokens and total_tokens > prompt_tokens:
+            self._token_bucket.debit(total_tokens - prompt_tokens)
+
+    def _is_retryable(self, error):
+        if isinstance(error, asyncio.TimeoutError):
+            return True
+        return isinstance(error, genai_errors().APIError) and error.code in RETRYABLE_STATUS_CODES
+
+    def _backoff_delay(self, attempt, error):
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** (attempt - 1)))
+        # Full jitter, so that concurrent requests do not retry in lockstep
+        delay = random.uniform(0, delay)
+        retry_delay = self._retry_delay_from_error(error)
+        if retry_delay is not None:
+            delay = max(delay, min(retry_delay, self.max_backoff))
+        return delay
+
+    def _retry_delay_from_error(self, error):
+        # 429 responses may carry a google.rpc.RetryInfo detail such as {"retryDelay": "12s"}
+        details = getattr(error, "details", None)
+        if not isinstance(details, dict):
+            return None
+        for detail in (details.get("error") or {}).get("details") or []:
+            if isinstance(detail, dict) and str(detail.get("@type", "")).endswith("RetryInfo"):
+                try:
+                    return float(str(detail.get("retryDelay", "")).rstrip("s"))
+                except ValueError:
+                    return None
+        return None
+
+    def _describe_error(self, error):
+        if isinstance(error, asyncio.TimeoutError):
+            return f"timeout after {self.timeout}s"
+        if isinstance(error, genai_errors().APIError):
+            return f"{error.code} {error.status}"
+        return str(error)
+
+    def _record_metrics(self, start, usage_metadata, from_cache, streamed=False):
+        seconds = round(time.perf_counter() - start, 6)
+        # Tokens of a cached response were paid for by the call that cached it
+        usage = usage_values(usage_metadata if not from_cache else None)
+        self._add_usage_totals(seconds, usage)
+        if not metrics.enabled:
+            return
+        metrics.record(
+            "llm", labels={"model": self.model}, seconds=seconds,
+            from_cache=from_cache, streamed=streamed, **usage
+        )
+
+    def _add_usage_totals(self, seconds, usage):
+        self.usage_totals["calls"] += 1
+        self.usage_totals["seconds"] = round(self.usage_totals["seconds"] + seconds, 6)
+        for field, value in usage.items():
+            self.usage_totals[field] += value
+
+    def _usage_to_dict(self, usage_metadata) -> dict:
+        if usage_metadata is None:
+            return {}
+        return usage_metadata.model_dump(mode="json", exclude_none=True)
@@ -0,0 +1,312 @@
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import multiprocessing
+import statistics
+import hashlib
+import tracemalloc
+import contextlib
+import http.server
+import concurrent.futures
+import requests
+from html_downloader import HTML_Downloader
+from html_annotator import HTMLAnnotator
+from gemini_client import GeminiClient
+from fake_gemini_client import FakeGeminiClient
+from synthetic_paper import generate_paper, flaws_to_response_text
+from prompt import prompt_1
+from utils import fill_paper_in_prompt, convert_json_string_to_json
+
+BENCHMARK_STAGES = ("download", "clean", "prompt", "llm", "parse", "annotate")
+# Stages whose input is the raw HTML, the others get the cleaned HTML (or the response for "parse")
+RAW_INPUT_STAGES = ("download", "clean")
+# Download + clean modes of the memory benchmark: name -> (parser backend, streaming)
+MEMORY_BENCHMARK_MODES = {
+    "html.parser": ("html.parser", False),
+    "lxml": ("lxml", False),
+    "lxml-streaming": ("lxml", True),
+}
+
+
+class _PaperHandler(http.server.BaseHTTPRequestHandler):
+    # Serves the synthetic papers of the server, by path, with an ETag like arxiv.org
+    def do_GET(self):
+        body = self.server.papers.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalPaperServer:
+
+    def __init__(self):
+        """
+        Local HTTP stand-in for arxiv.org serving synthetic papers, used as a context manager.
+        """
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _PaperHandler)
+        self._server.papers = {}
+        self._thread = None
+
+    def add_paper(self, name: str, html_content: str) -> str:
+        """
+        Serve a paper and return its URL.
+        """
+        self._server.papers[f"/html/{name}"] = html_content.encode("utf-8")
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/html/{name}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+class BenchmarkSuite:
+
+    def __init__(self, sizes: dict, repeats: int = 3, parser_backend: str = "html.parser", template_directory: str = "./", template_file: str = "template.html", seed: int = 0):
+        """
+        Offline benchmark of the pipeline stages on synthetic papers of several sizes.
+
+        For every size a synthetic arXiv-style paper and its flaws are generated
+        (synthetic_paper.generate_paper), served by a LocalPaperServer instead of arxiv.org, and
+        every stage is run `repeats` times: download (HTTP GET), clean (HTML_Downloader.process_html),
+        prompt (fill_paper_in_prompt), llm (GeminiClient.generate_text on a FakeGeminiClient
+        without latency, so only the client overhead is measured), parse (convert_json_string_to_json)
+        and annotate (HTMLAnnotator.annotate_html). The median wall time, the throughput and the
+        peak Python memory (tracemalloc, measured in a separate run) are reported per stage.
+        Nothing needs network access or a GPU.
+
+        Args:
+            sizes (dict): Size name -> number of sections of the paper (e.g. {"small": 5, "large": 80}).
+            repeats (int): Number of timed runs of each stage.
+            parser_backend (str): Parser backend of the clean stage ('html.parser' or 'lxml').
+            template_directory (str): Directory of the Jinja template of the annotate stage.
+            template_file (str): File name of the Jinja template.
+            seed (int): Seed of the synthetic papers.
+        """
+        self.sizes = sizes
+        self.repeats = max(repeats, 1)
+        self.parser_backend = parser_backend
+        self.template_directory = template_directory
+        self.template_file = template_file
+        self.seed = seed
+        self.results = {}
+
+    def run(self) -> dict:
+        """
+        Run every stage on every size.
+
+        Returns:
+            dict: Size name -> stage -> {"seconds", "min_seconds", "input_bytes", "mb_per_second", "peak_memory_mb"},
+                plus the paper size and number of flaws under "paper".
+        """
+        self.results = {}
+        with LocalPaperServer() as server, tempfile.TemporaryDirectory() as output_dir:
+            for size_name, sections in self.sizes.items():
+                raw_html, flaws = generate_paper(sections=sections, seed=self.seed)
+                url = server.add_paper(f"2501.{sections:05d}v1", raw_html)
+                print(f"[*] Benchmark '{size_name}': {len(raw_html) / 1e6:.2f} MB, {len(flaws)} flaws")
+                self.results[size_name] = self._run_size(url, raw_html, flaws, output_dir)
+        return self.results
+
+    def _run_size(self, url, raw_html, flaws, output_dir):
+        session = requests.Session()
+        downloader = HTML_Downloader(
+            html_url=url, html_file_name="paper.html", output_dir=output_dir,
+            session=session, parser_backend=self.parser_backend
+        )
+        annotator = HTMLAnnotator(template_directory=self.template_directory, template_file=self.template_file)
+        # Warm up (template compilation, lazy imports, connection pool) before timing
+        with contextlib.redirect_stdout(io.StringIO()):
+            cleaned_html = downloader.process_html(raw_html)
+            annotator._get_template()
+        response_text = flaws_to_response_text(flaws)
+        gemini = GeminiClient(
+            api_key="offline", model="fake-model",
+            client=FakeGeminiClient(response_text=response_text, latency=0.0)
+        )
+        prompt = fill_paper_in_prompt(prompt_1, cleaned_html)
+
+        def annotate():
+            annotator.html_paper = cleaned_html
+            annotator.flaws = flaws
+            annotator.annotate_html()
+
+        stages = {
+            "download": lambda: session.get(url).text,
+            "clean": lambda: downloader.process_html(raw_html),
+            "prompt": lambda: fill_paper_in_prompt(prompt_1, cleaned_html),
+            "llm": lambda: gemini.generate_text(prompt),
+            "parse": lambda: convert_json_string_to_json(response_text),
+            "annotate": annotate,
+        }
+        inputs = {"llm": prompt, "parse": response_text}
+
+        result = {"paper": {"raw_bytes": len(raw_html.encode("utf-8")), "cleaned_bytes": len(cleaned_html.encode("utf-8")), "flaws": len(flaws)}}
+        for stage in BENCHMARK_STAGES:
+            input_text = inputs.get(stage, raw_html if stage in RAW_INPUT_STAGES else cleaned_html)
+            result[stage] = self._measure(stages[stage], len(input_text.encode("utf-8")))
+            print(f"[+]   {stage}: {result[stage]['seconds'] * 1000:.2f} ms, {result[stage]['mb_per_second']} MB/s, peak {result[stage]['peak_memory_mb']} MB")
+        return result
+
+    def _measure(self, function, input_bytes):
+        timings = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(self.repeats):
+                start = time.perf_counter()
+                function()
+                timings.append(time.perf_counter() - start)
+            # tracemalloc slows the code down, measure the memory in its own run
+            tracemalloc.start()
+            try:
+                function()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        seconds = statistics.median(timings)
+        return {
+            "seconds": round(seconds, 6),
+            "min_seconds": round(min(timings), 6),
+            "input_bytes": input_bytes,
+            "mb_per_second": round(input_bytes / 1e6 / seconds, 2) if seconds else None,
+            "peak_memory_mb": round(peak / 1e6, 3),
+        }
+
+
+def _peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def _download_in_fresh_process(url, output_dir, parser_backend, streaming):
+    # Runs in its own process: the peak resident memory only covers this download
+    if parser_backend == "lxml":
+        # Imported before the baseline so they are not counted
+        import lxml_html_cleaner
+        import streaming_html_cleaner
+    downloader = HTML_Downloader(
+        html_url=url, html_file_name="paper.html", output_dir=output_dir,
+        parser_backend=parser_backend, cache=None, streaming=streaming
+    )
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        downloader.download_html()
+    seconds = time.perf_counter() - start
+    path = os.path.join(output_dir, "paper.html")
+    return {
+        "seconds": round(seconds, 3),
+        "peak_memory_mb": round(_peak_rss_mb() - baseline, 1),
+        "cleaned_bytes": os.path.getsize(path) if os.path.isfile(path) else None,
+    }
+
+
+def run_memory_benchmark(sizes: dict, modes: tuple = tuple(MEMORY_BENCHMARK_MODES), seed: int = 0) -> dict:
+    """
+    Peak memory of downloading and cleaning papers of increasing size, in memory and streamed.
+
+    Every synthetic paper is served by a LocalPaperServer and downloaded and cleaned once per
+    mode by HTML_Downloader.download_html, each time in a freshly spawned process. The peak is
+    the growth of the resident set size (ru_maxrss) during the download, which unlike tracemalloc
+    includes the memory of libxml2. With streaming it should stay flat as the papers grow.
+    Unix only (uses the `resource` module).
+
+    Args:
+        sizes (dict): Size name -> number of sections of the paper (e.g. {"5MB": 1000}).
+        modes (tuple): Names of MEMORY_BENCHMARK_MODES to run.
+        seed (int): Seed of the synthetic papers.
+
+    Returns:
+        dict: Size name -> {"raw_bytes": ..., mode: {"seconds", "peak_memory_mb", "cleaned_bytes"}}.
+    """
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    with LocalPaperServer() as server, tempfile.TemporaryDirectory() as output_dir:
+        for size_name, sections in sizes.items():
+            raw_html, _ = generate_paper(sections=sections, seed=seed)
+            url = server.add_paper(f"2501.{sections:05d}v1", raw_html)
+            results[size_name] = {"raw_bytes": len(raw_html.encode("utf-8"))}
+            del raw_html
+            print(f"[*] Memory benchmark '{size_name}': {results[size_name]['raw_bytes'] / 1e6:.2f} MB")
+            for mode in modes:
+                parser_backend, streaming = MEMORY_BENCHMARK_MODES[mode]
+                with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(
+                        _download_in_fresh_process, url, os.path.join(output_dir, mode), parser_backend, streaming
+                    ).result()
+                results[size_name][mode] = result
+                print(f"[+]   {mode}: peak {result['peak_memory_mb']} MB, {result['seconds']} s")
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float = 1.25, min_seconds: float = 0.005) -> list:
+    """
+    Compare benchmark results with a baseline run.
+
+    Args:
+        results (dict): Results of BenchmarkSuite.run.
+        baseline (dict): Results of an earlier run.
+        threshold (float): A stage regresses when its time or peak memory is more than
+            `threshold` times the baseline.
+        min_seconds (float): Stages faster than this in both runs are too noisy to flag a time regression.
+
+    Returns:
+        list: One dict per size and stage present in both runs, with the time and memory
+            ratios to the baseline and whether it regressed.
+    """
+    comparison = []
+    for size_name, stages in results.items():
+        for stage, measure in stages.items():
+            reference = baseline.get(size_name, {}).get(stage)
+            if stage == "paper" or not reference:
+                continue
+            time_ratio = measure["seconds"] / reference["seconds"] if reference["seconds"] else None
+            memory_ratio = measure["peak_memory_mb"] / reference["peak_memory_mb"] if reference["peak_memory_mb"] else None
+            comparison.append({
+                "size": size_name,
+                "stage": stage,
+                "time_ratio": round(time_ratio, 3) if time_ratio is not None else None,
+                "memory_ratio": round(memory_ratio, 3) if memory_ratio is not None else None,
+                "regressed": (
+                    ((time_ratio or 0) > threshold and max(measure["seconds"], reference["seconds"]) >= min_seconds)
+                    or (memory_ratio or 0) > threshold
+                ),
+            })
+    return comparison
+
+
+def load_baseline(path: str):
+    """
+    Load a baseline file, or return None if it does not exist.
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
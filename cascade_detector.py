@@ -0,0 +1,191 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flaw_detector import ChunkedFlawDetector
+from metrics import USAGE_FIELDS
+
+TIERS = ("screening", "escalation")
+
+
+class CascadeFlawDetector(ChunkedFlawDetector):
+
+    def __init__(
+        self,
+        gemini,
+        escalation_gemini,
+        serialization="html",
+        max_tokens=30000,
+        max_workers=8,
+        structured=True,
+        paragraph_ids=False,
+        min_confidence=3,
+        escalation_severities=("high",),
+        max_rerequests=1,
+        bypass_cache=False,
+        deadline=None
+    ):
+        """
+        Two-tier flaw detection: a cheap model screens every section, a stronger one re-examines
+        only the sections worth it.
+
+        The paper is split into chunks like ChunkedFlawDetector and every chunk is sent to
+        `gemini`. A chunk whose candidate flaws include one with a confidence below
+        `min_confidence` or a severity in `escalation_severities` is sent again, with the same
+        prompt, to `escalation_gemini`, whose flaws replace the candidates of that chunk (the
+        candidates are kept if the escalated request fails). A chunk whose screening failed is
+        escalated too, and counted in `failed_chunks` if that fails as well. Each chunk is
+        escalated as soon as it is screened. Requests, failures, escalations, flaws, tokens and
+        time of each tier are in `self.stats` after a run.
+
+        Args:
+            gemini (GeminiClient or AsyncGeminiClient): Client of the cheap screening model.
+            escalation_gemini (GeminiClient or AsyncGeminiClient): Client of the stronger model,
+                of the same kind as `gemini`.
+            serialization (str): 'html' or 'compact', see paper_serializer.serialize_paper.
+            max_tokens (int): Estimated token budget of one request.
+            max_workers (int): Maximum number of concurrent chunks.
+            structured (bool): Ask for schema-constrained JSON output.
+            paragraph_ids (bool): See ChunkedFlawDetector.
+            min_confidence (int): Escalate a chunk with a candidate flaw of a lower confidence (1-5).
+            escalation_severities (tuple): Escalate a chunk with a candidate flaw of one of these severities.
+            max_rerequests (int): See ChunkedFlawDetector.
+            bypass_cache (bool): See ChunkedFlawDetector.
+            deadline (float): See ChunkedFlawDetector, also applies to the escalated requests.
+        """
+        super().__init__(
+            gemini, serialization=serialization, max_tokens=max_tokens, max_workers=max_workers,
+            structured=structured, paragraph_ids=paragraph_ids, max_rerequests=max_rerequests,
+            bypass_cache=bypass_cache, deadline=deadline
+        )
+        self.escalation_gemini = escalation_gemini
+        self.min_confidence = min_confidence
+        self.escalation_severities = tuple(severity.lower() for severity in escalation_severities)
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+
+    def should_escalate(self, flaws: list) -> bool:
+        """
+        Whether the candidate flaws of a chunk need the stronger model.
+        """
+        for flaw in flaws:
+            try:
+                confidence = int(flaw.get("flaw_confidence", 0))
+            except (TypeError, ValueError):
+                confidence = 0
+            if confidence < self.min_confidence:
+                return True
+            if str(flaw.get("flaw_severity", "")).lower() in self.escalation_severities:
+                return True
+        return False
+
+    def detect(self, html_content: str) -> list:
+        """
+        Detect the flaws of a paper, screening every chunk and escalating the suspicious ones.
+
+        Args:
+            html_content (str): The cleaned HTML of the paper.
+
+        Returns:
+            list: The merged flaws of all chunks.
+        """
+        if asyncio.iscoroutinefunction(self.gemini.generate_text):
+            return asyncio.run(self.detect_async(html_content))
+
+        usage = self._start_stats()
+        chunks, prompts = self._prepare(html_content)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            flaw_lists = list(executor.map(self._cascade_chunk, chunks, prompts))
+        return self._finish(flaw_lists, usage, html_content)
+
+    async def detect_async(self, html_content: str) -> list:
+        """
+        Same as `detect` on the running event loop, within the limits of both clients.
+        """
+        usage = self._start_stats()
+        chunks, prompts = await asyncio.to_thread(self._prepare, html_content)
+        flaw_lists = await asyncio.gather(*(
+            self._cascade_chunk_async(chunk, prompt) for chunk, prompt in zip(chunks, prompts)
+        ))
+        return await asyncio.to_thread(self._finish, flaw_lists, usage, html_content)
+
+    def _cascade_chunk(self, chunk, prompt):
+        start = time.perf_counter()
+        flaws = self._detect_chunk(chunk, prompt)
+        self._add_tier_time("screening", start, flaws)
+        if flaws is not None and not self.should_escalate(flaws):
+            return flaws
+
+        start = time.perf_counter()
+        prefix, request = prompt
+        try:
+            escalated = self.escalation_gemini.generate_flaws(request, prefix=prefix, **self.generation_options())
+        except Exception as e:
+            escalated = e
+        return self._escalated_flaws(chunk, flaws, escalated, start)
+
+    async def _cascade_chunk_async(self, chunk, prompt):
+        start = time.perf_counter()
+        flaws = await self._detect_chunk_async(chunk, prompt)
+        self._add_tier_time("screening", start, flaws)
+        if flaws is not None and not self.should_escalate(flaws):
+            return flaws
+
+        start = time.perf_counter()
+        prefix, request = prompt
+        try:
+            escalated = await self.escalation_gemini.generate_flaws(request, prefix=prefix, **self.generation_options())
+        except Exception as e:
+            escalated = e
+        return self._escalated_flaws(chunk, flaws, escalated, start)
+
+    def _escalated_flaws(self, chunk, candidates, escalated, start):
+        # A failed escalation keeps the candidates of the screening model. Without candidates
+        # (the screening failed too) the chunk fails: None, see ChunkedFlawDetector._merge
+        if isinstance(escalated, Exception) or not isinstance(escalated, list):
+            kept = f"keeping {len(candidates)} candidates" if candidates is not None else "its flaws are missing"
+            print(f"[-] Escalation of chunk '{chunk['title']}' failed ({escalated}), {kept}")
+            self._add_tier_time("escalation", start, None)
+            return candidates
+        screened = f"{len(candidates)} candidates" if candidates is not None else "screening failed"
+        print(f"[+] Chunk '{chunk['title']}' escalated: {screened} -> {len(escalated)} flaws")
+        self._add_tier_time("escalation", start, escalated)
+        return escalated
+
+    def _add_tier_time(self, tier, start, flaws):
+        # flaws is None when the request failed
+        seconds = time.perf_counter() - start
+        with self._stats_lock:
+            stats = self.stats[tier]
+            if flaws is None:
+                stats["failures"] += 1
+            else:
+                stats["requests"] += 1
+                stats["flaws"] += len(flaws)
+            stats["seconds"] = round(stats["seconds"] + seconds, 6)
+
+    def _start_stats(self):
+        self.stats = {
+            tier: {"model": client.model, "requests": 0, "flaws": 0, "failures": 0, "seconds": 0.0}
+            for tier, client in zip(TIERS, (self.gemini, self.escalation_gemini))
+        }
+        # Token counts are the difference of the usage totals of each client: a client shared with
+        # other papers detected at the same time counts their tokens too (metrics has per-paper counts)
+        return {tier: dict(client.usage_totals) for tier, client in zip(TIERS, (self.gemini, self.escalation_gemini))}
+
+    def _finish(self, flaw_lists, usage, html_content):
+        for tier, client in zip(TIERS, (self.gemini, self.escalation_gemini)):
+            for field in USAGE_FIELDS:
+                self.stats[tier][field] = client.usage_totals[field] - usage[tier][field]
+        screened = self.stats["screening"]["requests"] + self.stats["screening"]["failures"]
+        escalated = self.stats["escalation"]["requests"] + self.stats["escalation"]["failures"]
+        self.stats["escalation_rate"] = round(escalated / screened, 3) if screened else 0.0
+        print(
+            f"[*] Cascade: {escalated}/{screened} chunks escalated to {self.escalation_gemini.model} "
+            f"({self.stats['screening']['failures']} failed screenings), "
+            f"tokens {self.stats['screening']['total_token_count']} (screening) + "
+            f"{self.stats['escalation']['total_token_count']} (escalation)"
+        )
+        flaws = self._merge(flaw_lists, html_content)
+        self.stats["failed_chunks"] = self.failed_chunks
+        return flaws
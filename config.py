@@ -12,6 +12,132 @@ ANNOTATED_HTML_FILE = "annotated.html"
 # JSON
 JSON_DIRECTORY = HTML_DIRECTORY
 JSON_FILE_NAME = "flaws.json"
+# Corpus-level flaw store (flaw_store.py): every detection run is also saved there, indexed by category, severity
+# and confidence, and run_html_annotator.py reads the flaws from it. The JSON files are still written. None to disable
+FLAW_STORE_PATH = None  # e.g. "./Result/flaws.sqlite"
+FLAW_STORE_SUMMARY_FILE_NAME = "flaw_store_summary.json"  # flaw counts of run_flaw_store.py
 
 # Gemini Model name
 GEMINI_MODEL = "gemini-2.5-flash-lite"
+
+# Batch download
+HTML_URL_LIST_FILE = "./papers.txt"  # one arXiv URL or ID per line
+DOWNLOAD_REPORT_FILE_NAME = "download_report.json"
+DOWNLOAD_MAX_WORKERS = 8
+DOWNLOAD_MAX_PER_HOST = 4
+DOWNLOAD_MAX_RETRIES = 4
+DOWNLOAD_TIMEOUT = 60
+
+# Parser backend used to clean HTML: "html.parser" (BeautifulSoup) or "lxml" (faster, needs lxml)
+HTML_PARSER_BACKEND = "html.parser"
+# Stamp paragraphs, headings, list items and table cells with short stable ids (data-pid="p12") while cleaning,
+# and ask the model for paragraph ids (start_id/end_id) instead of 5-word text anchors
+PARAGRAPH_IDS = False
+# Clean papers while they are downloaded and write them to disk as they go, so memory stays flat for very large
+# papers (needs HTML_PARSER_BACKEND = "lxml", bypasses the download cache)
+HTML_STREAMING = False
+# Raw (not cleaned) arXiv HTML files used by run_parser_parity.py
+PARSER_PARITY_DIRECTORY = "./RawHTML"
+PARSER_PARITY_REPORT_FILE_NAME = "parser_parity.json"
+
+# Download cache for raw and cleaned HTML (set DOWNLOAD_CACHE_DIRECTORY to None to disable)
+DOWNLOAD_CACHE_DIRECTORY = "./Cache"
+DOWNLOAD_CACHE_MAX_SIZE_MB = 2048
+
+# Persistent Gemini response cache (opt-in: set a path such as "./Cache/gemini_responses.sqlite")
+GEMINI_CACHE_PATH = None
+GEMINI_CACHE_TTL_HOURS = 24 * 30
+GEMINI_CACHE_MAX_SIZE_MB = 512
+GEMINI_CACHE_BYPASS = False
+
+# How the paper is put in the prompt: "html" (cleaned HTML as is) or "compact" (Markdown, far fewer tokens)
+PAPER_SERIALIZATION = "html"
+
+# Flaw detection: "single" (one prompt with the whole paper), "chunked" (one concurrent prompt per section),
+# "cascade" (chunked with GEMINI_MODEL, suspicious sections examined again by GEMINI_ESCALATION_MODEL) or "auto"
+# (the preflight sends each paper whole, whole as compact text or chunked, whichever fits first)
+DETECTION_MODE = "single"
+CHUNK_MAX_TOKENS = 30000  # estimated tokens of one chunked request (prompt + summary + section)
+
+# Cascade detection: a section is escalated when one of its candidate flaws has a confidence (1-5) below
+# CASCADE_MIN_CONFIDENCE or one of the CASCADE_ESCALATION_SEVERITIES
+GEMINI_ESCALATION_MODEL = "gemini-2.5-pro"
+CASCADE_MIN_CONFIDENCE = 3
+CASCADE_ESCALATION_SEVERITIES = ("high",)
+CASCADE_REPORT_FILE_NAME = "cascade_report.json"  # requests, flaws, tokens and time of each model
+
+# Preflight (preflight.py): prompt tokens are counted before the requests, so with DETECTION_MODE = "single" a paper
+# over GEMINI_MAX_INPUT_TOKENS (or GEMINI_TOKENS_PER_MINUTE) fails before it is sent. run_preflight.py plans a batch
+PREFLIGHT_ENABLED = True
+PREFLIGHT_COUNT_WITH_API = True  # Gemini count-tokens call, False (or when it fails) for the local estimate only
+PREFLIGHT_TOKEN_CACHE_PATH = "./Cache/token_counts.sqlite"  # counted prompts, None to keep them in memory
+GEMINI_MAX_INPUT_TOKENS = 1048576  # input token limit of GEMINI_MODEL
+PREFLIGHT_OUTPUT_TOKENS_PER_REQUEST = 2000  # expected response size of a request
+PREFLIGHT_SECONDS_PER_REQUEST = 30  # expected latency of a request
+# USD per million (input, output) tokens, check the current Gemini API pricing
+GEMINI_PRICES = {
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),  # prompts up to 200k tokens
+}
+PREFLIGHT_REPORT_FILE_NAME = "preflight_plan.json"
+
+# Diff-aware update of a new version of a paper (run_revision_update.py): the cleaned HTML (HTML_FILE_NAME) and
+# flaws (JSON_FILE_NAME) of the previous version are read from this directory, the new version from HTML_DIRECTORY
+REVISION_PREVIOUS_DIRECTORY = "./Result/previous"
+REVISION_CONTEXT_PARAGRAPHS = 1  # unchanged paragraphs sent before and after each changed one
+REVISION_REPORT_FILE_NAME = "revision_report.json"
+
+# Gemini requests: concurrency, rate limits (None disables a limit), retries and timeouts in seconds
+GEMINI_MAX_CONCURRENCY = 8
+GEMINI_REQUESTS_PER_MINUTE = None  # e.g. 15 on the free tier
+GEMINI_TOKENS_PER_MINUTE = None  # e.g. 250000 on the free tier
+GEMINI_MAX_RETRIES = 5
+GEMINI_TIMEOUT = 300  # one attempt
+GEMINI_DEADLINE = None  # whole call, retries included
+GEMINI_STREAM = False  # stream the response and parse each flaw as soon as it is complete
+GEMINI_STRUCTURED_OUTPUT = True  # constrain the response to the flaw JSON schema (set False for models without response schema support)
+GEMINI_MAX_REREQUESTS = 1  # new requests when a response cannot be parsed even after repair
+GEMINI_CONTEXT_CACHE_TTL = None  # e.g. 3600: cache the static prompt prefix on Gemini for this many seconds
+
+# Flaw details of the annotated HTML: "inline" (attributes of every flaw span), "embedded" (one JSON blob in the
+# page, spans only carry a flaw id) or "sidecar" (JSON file next to the page, needs the page to be served over HTTP)
+ANNOTATION_FLAW_DATA = "inline"
+VIEWER_COMPARISON_REPORT_FILE_NAME = "viewer_comparison.json"
+
+# Batch annotation of every <paper_id>/ directory of HTML_DIRECTORY that has HTML_FILE_NAME and JSON_FILE_NAME
+ANNOTATION_MAX_WORKERS = None  # worker processes, None = number of CPU cores
+ANNOTATION_MAX_IN_FLIGHT = None  # papers queued at once, None = 2 per worker
+ANNOTATION_REPORT_FILE_NAME = "annotation_report.json"
+JINJA_BYTECODE_CACHE_DIRECTORY = "./Cache/jinja"  # compiled template cache, None to disable
+
+# Annotation: match anchors not found verbatim in the visible text with small wording differences
+ANCHOR_FUZZY_MATCHING = True
+
+# Pipeline (download -> detect -> annotate) over the papers of HTML_URL_LIST_FILE, see run_pipeline.py
+PIPELINE_MANIFEST_FILE_NAME = "manifest.json"
+PIPELINE_REPORT_FILE_NAME = "pipeline_report.json"
+# Long-running pipeline worker (run_pipeline_worker.py) fed by a local SQLite job queue
+WORKER_QUEUE_PATH = "./Cache/jobs.sqlite"
+WORKER_MAX_IN_FLIGHT = 16  # jobs running at the same time
+WORKER_POLL_INTERVAL = 2.0  # seconds between two checks of an empty queue
+WORKER_MAX_ATTEMPTS = 3  # a job interrupted this many times (worker killed) is marked failed
+
+# Offline benchmark on synthetic papers (run_benchmark.py): size name -> number of sections
+BENCHMARK_SIZES = {"small": 10, "medium": 50, "large": 200}
+BENCHMARK_REPEATS = 5
+BENCHMARK_DIRECTORY = "./Benchmarks"
+BENCHMARK_REPORT_FILE_NAME = "benchmark_report.json"
+BENCHMARK_BASELINE_FILE = "./Benchmarks/benchmark_baseline.json"
+BENCHMARK_REGRESSION_THRESHOLD = 1.25  # a stage regresses when it is 25% slower (or bigger) than the baseline
+BENCHMARK_MIN_SECONDS = 0.005  # faster stages are too noisy to flag a time regression
+BENCHMARK_UPDATE_BASELINE = False  # save this run as the new baseline
+# Peak memory of download + clean, in memory and streamed (run_memory_benchmark.py): size name -> number of sections
+MEMORY_BENCHMARK_SIZES = {"1MB": 200, "5MB": 1000, "20MB": 4000}
+MEMORY_BENCHMARK_REPORT_FILE_NAME = "memory_benchmark_report.json"
+
+# Instrumentation of the download, clean, llm and annotate stages (see metrics.py), off by default
+METRICS_ENABLED = False
+METRICS_JSONL_FILE = "./Metrics/metrics.jsonl"  # one JSON line per event, appended across runs
+METRICS_PROMETHEUS_FILE = "./Metrics/metrics.prom"  # counters of the last run in the Prometheus text format, None to disable
+METRICS_SUMMARY_FILE_NAME = "metrics_summary.json"
@@ -0,0 +1,152 @@
+import time
+import hashlib
+import threading
+from utils import genai_errors
+
+# Refresh a cached context this many seconds before it expires, so requests never use an expired handle
+EXPIRY_MARGIN_SECONDS = 120
+
+
+class PromptPrefixCache:
+
+    def __init__(self, client, model: str, ttl_seconds: int = 3600):
+        """
+        Explicit Gemini context caching of the static prefix of the prompts.
+
+        The instructions and flaw taxonomy in front of `{paper}` are identical for every paper.
+        They are uploaded once as cached content and every request only sends the paper, with
+        the handle of the cached prefix: cached tokens are billed at a reduced rate and are not
+        processed again. Handles are reused across a batch, their TTL is extended when they are
+        about to expire, and a new cached content is created once one has expired.
+
+        Args:
+            client: `genai.Client` (or FakeGeminiClient) used to create the cached contents.
+            model (str): Gemini model of the requests (cached contents are per model).
+            ttl_seconds (int): Time to live of a cached content in seconds.
+        """
+        self.client = client
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # Prefix hash -> (cached content name, expiry timestamp), or None when caching failed
+        self._handles = {}
+        self.stats = {"created": 0, "refreshed": 0, "reused": 0, "unavailable": 0}
+
+    def get_handle(self, prefix: str):
+        """
+        Return the name of the cached content holding `prefix`, creating or refreshing it if needed.
+
+        Returns:
+            str: The cached content name, or None if the prefix cannot be cached (e.g. it is below
+                the minimum size of a cached content for the model), in which case the full prompt
+                must be sent.
+        """
+        from google.genai import types
+        key = hashlib.sha256(f"{self.model}\n{prefix}".encode("utf-8")).hexdigest()
+        with self._lock:
+            if key in self._handles and self._handles[key] is None:
+                return None
+
+            handle = self._handles.get(key)
+            now = time.time()
+            if handle is not None and now < handle[1] - EXPIRY_MARGIN_SECONDS:
+                self.stats["reused"] += 1
+                return handle[0]
+
+            if handle is not None and now < handle[1]:
+                try:
+                    cached_content = self.client.caches.update(
+                        name=handle[0],
+                        config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s")
+                    )
+                    self.stats["refreshed"] += 1
+                    self._handles[key] = (cached_content.name, self._expire_timestamp(cached_content))
+                    return cached_content.name
+                except genai_errors().APIError as e:
+                    print(f"[-] Could not refresh the cached prompt prefix, creating a new one: {e}")
+
+            try:
+                cached_content = self.client.caches.create(
+                    model=self.model,
+                    config=types.CreateCachedContentConfig(
+                        contents=[types.Content(role="user", parts=[types.Part(text=prefix)])],
+                        ttl=f"{self.ttl_seconds}s",
+                        display_name=f"prompt-prefix-{key[:12]}"
+                    )
+                )
+            except genai_errors().APIError as e:
+                print(f"[-] Context caching unavailable for this prompt, sending it in full: {e}")
+                self.stats["unavailable"] += 1
+                self._handles[key] = None
+                return None
+
+            print(f"[+] Cached the prompt prefix as {cached_content.name}")
+            self.stats["created"] += 1
+            self._handles[key] = (cached_content.name, self._expire_timestamp(cached_content))
+            return cached_content.name
+
+    def invalidate(self, name: str) -> None:
+        """
+        Forget a handle rejected by the API (e.g. deleted or expired early), the next call creates a new one.
+        """
+        with self._lock:
+            for key, handle in list(self._handles.items()):
+                if handle is not None and handle[0] == name:
+                    del self._handles[key]
+
+    def delete_all(self) -> None:
+        """
+        Delete the cached contents created by this cache (e.g. at the end of a batch).
+        """
+        with self._lock:
+            handles = [handle for handle in self._handles.values() if handle is not None]
+            self._handles = {}
+        for name, _ in handles:
+            try:
+                self.client.caches.delete(name=name)
+            except genai_errors().APIError as e:
+                print(f"[-] Could not delete the cached content {name}: {e}")
+
+    def _expire_timestamp(self, cached_content):
+        if cached_content.expire_time is not None:
+            return cached_content.expire_time.timestamp()
+        return time.time() + self.ttl_seconds
+
+
+def is_cached_content_error(error) -> bool:
+    """
+    Whether an API error rejects the cached content of a request (deleted or expired), rather than the request itself.
+
+    Only a NOT_FOUND error or an error whose message names the cached content qualifies: other
+    400 or 403 errors (invalid argument, API key, quota) would fail again without the cache.
+
+    Args:
+        error (google.genai.errors.APIError): The error of a request sent with a cached content.
+    """
+    if error.code == 404 or error.status == "NOT_FOUND":
+        return True
+    message = (error.message or "").lower()
+    return "cachedcontent" in message or "cached content" in message
+
+
+def build_request(prompt: str, config: dict = None, prefix: str = None, handle: str = None) -> dict:
+    """
+    Contents and config of a generate_content request for a prompt preceded by a static prefix.
+
+    With the handle of the cached prefix only the prompt is sent, otherwise prefix and prompt
+    are sent together.
+
+    Returns:
+        dict: The `contents` and `config` arguments of generate_content.
+    """
+    # google.genai is slow to import, it is only loaded once a request is made
+    from google.genai import types
+    if handle is not None:
+        return {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "config": types.GenerateContentConfig(**(config or {}), cached_content=handle),
+        }
+    return {
+        "contents": [{"parts": [{"text": (prefix or "") + prompt}]}],
+        "config": types.GenerateContentConfig(**config) if config else None,
+    }
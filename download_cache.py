@@ -0,0 +1,255 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Versioned arXiv URLs (e.g. https://arxiv.org/html/2507.22291v2) never change once published
+IMMUTABLE_URL_PATTERN = re.compile(
+    r"^https?://arxiv\.org/(?:html|abs)/(?:\d{4}\.\d{4,5}|[a-z\-]+(?:\.[A-Z]{2})?/\d{7})v\d+/?$"
+)
+
+
+class DownloadCache:
+
+    def __init__(self, cache_dir: str, max_size_mb: float = 2048):
+        """
+        On-disk cache for raw arXiv HTML responses and cleaned HTML.
+
+        Raw responses are stored once per content hash (sha256) and indexed by URL together
+        with their ETag/Last-Modified headers. Cleaned HTML is stored per (raw content hash,
+        cleaner key) so that changing the cleaning rules only re-runs the cleaning. When the
+        cache grows beyond `max_size_mb`, least recently used entries are evicted.
+
+        Args:
+            cache_dir (str): Directory of the cache.
+            max_size_mb (float): Maximum size of the cached files in megabytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(self.cache_dir, "raw"), exist_ok=True)
+        os.makedirs(os.path.join(self.cache_dir, "cleaned"), exist_ok=True)
+
+        self._db = sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite"), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                encoding TEXT,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_hash ON responses (content_hash);
+            CREATE INDEX IF NOT EXISTS responses_access ON responses (last_access);
+            CREATE TABLE IF NOT EXISTS blobs (
+                content_hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS cleaned (
+                content_hash TEXT NOT NULL,
+                cleaner_key TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (content_hash, cleaner_key)
+            );
+            CREATE INDEX IF NOT EXISTS cleaned_access ON cleaned (last_access);
+        """)
+        self._db.commit()
+
+    def is_immutable(self, url: str) -> bool:
+        """
+        Whether the content of a URL can never change (versioned arXiv URL).
+        """
+        return bool(IMMUTABLE_URL_PATTERN.match(url))
+
+    def fetch(self, url: str, get):
+        """
+        Return the raw HTML of a URL, using the cache whenever possible.
+
+        Immutable URLs in the cache are served without network. Other cached URLs are
+        revalidated with If-None-Match/If-Modified-Since and served from the cache on a 304.
+
+        Args:
+            url (str): The URL to fetch.
+            get (callable): Function taking a dict of extra request headers and returning a
+                requests.Response (lets callers add their own retry logic).
+
+        Returns:
+            tuple: (raw HTML, content hash, cache status 'hit' | 'revalidated' | 'miss')
+        """
+        entry = self._get_response_entry(url)
+        if entry is not None and self.is_immutable(url):
+            raw_html = self._read_raw(entry)
+            if raw_html is not None:
+                return raw_html, entry["content_hash"], "hit"
+
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = get(headers)
+        if response.status_code == 304 and entry is not None:
+            raw_html = self._read_raw(entry)
+            if raw_html is not None:
+                self._update_validators(url, response.headers)
+                return raw_html, entry["content_hash"], "revalidated"
+            # The cached file is gone, fetch the full page again
+            response = get({})
+
+        response.raise_for_status()
+        content_hash = self._store_raw(url, response)
+        return response.text, content_hash, "miss"
+
+    def get_cleaned(self, content_hash: str, cleaner_key: str):
+        """
+        Return the cached cleaned HTML for a raw content hash and cleaner key, or None.
+        """
+        filepath = self._cleaned_path(content_hash, cleaner_key)
+        with self._lock:
+            found = self._db.execute(
+                "UPDATE cleaned SET last_access = ? WHERE content_hash = ? AND cleaner_key = ?",
+                (time.time(), content_hash, cleaner_key)
+            ).rowcount
+            self._db.commit()
+        if not found or not os.path.isfile(filepath):
+            return None
+        with open(filepath, "r", encoding="utf-8") as file:
+            return file.read()
+
+    def store_cleaned(self, content_hash: str, cleaner_key: str, html_content: str) -> None:
+        """
+        Cache the cleaned HTML for a raw content hash and cleaner key.
+        """
+        data = html_content.encode("utf-8")
+        self._write_file(self._cleaned_path(content_hash, cleaner_key), data)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cleaned (content_hash, cleaner_key, size, last_access) VALUES (?, ?, ?, ?)",
+                (content_hash, cleaner_key, len(data), time.time())
+            )
+            self._evict()
+            self._db.commit()
+
+    def size(self) -> int:
+        """
+        Total size of the cached files in bytes.
+        """
+        with self._lock:
+            return self._size()
+
+    def _get_response_entry(self, url):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_hash, etag, last_modified, encoding FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET last_access = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+        return dict(zip(("content_hash", "etag", "last_modified", "encoding"), row))
+
+    def _read_raw(self, entry):
+        filepath = self._raw_path(entry["content_hash"])
+        if not os.path.isfile(filepath):
+            return None
+        with open(filepath, "rb") as file:
+            # Same decoding as requests' response.text
+            return str(file.read(), entry["encoding"] or "utf-8", errors="replace")
+
+    def _store_raw(self, url, response):
+        content = response.content
+        content_hash = hashlib.sha256(content).hexdigest()
+        filepath = self._raw_path(content_hash)
+        if not os.path.isfile(filepath):
+            self._write_file(filepath, content)
+        with self._lock:
+            previous = self._db.execute("SELECT content_hash FROM responses WHERE url = ?", (url,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs (content_hash, size) VALUES (?, ?)", (content_hash, len(content))
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (url, content_hash, etag, last_modified, encoding, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    content_hash,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    response.encoding or response.apparent_encoding,
+                    time.time(),
+                )
+            )
+            if previous is not None and previous[0] != content_hash:
+                self._remove_blob_if_unused(previous[0])
+            self._evict()
+            self._db.commit()
+        return content_hash
+
+    def _update_validators(self, url, headers):
+        # A 304 may carry new validators, keep the old ones otherwise
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (headers.get("ETag"), headers.get("Last-Modified"), url)
+            )
+            self._db.commit()
+
+    def _size(self):
+        blob_size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        cleaned_size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cleaned").fetchone()[0]
+        return blob_size + cleaned_size
+
+    def _evict(self):
+        # Called with the lock held: drop least recently used responses/cleaned files until under the cap
+        while self._size() > self.max_size_bytes:
+            oldest_response = self._db.execute(
+                "SELECT url, content_hash, last_access FROM responses ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            oldest_cleaned = self._db.execute(
+                "SELECT content_hash, cleaner_key, last_access FROM cleaned ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            if oldest_response is None and oldest_cleaned is None:
+                break
+
+            if oldest_cleaned is None or (oldest_response is not None and oldest_response[2] <= oldest_cleaned[2]):
+                url, content_hash, _ = oldest_response
+                self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self._remove_blob_if_unused(content_hash)
+            else:
+                content_hash, cleaner_key, _ = oldest_cleaned
+                self._db.execute(
+                    "DELETE FROM cleaned WHERE content_hash = ? AND cleaner_key = ?", (content_hash, cleaner_key)
+                )
+                self._remove_file(self._cleaned_path(content_hash, cleaner_key))
+
+    def _remove_blob_if_unused(self, content_hash):
+        # Raw files are shared by URLs with identical content, remove them once no URL uses them
+        used = self._db.execute("SELECT 1 FROM responses WHERE content_hash = ? LIMIT 1", (content_hash,)).fetchone()
+        if used is None:
+            self._db.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+            self._remove_file(self._raw_path(content_hash))
+
+    def _raw_path(self, content_hash):
+        return os.path.join(self.cache_dir, "raw", content_hash[:2], f"{content_hash}.html")
+
+    def _cleaned_path(self, content_hash, cleaner_key):
+        return os.path.join(self.cache_dir, "cleaned", content_hash[:2], f"{content_hash}_{cleaner_key}.html")
+
+    def _write_file(self, filepath, data):
+        # Write to a temporary file first so readers never see a partial file
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        temporary_path = f"{filepath}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(data)
+        os.replace(temporary_path, filepath)
+
+    def _remove_file(self, filepath):
+        if os.path.isfile(filepath):
+            os.remove(filepath)
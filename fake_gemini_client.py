@@ -0,0 +1,258 @@
+import time
+import random
+import asyncio
+import threading
+from datetime import datetime, timezone
+from google.genai import types, errors
+from utils import estimate_tokens
+
+
+class FakeGeminiClient:
+
+    def __init__(
+        self,
+        response_text="[]",
+        latency: float = 0.5,
+        latency_jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_code: int = 429,
+        fail_first: int = 0,
+        stream_chunk_size: int = 64,
+        truncate_at: int = None,
+        latency_per_1k_tokens: float = 0.0,
+        min_cache_tokens: int = 0,
+        seed: int = None
+    ):
+        """
+        Offline stand-in for `genai.Client` to test the Gemini clients without network or quota.
+
+        It exposes `generate_content` and `generate_content_stream` under `models` and
+        `aio.models` (and `count_tokens` under `models`), waits for a simulated latency and
+        returns real `GenerateContentResponse` objects with usage metadata. `caches` simulates context caching: cached contents expire
+        after their TTL and cached tokens add no latency and are counted apart.
+        Quota/server errors are raised like the API does (`errors.ClientError`/`errors.ServerError`).
+
+        Args:
+            response_text (str or callable): Response text, or a function of the prompt text returning it.
+            latency (float): Simulated latency of a request in seconds.
+            latency_jitter (float): Random extra latency in seconds (uniform in [0, latency_jitter]).
+            error_rate (float): Probability that a request fails with `error_code`.
+            error_code (int): HTTP status code of the simulated errors (e.g. 429 or 503).
+            fail_first (int): Number of first requests that always fail with `error_code`.
+            stream_chunk_size (int): Number of characters per streamed chunk (the latency is spread over the chunks).
+            truncate_at (int): Cut the response text after this many characters (simulates a cut-off response).
+            latency_per_1k_tokens (float): Extra latency per 1000 input tokens not served from a cached content.
+            min_cache_tokens (int): Minimum number of tokens of a cached content, smaller ones are rejected.
+            seed (int): Seed of the random generator, for reproducible runs.
+        """
+        self.response_text = response_text
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.fail_first = fail_first
+        self.stream_chunk_size = stream_chunk_size
+        self.truncate_at = truncate_at
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.min_cache_tokens = min_cache_tokens
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # Number of calls, errors and the highest number of calls running at the same time
+        self.calls = 0
+        self.errors = 0
+        self.active = 0
+        self.max_active = 0
+        # Input tokens received, and the part of them read from cached contents
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+        self.count_tokens_calls = 0
+        self.models = _FakeModels(self)
+        self.caches = _FakeCaches(self)
+        self.aio = _FakeAio(self)
+
+    def _begin(self, contents, config=None):
+        prompt = _prompt_text(contents)
+        cached_text = self.caches._read(getattr(config, "cached_content", None))
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.input_tokens += estimate_tokens(cached_text + prompt)
+            self.cached_input_tokens += estimate_tokens(cached_text) if cached_text else 0
+            fail = self.calls <= self.fail_first or self._random.random() < self.error_rate
+            latency = self.latency + self._random.uniform(0, self.latency_jitter)
+            latency += self.latency_per_1k_tokens * estimate_tokens(prompt) / 1000
+        return (cached_text, prompt), fail, latency
+
+    def _end(self, prompt, fail):
+        with self._lock:
+            self.active -= 1
+            if fail:
+                self.errors += 1
+        if fail:
+            raise self._make_error()
+        text = self._response_text(prompt)
+        return _make_response(text, self._make_usage(prompt, text))
+
+    def _stream_responses(self, prompt):
+        # Text chunks, the usage metadata of the whole response comes with the last one
+        text = self._response_text(prompt)
+        size = max(self.stream_chunk_size, 1)
+        chunks = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        usage = self._make_usage(prompt, text)
+        return [
+            _make_response(chunk, usage if i == len(chunks) - 1 else None)
+            for i, chunk in enumerate(chunks)
+        ]
+
+    def _response_text(self, prompt):
+        # The model sees the cached content followed by the prompt
+        text = self.response_text("".join(prompt)) if callable(self.response_text) else self.response_text
+        return text[:self.truncate_at] if self.truncate_at is not None else text
+
+    def _make_usage(self, prompt, text):
+        cached_text, prompt_text = prompt
+        prompt_tokens = estimate_tokens(cached_text + prompt_text)
+        output_tokens = estimate_tokens(text)
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            cached_content_token_count=estimate_tokens(cached_text) if cached_text else None,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens
+        )
+
+    def _make_error(self, code=None, message="Simulated error"):
+        code = code or self.error_code
+        status = {429: "RESOURCE_EXHAUSTED", 400: "INVALID_ARGUMENT", 404: "NOT_FOUND"}.get(code, "UNAVAILABLE")
+        response_json = {"error": {"code": code, "message": message, "status": status}}
+        if code < 500:
+            return errors.ClientError(code, response_json)
+        return errors.ServerError(code, response_json)
+
+
+class _FakeModels:
+
+    def __init__(self, fake):
+        self._fake = fake
+
+    def generate_content(self, model, contents, config=None):
+        prompt, fail, latency = self._fake._begin(contents, config)
+        time.sleep(latency)
+        return self._fake._end(prompt, fail)
+
+    def generate_content_stream(self, model, contents, config=None):
+        prompt, fail, latency = self._fake._begin(contents, config)
+        self._fake._end(prompt, fail)
+        responses = self._fake._stream_responses(prompt)
+        for response in responses:
+            time.sleep(latency / len(responses))
+            yield response
+
+    def count_tokens(self, model, contents, config=None):
+        text = contents if isinstance(contents, str) else _prompt_text(contents)
+        with self._fake._lock:
+            self._fake.count_tokens_calls += 1
+        return types.CountTokensResponse(total_tokens=estimate_tokens(text))
+
+
+class _FakeAsyncModels:
+
+    def __init__(self, fake):
+        self._fake = fake
+
+    async def generate_content(self, model, contents, config=None):
+        prompt, fail, latency = self._fake._begin(contents, config)
+        try:
+            await asyncio.sleep(latency)
+        except asyncio.CancelledError:
+            # Timed out by the caller: the request is no longer active
+            with self._fake._lock:
+                self._fake.active -= 1
+            raise
+        return self._fake._end(prompt, fail)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        prompt, fail, latency = self._fake._begin(contents, config)
+        self._fake._end(prompt, fail)
+        return self._stream(self._fake._stream_responses(prompt), latency)
+
+    async def _stream(self, responses, latency):
+        for response in responses:
+            await asyncio.sleep(latency / len(responses))
+            yield response
+
+
+class _FakeCaches:
+
+    def __init__(self, fake):
+        self._fake = fake
+        # Cached content name -> (text, expiry timestamp)
+        self._contents = {}
+
+    def create(self, model, config=None):
+        text = _prompt_text([content.model_dump() for content in config.contents])
+        if estimate_tokens(text) < self._fake.min_cache_tokens:
+            raise self._fake._make_error(400, "Cached content is too small")
+        with self._fake._lock:
+            name = f"cachedContents/fake-{len(self._contents) + 1}"
+            self._contents[name] = (text, time.time() + _ttl_seconds(config.ttl))
+        return self._cached_content(name)
+
+    def update(self, name, config=None):
+        with self._fake._lock:
+            if name not in self._contents or self._contents[name][1] < time.time():
+                raise self._fake._make_error(404, f"{name} not found")
+            self._contents[name] = (self._contents[name][0], time.time() + _ttl_seconds(config.ttl))
+        return self._cached_content(name)
+
+    def get(self, name, config=None):
+        self._read(name)
+        return self._cached_content(name)
+
+    def delete(self, name, config=None):
+        with self._fake._lock:
+            self._contents.pop(name, None)
+
+    def _read(self, name):
+        # Text of a cached content used by a request, "" when the request does not use one
+        if name is None:
+            return ""
+        with self._fake._lock:
+            content = self._contents.get(name)
+        if content is None or content[1] < time.time():
+            raise self._fake._make_error(404, f"{name} not found or expired")
+        return content[0]
+
+    def _cached_content(self, name):
+        return types.CachedContent(
+            name=name,
+            model="fake",
+            expire_time=datetime.fromtimestamp(self._contents[name][1], tz=timezone.utc)
+        )
+
+
+class _FakeAio:
+
+    def __init__(self, fake):
+        self.models = _FakeAsyncModels(fake)
+
+
+def _make_response(text, usage_metadata=None):
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))],
+        usage_metadata=usage_metadata
+    )
+
+
+def _prompt_text(contents):
+    # contents=[{"parts": [{"text": prompt}]}] as sent by the Gemini clients
+    return "".join(
+        part.get("text") or ""
+        for content in contents
+        for part in content.get("parts") or []
+    )
+
+
+def _ttl_seconds(ttl):
+    # TTLs are durations such as "3600s"
+    return float(str(ttl or "3600s").rstrip("s"))
@@ -0,0 +1,393 @@
+import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from bs4 import BeautifulSoup, Tag
+from anchor_index import AnchorIndex
+from annotation_engine import find_paragraph_span, index_paragraph_ids
+from paper_serializer import html_to_compact_text
+from prompt import get_prompt
+from utils import (
+    estimate_tokens,
+    split_prompt
+)
+
+HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+# Sections without flaws worth reporting (LaTeXML id of the bibliography)
+SKIPPED_SECTION_IDS = ("bib",)
+SEVERITY_RANK = {"low": 1, "medium": 2, "high": 3}
+PARAGRAPH_NUMBER_PATTERN = re.compile(r"p(\d+)")
+SUMMARY_MAX_TOKENS = 400
+
+
+def normalize_anchor(text) -> str:
+    """
+    Lower-case an anchor text and collapse its whitespace for comparisons.
+    """
+    return " ".join(str(text or "").lower().split())
+
+
+def merge_flaws(flaw_lists: list, html_content: str = None) -> list:
+    """
+    Merge the flaw arrays of several chunks and drop duplicates.
+
+    Two flaws of the same category are duplicates when they have the same start and end anchors
+    (or paragraph ids), e.g. a paragraph sent in two overlapping chunks, or when their spans
+    overlap. Paragraph id spans are compared by paragraph number. With `html_content`, text
+    anchors and paragraph ids are located in the paper (see AnchorIndex, also for anchors quoted
+    from the compact serialization), so flaws quoting different parts of one span are merged
+    too; anchors not found there only match identical anchors. Flaws of different categories
+    are always kept. Of duplicates, the flaw with the highest confidence (then severity) is
+    kept, at the position of the first occurrence.
+
+    Args:
+        flaw_lists (list): One list of flaw dicts per chunk, in document order.
+        html_content (str): The cleaned HTML of the paper, None to compare the anchors only.
+
+    Returns:
+        list: The merged flaws.
+    """
+    locate = _flaw_locator(html_content) if html_content else None
+    merged = []
+    # (category, kind, start, end) of the span covered by each merged flaw and its duplicates
+    spans = []
+    index = {}
+    for flaws in flaw_lists:
+        for flaw in flaws:
+            if not isinstance(flaw, dict):
+                continue
+            category = normalize_anchor(flaw.get("flaw_category"))
+            if flaw.get("start_id"):
+                start, end = f"#{flaw['start_id']}", f"#{flaw.get('end_id') or flaw['start_id']}"
+            else:
+                start = normalize_anchor(flaw.get("start_of_flaw"))
+                end = normalize_anchor(flaw.get("end_of_flaw"))
+            span = locate(flaw) if locate is not None else _paragraph_number_span(flaw)
+
+            position = index.get((category, start, end))
+            if position is None and span is not None:
+                position = next((
+                    i for i, other in enumerate(spans)
+                    if other is not None and other[:2] == (category, span[0])
+                    and span[1] < other[3] and other[2] < span[2]
+                ), None)
+            if position is None:
+                position = len(merged)
+                merged.append(flaw)
+                spans.append((category, *span) if span is not None else None)
+            else:
+                if span is not None and spans[position] is not None:
+                    # The merged span grows, so a chain of overlapping flaws merges into one
+                    _, kind, low, high = spans[position]
+                    spans[position] = (category, kind, min(low, span[1]), max(high, span[2]))
+                if _flaw_rank(flaw) > _flaw_rank(merged[position]):
+                    merged[position] = flaw
+            index[(category, start, end)] = position
+    return merged
+
+
+def _paragraph_number_span(flaw):
+    # ('id', first, last + 1) of a flaw cited by paragraph ids like 'p12', None otherwise
+    start = PARAGRAPH_NUMBER_PATTERN.fullmatch(str(flaw.get("start_id") or ""))
+    if start is None:
+        return None
+    end = PARAGRAPH_NUMBER_PATTERN.fullmatch(str(flaw.get("end_id") or "")) or start
+    first, last = sorted((int(start.group(1)), int(end.group(1))))
+    return "id", first, last + 1
+
+
+def _flaw_locator(html_content):
+    # Flaw -> ('html', start offset, end offset) in the paper, or None if it is not found
+    paragraph_spans = None
+    indexes = {}
+
+    def locate(flaw):
+        nonlocal paragraph_spans
+        span = None
+        if flaw.get("start_id"):
+            if paragraph_spans is None:
+                paragraph_spans = index_paragraph_ids(html_content)
+            span = find_paragraph_span(paragraph_spans, flaw["start_id"], flaw.get("end_id"))
+        elif flaw.get("start_of_flaw") and flaw.get("end_of_flaw"):
+            for compact in (False, True):
+                # Built on first use: the compact index only for anchors the plain one misses
+                if compact not in indexes:
+                    indexes[compact] = AnchorIndex(html_content, fuzzy=False, compact=compact)
+                span = indexes[compact].find(flaw["start_of_flaw"], flaw["end_of_flaw"])
+                if span is not None:
+                    break
+        return ("html", *span) if span is not None else None
+
+    return locate
+
+
+def _flaw_rank(flaw):
+    try:
+        confidence = int(flaw.get("flaw_confidence", 0))
+    except (TypeError, ValueError):
+        confidence = 0
+    return confidence, SEVERITY_RANK.get(str(flaw.get("flaw_severity", "")).lower(), 0)
+
+
+class ChunkedFlawDetector:
+
+    def __init__(
+        self,
+        gemini,
+        serialization="html",
+        max_tokens=30000,
+        max_workers=8,
+        structured=True,
+        paragraph_ids=False,
+        max_rerequests=1,
+        bypass_cache=False,
+        deadline=None
+    ):
+        """
+        Detect flaws section by section with concurrent Gemini requests.
+
+        The cleaned HTML is split along its <section> hierarchy into chunks that fit in
+        `max_tokens` (including the prompt and a short summary of the paper), every chunk is
+        sent concurrently with a prompt_1-style prompt, and the flaw arrays are merged with
+        `merge_flaws`. Latency scales with the longest section instead of the whole paper.
+        A chunk whose request fails is skipped so the other chunks are not lost, and counted in
+        `self.failed_chunks` after a run: its flaws are missing from the result.
+
+        Args:
+            gemini (GeminiClient or AsyncGeminiClient): Client used for the requests. With an
+                AsyncGeminiClient the chunks run on its event loop, within its concurrency and rate limits.
+            serialization (str): 'html' or 'compact', see paper_serializer.serialize_paper.
+            max_tokens (int): Estimated token budget of one request.
+            max_workers (int): Maximum number of concurrent requests.
+            structured (bool): Ask for schema-constrained JSON output (see GeminiClient.generate_flaws).
+            paragraph_ids (bool): The paper was cleaned with paragraph ids, ask for start_id/end_id
+                instead of text anchors.
+            max_rerequests (int): See GeminiClient.generate_flaws.
+            bypass_cache (bool): See GeminiClient.generate_flaws.
+            deadline (float): Maximum time in seconds of each request, retries included
+                (AsyncGeminiClient only, see AsyncGeminiClient.generate_flaws).
+        """
+        self.gemini = gemini
+        self.serialization = serialization
+        self.max_tokens = max_tokens
+        self.max_workers = max_workers
+        self.structured = structured
+        self.paragraph_ids = paragraph_ids
+        self.max_rerequests = max_rerequests
+        self.bypass_cache = bypass_cache
+        if deadline is not None and gemini is not None and not asyncio.iscoroutinefunction(gemini.generate_text):
+            raise ValueError("[-] A request deadline needs an AsyncGeminiClient.")
+        self.deadline = deadline
+        self.prompt = get_prompt(serialization, paragraph_ids=paragraph_ids, section=True)
+        self.failed_chunks = 0
+
+    def split_sections(self, html_content: str, budget: int = None) -> list:
+        """
+        Split the cleaned HTML into chunks along its section structure.
+
+        Everything before the first top-level <section> (title, abstract) is one chunk and every
+        top-level section is one chunk. A section over the budget is split along its
+        subsections, and consecutive paragraphs are packed into chunks under the budget.
+
+        Args:
+            html_content (str): The cleaned HTML of the paper.
+            budget (int): Estimated token budget of a chunk (defaults to the request budget).
+
+        Returns:
+            list: Chunks as dicts {"title": str, "html": str}.
+        """
+        budget = budget or self.max_tokens
+        soup = BeautifulSoup(html_content, "html.parser")
+        root = soup.find("article") or soup
+
+        chunks = []
+        front_matter = []
+        for child in root.children:
+            if isinstance(child, Tag) and child.name == "section":
+                if child.get("id") in SKIPPED_SECTION_IDS:
+                    continue
+                chunks.extend(self._split_node(child, self._get_title(child), budget))
+            else:
+                front_matter.append(child)
+
+        if "".join(str(node) for node in front_matter).strip():
+            title = root.find("h1")
+            front_chunks = self._pack_nodes(front_matter, title.get_text(" ", strip=True) if title else "", budget)
+            chunks = front_chunks + chunks
+        return chunks
+
+    def summarize(self, html_content: str) -> str:
+        """
+        Short summary of the paper sent with every section: title, abstract and section outline.
+        Built locally, so it costs no extra request.
+        """
+        soup = BeautifulSoup(html_content, "html.parser")
+        lines = []
+        title = soup.find("h1")
+        if title:
+            lines.append(f"Title: {title.get_text(' ', strip=True)}")
+
+        # Class names are removed by the cleaner, find the abstract by its heading
+        abstract = next(
+            (heading.parent for heading in soup.find_all(HEADING_TAGS) if heading.get_text(strip=True).lower() == "abstract"),
+            None
+        )
+        if abstract:
+            text = html_to_compact_text(str(abstract))
+            if estimate_tokens(text) > SUMMARY_MAX_TOKENS:
+                text = " ".join(text.split()[:SUMMARY_MAX_TOKENS // 2]) + " ..."
+            lines.append(f"Abstract: {text}")
+
+        headings = [
+            heading.get_text(" ", strip=True)
+            for heading in soup.find_all(["h2", "h3"])
+            if heading.get_text(strip=True)
+        ]
+        if headings:
+            lines.append("Sections: " + "; ".join(headings))
+        return "\n".join(lines)
+
+    def build_prompt(self, section_html: str, summary: str) -> tuple:
+        """
+        Prompt for one chunk: the section prompt with the summary and the (serialized) section as the paper.
+
+        Returns:
+            tuple: (static prompt prefix, rest of the prompt), see utils.split_prompt.
+        """
+        section = html_to_compact_text(section_html) if self.serialization == "compact" else section_html
+        paper = f"Summary of the whole paper:\n{summary}\n\nSection:\n{section}"
+        return split_prompt(prompt=self.prompt, html_content=paper)
+
+    def detect(self, html_content: str) -> list:
+        """
+        Detect the flaws of a paper, one concurrent request per chunk.
+
+        Args:
+            html_content (str): The cleaned HTML of the paper.
+
+        Returns:
+            list: The merged flaws of all chunks.
+        """
+        if asyncio.iscoroutinefunction(self.gemini.generate_text):
+            return asyncio.run(self.detect_async(html_content))
+
+        chunks, prompts = self._prepare(html_content)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            flaw_lists = list(executor.map(self._detect_chunk, chunks, prompts))
+        return self._merge(flaw_lists, html_content)
+
+    async def detect_async(self, html_content: str) -> list:
+        """
+        Same as `detect` on the running event loop, for an AsyncGeminiClient shared with other
+        papers (its concurrency and rate limits then apply to all of them).
+        """
+        # Parsing the paper is CPU-bound, keep the event loop free for the requests of other papers
+        chunks, prompts = await asyncio.to_thread(self._prepare, html_content)
+        flaw_lists = await self._detect_chunks_async(chunks, prompts)
+        # Merging locates the anchors in the paper, also CPU-bound
+        return await asyncio.to_thread(self._merge, flaw_lists, html_content)
+
+    def build_prompts(self, html_content: str) -> tuple:
+        """
+        Chunks of the paper and their prompts, without sending them (also used by the preflight planner).
+
+        Returns:
+            tuple: (chunks, prompts), see `split_sections` and `build_prompt`.
+        """
+        summary = self.summarize(html_content)
+        overhead = estimate_tokens(self.prompt) + estimate_tokens(summary)
+        chunks = self.split_sections(html_content, budget=max(self.max_tokens - overhead, 1))
+        return chunks, [self.build_prompt(chunk["html"], summary) for chunk in chunks]
+
+    def generation_options(self) -> dict:
+        """
+        Keyword arguments of the `generate_flaws` call of every chunk.
+        """
+        options = {
+            "structured": self.structured,
+            "max_rerequests": self.max_rerequests,
+            "bypass_cache": self.bypass_cache,
+            "paragraph_ids": self.paragraph_ids,
+        }
+        # GeminiClient.generate_flaws has no deadline
+        if self.deadline is not None:
+            options["deadline"] = self.deadline
+        return options
+
+    def _prepare(self, html_content):
+        chunks, prompts = self.build_prompts(html_content)
+        workers = getattr(self.gemini, "max_concurrency", self.max_workers)
+        print(f"[*] Detecting flaws in {len(chunks)} chunks with {workers} workers")
+        return chunks, prompts
+
+    def _merge(self, flaw_lists, html_content):
+        # Failed chunks are None
+        self.failed_chunks = sum(1 for flaws in flaw_lists if flaws is None)
+        flaw_lists = [flaws for flaws in flaw_lists if flaws is not None]
+        flaws = merge_flaws(flaw_lists, html_content)
+        print(f"[+] Found {sum(len(f) for f in flaw_lists)} flaws, {len(flaws)} after merging")
+        if self.failed_chunks:
+            print(f"[-] {self.failed_chunks}/{self.failed_chunks + len(flaw_lists)} chunks failed, their flaws are missing")
+        return flaws
+
+    def _detect_chunk(self, chunk, prompt):
+        # A failing chunk returns None, so it is skipped without losing the other chunks
+        prefix, request = prompt
+        try:
+            flaws = self.gemini.generate_flaws(request, prefix=prefix, **self.generation_options())
+        except Exception as e:
+            print(f"[-] Chunk '{chunk['title']}' failed: {e}")
+            return None
+        return self._check_chunk_flaws(chunk, flaws)
+
+    async def _detect_chunks_async(self, chunks, prompts):
+        return await asyncio.gather(*(self._detect_chunk_async(chunk, prompt) for chunk, prompt in zip(chunks, prompts)))
+
+    async def _detect_chunk_async(self, chunk, prompt):
+        prefix, request = prompt
+        try:
+            flaws = await self.gemini.generate_flaws(request, prefix=prefix, **self.generation_options())
+        except Exception as e:
+            print(f"[-] Chunk '{chunk['title']}' failed: {e}")
+            return None
+        return self._check_chunk_flaws(chunk, flaws)
+
+    def _check_chunk_flaws(self, chunk, flaws):
+        if not isinstance(flaws, list):
+            print(f"[-] Chunk '{chunk['title']}' did not return a JSON array")
+            return None
+        print(f"[+] Chunk '{chunk['title']}': {len(flaws)} flaws")
+        return flaws
+
+    def _split_node(self, node, title, budget):
+        html = str(node)
+        if estimate_tokens(html) <= budget:
+            return [{"title": title, "html": html}]
+        return self._pack_nodes(list(node.children), title, budget)
+
+    def _pack_nodes(self, nodes, title, budget):
+        # Greedily pack consecutive nodes under the budget, recursing into nodes that are too big
+        chunks = []
+        current = []
+        current_tokens = 0
+        for node in nodes:
+            html = str(node)
+            tokens = estimate_tokens(html)
+            if tokens > budget and isinstance(node, Tag) and node.find(True):
+                if current:
+                    chunks.append({"title": title, "html": "".join(current)})
+                    current, current_tokens = [], 0
+                node_title = self._get_title(node) if node.name == "section" else title
+                chunks.extend(self._split_node(node, node_title or title, budget))
+                continue
+            if current and current_tokens + tokens > budget:
+                chunks.append({"title": title, "html": "".join(current)})
+                current, current_tokens = [], 0
+            current.append(html)
+            current_tokens += tokens
+        if "".join(current).strip():
+            chunks.append({"title": title, "html": "".join(current)})
+        return chunks
+
+    def _get_title(self, section):
+        heading = section.find(HEADING_TAGS)
+        return heading.get_text(" ", strip=True) if heading else section.get("id", "")
@@ -0,0 +1,191 @@
+import re
+import json
+from flaw_stream_parser import IncrementalFlawParser
+
+FLAW_FIELDS = (
+    "start_of_flaw",
+    "end_of_flaw",
+    "flaw_category",
+    "flaw_description",
+    "flaw_severity",
+    "flaw_confidence",
+)
+# Fields of a flaw located by paragraph ids (prompt.prompt_1_ids) instead of text anchors
+FLAW_ID_FIELDS = ("start_id", "end_id") + FLAW_FIELDS[2:]
+FLAW_CATEGORIES = ("1a", "1b", "1c", "1d", "2a", "2b", "2c", "3a", "3b", "4a", "4b", "5a", "5b")
+FLAW_SEVERITIES = ("low", "medium", "high")
+MIN_CONFIDENCE = 1
+MAX_CONFIDENCE = 5
+
+# Response schema of prompt_1, passed to Gemini as `response_schema` (JSON serializable so it can be
+# part of the response cache key)
+FLAW_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "start_of_flaw": {"type": "STRING"},
+            "end_of_flaw": {"type": "STRING"},
+            "flaw_category": {"type": "STRING", "enum": list(FLAW_CATEGORIES)},
+            "flaw_description": {"type": "STRING"},
+            "flaw_severity": {"type": "STRING", "enum": list(FLAW_SEVERITIES)},
+            "flaw_confidence": {"type": "INTEGER", "minimum": MIN_CONFIDENCE, "maximum": MAX_CONFIDENCE},
+        },
+        "required": list(FLAW_FIELDS),
+        "property_ordering": list(FLAW_FIELDS),
+    },
+}
+# Response schema of prompt_1_ids
+FLAW_ID_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "start_id": {"type": "STRING"},
+            "end_id": {"type": "STRING"},
+            **{field: FLAW_RESPONSE_SCHEMA["items"]["properties"][field] for field in FLAW_FIELDS[2:]},
+        },
+        "required": list(FLAW_ID_FIELDS),
+        "property_ordering": list(FLAW_ID_FIELDS),
+    },
+}
+PARAGRAPH_ID_PATTERN = re.compile(r"^\[?\s*p?(\d+)\s*\]?$", flags=re.IGNORECASE)
+TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+CODE_FENCE_PATTERN = re.compile(r"^```(?:json)?\s*|\s*```$", flags=re.MULTILINE)
+
+
+def structured_output_config(config: dict = None, paragraph_ids: bool = False) -> dict:
+    """
+    Generation config asking Gemini for a JSON array that follows FLAW_RESPONSE_SCHEMA.
+
+    Args:
+        config (dict): Optional generation config to extend (e.g. {"temperature": 0.2}).
+        paragraph_ids (bool): Use FLAW_ID_RESPONSE_SCHEMA (flaws located by paragraph ids).
+
+    Returns:
+        dict: The generation config with the response MIME type and schema.
+    """
+    schema = FLAW_ID_RESPONSE_SCHEMA if paragraph_ids else FLAW_RESPONSE_SCHEMA
+    return {**(config or {}), "response_mime_type": "application/json", "response_schema": schema}
+
+
+class FlawResponseParser:
+
+    def __init__(self):
+        """
+        Tolerant parser of the flaw JSON array returned by the model.
+
+        Responses are parsed as JSON first. When that fails, the response is repaired (code
+        fences and trailing commas removed, complete objects of a truncated or partly malformed
+        array kept). The flaws are then validated against the flaw schema. `stats` counts how
+        often each path was needed, to measure what structured output saves.
+        """
+        self.stats = {"parsed": 0, "repaired": 0, "re_requested": 0, "failed": 0, "invalid_flaws": 0}
+
+    def parse(self, response_text: str) -> list:
+        """
+        Parse the flaws of a response.
+
+        Args:
+            response_text (str): The text returned by the model.
+
+        Returns:
+            list: The valid flaws.
+
+        Raises:
+            ValueError: If no JSON array can be recovered from the response.
+        """
+        flaws, repaired = self._parse_array(response_text)
+        if flaws is None:
+            self.stats["failed"] += 1
+            raise ValueError("[-] No JSON array of flaws could be recovered from the response")
+        self.stats["repaired" if repaired else "parsed"] += 1
+        return self.validate(flaws)
+
+    def validate(self, flaws: list) -> list:
+        """
+        Keep the flaws with both anchors (or a paragraph id) and normalize the other fields to the flaw schema.
+        """
+        valid = []
+        for flaw in flaws:
+            flaw = normalize_flaw(flaw)
+            if flaw is None:
+                self.stats["invalid_flaws"] += 1
+                continue
+            valid.append(flaw)
+        return valid
+
+    def _parse_array(self, response_text):
+        text = CODE_FENCE_PATTERN.sub("", (response_text or "").strip())
+        try:
+            return self._as_flaw_list(json.loads(text)), False
+        except json.JSONDecodeError:
+            pass
+
+        try:
+            flaws = self._as_flaw_list(json.loads(TRAILING_COMMA_PATTERN.sub(r"\1", text)))
+            if flaws is not None:
+                return flaws, True
+        except json.JSONDecodeError:
+            pass
+
+        # Keep the complete objects of a truncated or partly malformed array
+        parser = IncrementalFlawParser()
+        parser.feed(text)
+        if not parser.flaws:
+            return None, True
+        return parser.close(), True
+
+    def _as_flaw_list(self, data):
+        if isinstance(data, list):
+            return data
+        if isinstance(data, dict):
+            # A single flaw, or the array wrapped in an object (e.g. {"flaws": [...]})
+            if "start_of_flaw" in data or "start_id" in data:
+                return [data]
+            for value in data.values():
+                if isinstance(value, list):
+                    return value
+        return None
+
+
+def normalize_flaw(flaw):
+    """
+    Normalize a flaw to the flaw schema, or return None if it cannot be located in the paper.
+
+    Category and severity are lower-cased, the confidence is converted to an integer in
+    [MIN_CONFIDENCE, MAX_CONFIDENCE]. Paragraph ids are normalized to 'p<number>' (a missing
+    end id is the start id). Anchors or a start id are required.
+    """
+    if not isinstance(flaw, dict):
+        return None
+    flaw = dict(flaw)
+    start_id = normalize_paragraph_id(flaw.pop("start_id", None))
+    end_id = normalize_paragraph_id(flaw.pop("end_id", None))
+    if start_id is not None:
+        flaw = {"start_id": start_id, "end_id": end_id or start_id, **flaw}
+
+    start = flaw.get("start_of_flaw")
+    end = flaw.get("end_of_flaw")
+    has_anchors = isinstance(start, str) and start.strip() and isinstance(end, str) and end.strip()
+    if not has_anchors and start_id is None:
+        return None
+
+    flaw["flaw_category"] = str(flaw.get("flaw_category", "")).strip().lower()
+    flaw["flaw_severity"] = str(flaw.get("flaw_severity", "")).strip().lower()
+    try:
+        confidence = int(float(flaw.get("flaw_confidence", MIN_CONFIDENCE)))
+    except (TypeError, ValueError):
+        confidence = MIN_CONFIDENCE
+    flaw["flaw_confidence"] = min(max(confidence, MIN_CONFIDENCE), MAX_CONFIDENCE)
+    return flaw
+
+
+def normalize_paragraph_id(value):
+    """
+    Normalize a paragraph id written by the model ('p12', 'P12', '[p12]' or 12) to 'p12', or None.
+    """
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        return None
+    match = PARAGRAPH_ID_PATTERN.match(str(value).strip())
+    return f"p{int(match.group(1))}" if match else None
@@ -0,0 +1,328 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from utils import save_json_to_file
+
+# Columns the flaws can be filtered and counted by
+GROUP_BY_COLUMNS = ("paper_id", "model", "version", "category", "category_group", "severity", "confidence")
+VERSION_PATTERN = re.compile(r"(v\d+)$")
+# Same category group as HTMLAnnotator: the leading digit of the category
+CATEGORY_GROUP_PATTERN = re.compile(r"(\d)")
+
+
+class FlawStore:
+
+    def __init__(self, store_path: str):
+        """
+        Corpus-level SQLite store of detected flaws.
+
+        Every detection run of a paper is stored with its paper ID, model, arXiv version and
+        timestamp, and each of its flaws gets indexed category, category group (the template
+        class 'cat1'-'cat5'), severity and confidence columns next to its full JSON, so corpus
+        questions ("all high-severity 1a flaws of this month", "category histogram per model")
+        are SQL queries instead of reading every `flaws.json`. Queries use the latest run of
+        each paper unless `all_runs` is set; older runs are kept. The `flaws.json` files are still
+        written by the scripts, and `export_json` writes one from the store.
+
+        Args:
+            store_path (str): Path of the SQLite file (e.g. './Result/flaws.sqlite').
+        """
+        self.store_path = store_path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(store_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(store_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                paper_id TEXT NOT NULL,
+                model TEXT,
+                version TEXT,
+                flaws_hash TEXT NOT NULL,
+                flaw_count INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS runs_paper ON runs (paper_id, id);
+            CREATE TABLE IF NOT EXISTS flaws (
+                run_id INTEGER NOT NULL REFERENCES runs (id),
+                position INTEGER NOT NULL,
+                paper_id TEXT NOT NULL,
+                category TEXT,
+                category_group INTEGER,
+                severity TEXT,
+                confidence INTEGER,
+                created_at REAL NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (run_id, position)
+            );
+            CREATE INDEX IF NOT EXISTS flaws_category ON flaws (category, severity, confidence);
+            CREATE INDEX IF NOT EXISTS flaws_category_group ON flaws (category_group);
+            CREATE INDEX IF NOT EXISTS flaws_severity ON flaws (severity, confidence);
+            CREATE INDEX IF NOT EXISTS flaws_confidence ON flaws (confidence);
+            CREATE INDEX IF NOT EXISTS flaws_created ON flaws (created_at);
+        """)
+        self._db.commit()
+
+    def add_run(self, paper_id: str, flaws: list, model: str = None, version: str = None, created_at: float = None) -> int:
+        """
+        Store the flaws of one detection run of a paper (see `add_runs`).
+
+        Returns:
+            int: The run id.
+        """
+        return self.add_runs([{
+            "paper_id": paper_id, "flaws": flaws, "model": model, "version": version, "created_at": created_at
+        }])[0]
+
+    def add_runs(self, runs: list) -> list:
+        """
+        Store many detection runs in one transaction (e.g. at the end of a batch).
+
+        A run with the same flaws as the latest run of its paper, and the same model or no model
+        (e.g. imported from a `flaws.json`), is not stored again: its id is returned instead.
+
+        Args:
+            runs (list): Dicts with "paper_id" and "flaws", and optionally "model", "version"
+                (defaults to the version suffix of the paper ID, e.g. 'v2') and "created_at"
+                (timestamp, defaults to now).
+
+        Returns:
+            list: The run id of each run.
+        """
+        run_ids = []
+        with self._lock:
+            for run in runs:
+                paper_id = run["paper_id"]
+                flaws = run["flaws"]
+                model = run.get("model")
+                created_at = run.get("created_at") or time.time()
+                version = run.get("version")
+                if version is None:
+                    match = VERSION_PATTERN.search(paper_id)
+                    version = match.group(1) if match else None
+                flaws_json = [json.dumps(flaw, ensure_ascii=False) for flaw in flaws]
+                flaws_hash = hashlib.sha256("\n".join(flaws_json).encode("utf-8")).hexdigest()
+
+                latest = self._db.execute(
+                    "SELECT id, model, flaws_hash FROM runs WHERE paper_id = ? ORDER BY id DESC LIMIT 1", (paper_id,)
+                ).fetchone()
+                if latest is not None and latest[2] == flaws_hash and model in (None, latest[1]):
+                    run_ids.append(latest[0])
+                    continue
+
+                run_id = self._db.execute(
+                    "INSERT INTO runs (paper_id, model, version, flaws_hash, flaw_count, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (paper_id, model, version, flaws_hash, len(flaws), created_at)
+                ).lastrowid
+                self._db.executemany(
+                    "INSERT INTO flaws (run_id, position, paper_id, category, category_group, severity, confidence, created_at, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (run_id, position, paper_id, *self._indexed_values(flaw), created_at, data)
+                        for position, (flaw, data) in enumerate(zip(flaws, flaws_json))
+                    ]
+                )
+                run_ids.append(run_id)
+            self._db.commit()
+        return run_ids
+
+    def get_flaws(self, paper_id: str, run_id: int = None) -> list:
+        """
+        The flaws of a paper as they were stored, in their original order.
+
+        Args:
+            paper_id (str): Paper ID (e.g. '2507_22291v2').
+            run_id (int): Run to read, the latest run of the paper if None.
+
+        Returns:
+            list: The flaws, empty if the run found no flaw.
+
+        Raises:
+            KeyError: The paper has no run in the store, or `run_id` is not a run of the paper.
+        """
+        with self._lock:
+            run_id = self._run_id(paper_id, run_id)
+            rows = self._db.execute("SELECT data FROM flaws WHERE run_id = ? ORDER BY position", (run_id,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_category_counts(self, paper_id: str, run_id: int = None) -> dict:
+        """
+        Number of flaws of a paper per template class 'cat1'-'cat5' (see HTMLAnnotator).
+
+        Raises:
+            KeyError: See `get_flaws`.
+        """
+        counts = {f"cat{i}": 0 for i in range(1, 6)}
+        with self._lock:
+            run_id = self._run_id(paper_id, run_id)
+            rows = self._db.execute(
+                "SELECT category_group, COUNT(*) FROM flaws WHERE run_id = ? AND category_group IS NOT NULL "
+                "GROUP BY category_group", (run_id,)
+            ).fetchall()
+        for group, count in rows:
+            if f"cat{group}" in counts:
+                counts[f"cat{group}"] = count
+        return counts
+
+    def query_flaws(self, limit: int = None, **filters) -> list:
+        """
+        Flaws matching all the given filters, newest runs first.
+
+        Args:
+            limit (int): Maximum number of flaws returned.
+            **filters: See `_where`: paper_id, model, version, category, category_group,
+                severity, min_confidence, since, until, all_runs.
+
+        Returns:
+            list: Dicts with "paper_id", "run_id", "model", "version", "created_at" and "flaw".
+        """
+        where, params = self._where(**filters)
+        sql = (
+            "SELECT flaws.paper_id, flaws.run_id, runs.model, runs.version, flaws.created_at, flaws.data "
+            f"FROM flaws JOIN runs ON runs.id = flaws.run_id WHERE {where} "
+            "ORDER BY flaws.run_id DESC, flaws.position"
+        )
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [
+            {"paper_id": row[0], "run_id": row[1], "model": row[2], "version": row[3], "created_at": row[4], "flaw": json.loads(row[5])}
+            for row in rows
+        ]
+
+    def count_flaws(self, group_by=("category",), **filters) -> list:
+        """
+        Number of flaws matching the filters per value of the `group_by` columns.
+
+        Args:
+            group_by (tuple): Columns among GROUP_BY_COLUMNS (e.g. ("model", "category")).
+            **filters: See `query_flaws`.
+
+        Returns:
+            list: Dicts with the `group_by` values and "count", largest counts first.
+        """
+        unknown = [column for column in group_by if column not in GROUP_BY_COLUMNS]
+        if unknown or not group_by:
+            raise ValueError(f"[-] Cannot group flaws by {unknown}. Choose among {GROUP_BY_COLUMNS}.")
+        columns = ", ".join(f"runs.{column}" if column in ("model", "version") else f"flaws.{column}" for column in group_by)
+        where, params = self._where(**filters)
+        sql = (
+            f"SELECT {columns}, COUNT(*) FROM flaws JOIN runs ON runs.id = flaws.run_id WHERE {where} "
+            f"GROUP BY {columns} ORDER BY COUNT(*) DESC"
+        )
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [{**dict(zip(group_by, row[:-1])), "count": row[-1]} for row in rows]
+
+    def paper_ids(self) -> list:
+        """
+        IDs of the papers with at least one run.
+        """
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT DISTINCT paper_id FROM runs ORDER BY paper_id").fetchall()]
+
+    def export_json(self, paper_id: str, directory: str, filename: str, run_id: int = None) -> str:
+        """
+        Save the flaws of a paper as a `flaws.json` file, like the detection scripts do.
+
+        Returns:
+            str: Full path to the saved JSON file.
+        """
+        return save_json_to_file(data=self.get_flaws(paper_id, run_id), directory=directory, filename=filename)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _latest_run_id(self, paper_id):
+        # Called with the lock held
+        row = self._db.execute("SELECT MAX(id) FROM runs WHERE paper_id = ?", (paper_id,)).fetchone()
+        return row[0]
+
+    def _run_id(self, paper_id, run_id):
+        # Called with the lock held: the given run of the paper, else its latest run
+        if run_id is None:
+            run_id = self._latest_run_id(paper_id)
+        elif self._db.execute("SELECT 1 FROM runs WHERE id = ? AND paper_id = ?", (run_id, paper_id)).fetchone() is None:
+            run_id = None
+        if run_id is None:
+            raise KeyError(f"[-] No run of paper '{paper_id}' in the flaw store")
+        return run_id
+
+    def _indexed_values(self, flaw):
+        category = flaw.get("flaw_category")
+        match = CATEGORY_GROUP_PATTERN.match(str(category)) if category else None
+        category_group = int(match.group(1)) if match else None
+        category = str(category).strip() if category is not None else None
+        severity = flaw.get("flaw_severity")
+        severity = str(severity).strip().lower() if severity is not None else None
+        try:
+            confidence = int(flaw.get("flaw_confidence"))
+        except (TypeError, ValueError):
+            confidence = None
+        return category, category_group, severity, confidence
+
+    def _where(
+        self,
+        paper_id: str = None,
+        model: str = None,
+        version: str = None,
+        category: str = None,
+        category_group: int = None,
+        severity: str = None,
+        min_confidence: int = None,
+        since=None,
+        until=None,
+        all_runs: bool = False
+    ):
+        """
+        SQL condition and parameters of the flaw filters.
+
+        Args:
+            paper_id (str): Flaws of this paper.
+            model (str): Flaws detected by this model.
+            version (str): Flaws of this arXiv version (e.g. 'v2').
+            category (str): Flaws of this category (e.g. '1a').
+            category_group (int): Flaws of this category group (e.g. 1 for '1a', '1b', ...).
+            severity (str): Flaws of this severity (e.g. 'high').
+            min_confidence (int): Flaws with at least this confidence.
+            since (float or datetime): Flaws of runs made at or after this time.
+            until (float or datetime): Flaws of runs made before this time.
+            all_runs (bool): Include the older runs of each paper, not only the latest one.
+        """
+        conditions = []
+        params = []
+        for column, value in (
+            ("flaws.paper_id", paper_id),
+            ("runs.model", model),
+            ("runs.version", version),
+            ("flaws.category", category),
+            ("flaws.category_group", category_group),
+            ("flaws.severity", severity.lower() if severity is not None else None),
+        ):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if min_confidence is not None:
+            conditions.append("flaws.confidence >= ?")
+            params.append(min_confidence)
+        if since is not None:
+            conditions.append("flaws.created_at >= ?")
+            params.append(since.timestamp() if isinstance(since, datetime) else since)
+        if until is not None:
+            conditions.append("flaws.created_at < ?")
+            params.append(until.timestamp() if isinstance(until, datetime) else until)
+        if not all_runs:
+            conditions.append("flaws.run_id IN (SELECT MAX(id) FROM runs GROUP BY paper_id)")
+        return " AND ".join(conditions) or "1", params
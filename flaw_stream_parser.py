@@ -0,0 +1,141 @@
+import json
+
+
+class IncrementalFlawParser:
+
+    def __init__(self):
+        """
+        Incremental parser of a streamed JSON array of flaw objects.
+
+        Text is fed chunk by chunk as the model generates it. Every flaw object of the top-level
+        array is returned as soon as its closing brace arrives, so a truncated response or a
+        malformed object only loses the objects it affects. Text before the array (e.g. a
+        ```json marker) and after it is ignored.
+        """
+        self.flaws = []
+        self.skipped = 0
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._buffer = []
+
+    def feed(self, text: str) -> list:
+        """
+        Parse the next chunk of the response.
+
+        Args:
+            text (str): The next chunk of the response text.
+
+        Returns:
+            list: The flaw objects completed by this chunk.
+        """
+        completed = []
+        for character in text:
+            if self._finished:
+                break
+            if not self._started:
+                self._started = character == "["
+                continue
+
+            if self._depth == 0:
+                # Between two objects of the array
+                if character == "{":
+                    self._depth = 1
+                    self._buffer = [character]
+                elif character == "]":
+                    self._finished = True
+                continue
+
+            self._buffer.append(character)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif character == "\\":
+                    self._escaped = True
+                elif character == '"':
+                    self._in_string = False
+            elif character == '"':
+                self._in_string = True
+            elif character in "{[":
+                self._depth += 1
+            elif character in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    flaw = self._parse_object("".join(self._buffer))
+                    if flaw is not None:
+                        completed.append(flaw)
+        self.flaws.extend(completed)
+        return completed
+
+    def close(self) -> list:
+        """
+        End of the response: report an unfinished array and return all parsed flaws.
+        """
+        if not self._started:
+            print("[-] The response does not contain a JSON array")
+        elif self._depth > 0:
+            print(f"[-] The response was cut off, kept the {len(self.flaws)} complete flaws")
+        elif not self._finished:
+            print(f"[-] The JSON array was not closed, kept the {len(self.flaws)} complete flaws")
+        return self.flaws
+
+    def _parse_object(self, object_string):
+        try:
+            flaw = json.loads(object_string)
+        except json.JSONDecodeError as e:
+            self.skipped += 1
+            print(f"[-] Skipped a malformed flaw object: {e}")
+            return None
+        return flaw
+
+
+def stream_flaws(text_chunks):
+    """
+    Yield the flaw objects of a streamed JSON array as soon as each one is complete.
+
+    Args:
+        text_chunks (iterable): The response text, chunk by chunk.
+
+    Yields:
+        dict: The next complete flaw object.
+    """
+    parser = IncrementalFlawParser()
+    for text in text_chunks:
+        yield from parser.feed(text)
+    parser.close()
+
+
+async def stream_flaws_async(text_chunks):
+    """
+    Async version of `stream_flaws` for an async iterator of text chunks.
+    """
+    parser = IncrementalFlawParser()
+    async for text in text_chunks:
+        for flaw in parser.feed(text):
+            yield flaw
+    parser.close()
+
+
+async def collect_streamed_flaws(text_chunks, on_flaw=None) -> list:
+    """
+    Collect the flaws of a streamed response, keeping the complete ones if the stream fails.
+
+    Args:
+        text_chunks (async iterable): The response text, chunk by chunk.
+        on_flaw (callable): Optional function called with each flaw as soon as it is complete.
+
+    Returns:
+        list: The complete flaw objects.
+    """
+    flaws = []
+    try:
+        async for flaw in stream_flaws_async(text_chunks):
+            print(f"[+] Flaw {len(flaws) + 1}: {flaw.get('flaw_category', '?') if isinstance(flaw, dict) else flaw}")
+            flaws.append(flaw)
+            if on_flaw is not None:
+                on_flaw(flaw)
+    except Exception as e:
+        print(f"[-] The response stream failed, kept the {len(flaws)} complete flaws: {e}")
+    return flaws
@@ -1,40 +1,271 @@
-from google import genai
-from google.genai import types
+import time
+import threading
+from llm_cache import LLMResponseCache
+from context_cache import PromptPrefixCache, is_cached_content_error, build_request
+from flaw_schema import FlawResponseParser, structured_output_config
+from utils import genai_errors
+from metrics import metrics, usage_values
 
 
 class GeminiClient:
-    def __init__(self, api_key: str = None, model: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        model: str = None,
+        cache: LLMResponseCache = None,
+        client=None,
+        context_cache_ttl: int = None
+    ):
         """
         Initialize Gemini API client.
 
         Args:
             api_key (str): Google Gemini API key. If not provided, will use GEMINI_API_KEY env variable.
             model (str): Default Gemini model to use.
+            cache (LLMResponseCache): Optional persistent cache of responses.
+            client: Object with the `genai.Client` interface (e.g. FakeGeminiClient for offline tests).
+            context_cache_ttl (int): Enable context caching of prompt prefixes with this TTL in seconds
+                (see PromptPrefixCache). None sends every prompt in full.
         """
         self.api_key = api_key
         self.model = model
-        if not self.api_key:
+        self.cache = cache
+        if client is None and not self.api_key:
             raise ValueError("api_key is required. Set GEMINI_API_KEY in `.env` and pass api_key argument.")
         if not self.model:
             raise ValueError("model is required. Set GEMINI_MODEL in `config.py` and pass model argument.")
 
-        self.client = genai.Client(api_key=self.api_key)
+        # Created on first use (see `client`)
+        self._client = client
+        # Created with the client by the first request with a prefix (see `context_cache`)
+        self.context_cache_ttl = context_cache_ttl
+        self._context_cache = None
+        self._context_cache_lock = threading.Lock()
+        # Usage metadata of the last generate_text call and whether it was served from the cache
+        self.last_usage_metadata = {}
+        self.last_from_cache = False
+        # Calls, seconds and token counts summed over all calls (cached responses count no tokens)
+        self.usage_totals = {"calls": 0, "seconds": 0.0, **usage_values(None)}
+        self._usage_lock = threading.Lock()
+        self.flaw_parser = FlawResponseParser()
 
-    def generate_text(self, prompt: str) -> str:
+    def generate_text(self, prompt: str, config: dict = None, bypass_cache: bool = False, prefix: str = None) -> str:
         """
         Generate text response for a given prompt.
 
         Args:
             prompt (str): Input prompt text.
-            kwargs: Additional model configuration options.
+            config (dict): Optional generation config (e.g. {"temperature": 0.2}).
+            bypass_cache (bool): Always call the model, the new response still replaces the cached one.
+            prefix (str): Static text in front of the prompt (see utils.split_prompt), sent through
+                the context cache when it is enabled.
 
         Returns:
             str: Generated text response.
         """
-        response = self.client.models.generate_content(
-            model=self.model,
-            contents=[{"parts": [{"text": prompt}]}]
+        text, cache_key, usage_metadata = self._generate_text(prompt, config, bypass_cache, prefix)
+        self._cache_response(cache_key, text, usage_metadata)
+        return text
+
+    def generate_flaws(
+        self,
+        prompt: str,
+        config: dict = None,
+        structured: bool = True,
+        max_rerequests: int = 1,
+        bypass_cache: bool = False,
+        prefix: str = None,
+        paragraph_ids: bool = False
+    ) -> list:
+        """
+        Generate the flaw array of a prompt_1-style prompt.
+
+        With `structured`, the response is constrained to FLAW_RESPONSE_SCHEMA so it is valid JSON.
+        Otherwise (models without response schema support) it is parsed by the tolerant
+        FlawResponseParser, and re-requested up to `max_rerequests` times if nothing can be
+        recovered. The counters are in `self.flaw_parser.stats`. Only a response that parses is
+        cached, so an unparsable one is never served again.
+
+        Args:
+            prompt (str): Input prompt text.
+            config (dict): Optional generation config (e.g. {"temperature": 0.2}).
+            structured (bool): Ask for schema-constrained JSON output.
+            max_rerequests (int): Number of new requests when a response cannot be parsed.
+            bypass_cache (bool): Always call the model, the new response still replaces the cached one.
+            prefix (str): Static text in front of the prompt, see `generate_text`.
+            paragraph_ids (bool): The prompt asks for paragraph ids (prompt_1_ids), use FLAW_ID_RESPONSE_SCHEMA.
+
+        Returns:
+            list: The valid flaws.
+        """
+        if structured:
+            config = structured_output_config(config, paragraph_ids=paragraph_ids)
+        for attempt in range(max_rerequests + 1):
+            # A re-request bypasses the cache, which may still hold an unparsable response from an older version
+            text, cache_key, usage_metadata = self._generate_text(
+                prompt, config, bypass_cache or attempt > 0, prefix
+            )
+            try:
+                flaws = self.flaw_parser.parse(text)
+            except ValueError as e:
+                if attempt == max_rerequests:
+                    raise
+                self.flaw_parser.stats["re_requested"] += 1
+                print(f"{e}, requesting again")
+                continue
+            # Only responses that parse are cached, a bad response must not be replayed
+            self._cache_response(cache_key, text, usage_metadata)
+            return flaws
+
+    def generate_text_stream(self, prompt: str, config: dict = None, bypass_cache: bool = False, prefix: str = None):
+        """
+        Generate a text response chunk by chunk as the model produces it.
+
+        The full text is cached once the stream ends, and a cached response is yielded in one chunk.
+
+        Args:
+            prompt (str): Input prompt text.
+            config (dict): Optional generation config (e.g. {"temperature": 0.2}).
+            bypass_cache (bool): Always call the model, the new response still replaces the cached one.
+            prefix (str): Static text in front of the prompt, see `generate_text`.
+
+        Yields:
+            str: The next chunk of the response text.
+        """
+        start = time.perf_counter()
+        cache_key = None
+        if self.cache is not None:
+            cache_key = LLMResponseCache.make_key(self.model, (prefix or "") + prompt, config)
+            if not bypass_cache:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    print("[+] Gemini response served from cache")
+                    self.last_usage_metadata = cached["usage_metadata"]
+                    self.last_from_cache = True
+                    self._record_metrics(start, self.last_usage_metadata, from_cache=True, streamed=True)
+                    yield cached["text"]
+                    return
+
+        self.last_from_cache = False
+        parts = []
+        for response in self._generate_content_stream(prompt, config, prefix):
+            # The last chunk carries the usage metadata of the whole response
+            if getattr(response, "usage_metadata", None) is not None:
+                self.last_usage_metadata = self._usage_to_dict(response.usage_metadata)
+            text = getattr(response, "text", "") or ""
+            if text:
+                parts.append(text)
+                yield text
+
+        self._record_metrics(start, self.last_usage_metadata, from_cache=False, streamed=True)
+        if cache_key is not None and parts:
+            self.cache.put(cache_key, self.model, "".join(parts), self.last_usage_metadata)
+
+    @property
+    def client(self):
+        # google.genai takes most of the start-up time of the scripts, it is imported by the first request
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    @property
+    def context_cache(self):
+        # PromptPrefixCache needs `client`, both are created by the first request that uses them
+        if self.context_cache_ttl and self._context_cache is None:
+            with self._context_cache_lock:
+                if self._context_cache is None:
+                    self._context_cache = PromptPrefixCache(self.client, self.model, ttl_seconds=self.context_cache_ttl)
+        return self._context_cache
+
+    def _generate_text(self, prompt, config, bypass_cache, prefix):
+        """
+        Returns:
+            tuple: (text, cache key or None if there is nothing to cache, usage metadata)
+        """
+        start = time.perf_counter()
+        cache_key = None
+        if self.cache is not None:
+            cache_key = LLMResponseCache.make_key(self.model, (prefix or "") + prompt, config)
+            if not bypass_cache:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    print("[+] Gemini response served from cache")
+                    self.last_usage_metadata = cached["usage_metadata"]
+                    self.last_from_cache = True
+                    self._record_metrics(start, self.last_usage_metadata, from_cache=True)
+                    return cached["text"], None, cached["usage_metadata"]
+
+        response = self._generate_content(prompt, config, prefix)
+        text = getattr(response, "text", "") or ""
+        usage_metadata = self._usage_to_dict(getattr(response, "usage_metadata", None))
+        self.last_usage_metadata = usage_metadata
+        self.last_from_cache = False
+        self._record_metrics(start, usage_metadata, from_cache=False)
+        return text, cache_key, usage_metadata
+
+    def _cache_response(self, cache_key, text, usage_metadata):
+        # Empty responses (e.g. blocked prompts) are not cached
+        if cache_key is not None and text:
+            self.cache.put(cache_key, self.model, text, usage_metadata)
+
+    def _generate_content(self, prompt, config, prefix):
+        handle = self._get_context_handle(prefix)
+        try:
+            return self.client.models.generate_content(model=self.model, **build_request(prompt, config, prefix, handle))
+        except genai_errors().APIError as e:
+            if handle is None or not is_cached_content_error(e):
+                raise
+            # The cached prefix is gone (expired or deleted), send the full prompt
+            print(f"[-] Cached prompt prefix rejected ({e.code}), sending the full prompt")
+            self.context_cache.invalidate(handle)
+            return self.client.models.generate_content(model=self.model, **build_request(prompt, config, prefix, None))
+
+    def _generate_content_stream(self, prompt, config, prefix):
+        handle = self._get_context_handle(prefix)
+        try:
+            stream = iter(self.client.models.generate_content_stream(
+                model=self.model, **build_request(prompt, config, prefix, handle)
+            ))
+            first_response = next(stream, None)
+        except genai_errors().APIError as e:
+            if handle is None or not is_cached_content_error(e):
+                raise
+            print(f"[-] Cached prompt prefix rejected ({e.code}), sending the full prompt")
+            self.context_cache.invalidate(handle)
+            stream = iter(self.client.models.generate_content_stream(
+                model=self.model, **build_request(prompt, config, prefix, None)
+            ))
+            first_response = next(stream, None)
+        if first_response is not None:
+            yield first_response
+            yield from stream
+
+    def _get_context_handle(self, prefix):
+        if not prefix or self.context_cache is None:
+            return None
+        return self.context_cache.get_handle(prefix)
+
+    def _record_metrics(self, start, usage_metadata, from_cache, streamed=False):
+        seconds = round(time.perf_counter() - start, 6)
+        # Tokens of a cached response were paid for by the call that cached it
+        usage = usage_values(usage_metadata if not from_cache else None)
+        with self._usage_lock:
+            self._add_usage_totals(seconds, usage)
+        if not metrics.enabled:
+            return
+        metrics.record(
+            "llm", labels={"model": self.model}, seconds=seconds,
+            from_cache=from_cache, streamed=streamed, **usage
         )
-        return getattr(response, "text", "")
 
-   
\ No newline at end of file
+    def _add_usage_totals(self, seconds, usage):
+        self.usage_totals["calls"] += 1
+        self.usage_totals["seconds"] = round(self.usage_totals["seconds"] + seconds, 6)
+        for field, value in usage.items():
+            self.usage_totals[field] += value
+
+    def _usage_to_dict(self, usage_metadata) -> dict:
+        if usage_metadata is None:
+            return {}
+        return usage_metadata.model_dump(mode="json", exclude_none=True)
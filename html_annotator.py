@@ -1,19 +1,52 @@
+import os
 import re
+import json
+import time
+from annotation_engine import find_flaw_span, find_paragraph_span, index_paragraph_ids, splice_spans
+from anchor_index import AnchorIndex
+from metrics import metrics
 from utils import (
     read_json_file,
     read_html_file,
     save_html_to_file
 )
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+# Where the flaw details go: on every span ("inline"), in one JSON blob of the page ("embedded")
+# or in a JSON file next to the page ("sidecar"); with the last two spans only carry a flaw id
+FLAW_DATA_MODES = ("inline", "embedded", "sidecar")
+SIDECAR_EXTENSION = ".flaws.json"
 
 
 class HTMLAnnotator:
-    def __init__(self, template_directory, template_file):
+    def __init__(self, template_directory, template_file, fuzzy_anchors=True, bytecode_cache_dir=None, flaw_data="inline"):
         """
         Initialize the annotator with an optional template path.
+
+        Flaws with paragraph ids ('start_id'/'end_id') are located with a lookup table of the ids
+        of the HTML. Text anchors not found verbatim in the HTML are looked up in an AnchorIndex
+        of the visible text, with a bounded fuzzy match if `fuzzy_anchors` is set. Anchors still
+        not found are looked up in the text as the compact serialization shows it (math as LaTeX,
+        see AnchorIndex), since flaws detected on a compact prompt quote that text.
+
+        The template is compiled once per annotator and reused for every paper. With
+        `bytecode_cache_dir`, the compiled template is also cached on disk for new processes.
+
+        With `flaw_data` "embedded" or "sidecar", flaw spans only carry a numeric flaw id and the
+        details of all flaws are written once as a compact JSON array (in the page, or in a
+        '.flaws.json' file saved next to it), read by the page on the first click.
         """
+        if flaw_data not in FLAW_DATA_MODES:
+            raise ValueError(f"[-] Unknown flaw data mode '{flaw_data}'. Choose one of {FLAW_DATA_MODES}.")
         self.template_directory = template_directory
         self.template_file = template_file
+        self.fuzzy_anchors = fuzzy_anchors
+        self.bytecode_cache_dir = bytecode_cache_dir
+        self._template = None
+        self.flaw_data = flaw_data
+        # [category, severity, confidence, description] of each annotated flaw, by flaw id
+        self.flaw_records = []
+        self.anchor_stats = {}
         self.html_paper = ""
         self.flaws = []
         self.annotated_html = ""
@@ -32,6 +65,16 @@ class HTMLAnnotator:
         self.flaws = read_json_file(directory=json_directory, filename=json_file)
         print("[+] Loaded Flaws from file")
 
+    def load_flaws_from_store(self, flaw_store, paper_id, run_id=None):
+        """
+        Load the flaws of a paper from a FlawStore (the latest run unless `run_id` is given).
+
+        Raises:
+            KeyError: The paper has no run in the store, or `run_id` is not a run of the paper.
+        """
+        self.flaws = flaw_store.get_flaws(paper_id, run_id)
+        print(f"[+] Loaded {len(self.flaws)} Flaws of {paper_id} from the flaw store")
+
     def _map_flaw_category_to_template(self, cat_str: str) -> str:
         """
         Map a flaw_category string like '1a', '3b', '4c' to template class 'cat1'–'cat5'.
@@ -64,61 +107,143 @@ class HTMLAnnotator:
         """
         Function to annotate html with flaws
         Wrap flaw text in <span> with category and confidence classes.
-        Uses 'start_of_flaw' and 'end_of_flaw' to locate the exact text.
+        Uses 'start_id' and 'end_id' (paragraph ids) to locate the flaw when present, otherwise
+        'start_of_flaw' and 'end_of_flaw' to locate the exact text.
         """
 
-        html_content = self.html_paper
-
+        # Locate every flaw in the original HTML, then wrap all of them in a single output build
+        start = time.perf_counter()
+        spans = []
+        self.flaw_records = []
+        paragraph_spans = None
+        anchor_index = None
+        compact_index = None
+        id_hits = 0
+        exact_hits = 0
+        missed = 0
         for flaw in self.flaws:
+            start_id = flaw.get("start_id")
             start_text = flaw.get("start_of_flaw")
             end_text = flaw.get("end_of_flaw")
             category_key = flaw.get("flaw_category")
-            severity = flaw.get("flaw_severity", "N/A")
-            confidence = flaw.get("flaw_confidence", 3)
-            description = flaw.get("flaw_description", "")
 
-            if not start_text or not end_text or not category_key:
+            if not (start_id or (start_text and end_text)) or not category_key:
                 continue  # skip invalid flaw entry
 
             # Map category to template class
             category_class = self._map_flaw_category_to_template(category_key)
 
-            # Determine confidence class
-            conf_class = f"conf{confidence}"
-
-            # Regex to find the text between start and end (non-greedy)
-            pattern = re.escape(start_text) + r"(.*?)" + re.escape(end_text)
-            if not re.search(pattern, html_content, flags=re.DOTALL):
+            span = None
+            if start_id:
+                # Paragraph ids: constant time lookup in a table built once
+                if paragraph_spans is None:
+                    paragraph_spans = index_paragraph_ids(self.html_paper)
+                span = find_paragraph_span(paragraph_spans, start_id, flaw.get("end_id"))
+                if span is not None:
+                    id_hits += 1
+            if span is None and start_text and end_text:
+                span = find_flaw_span(self.html_paper, start_text, end_text)
+                if span is not None:
+                    exact_hits += 1
+                else:
+                    # Anchor spanning tags, entities or line breaks: look it up in the visible text (built once)
+                    if anchor_index is None:
+                        anchor_index = AnchorIndex(self.html_paper, fuzzy=self.fuzzy_anchors)
+                    span = anchor_index.find(start_text, end_text)
+                if span is None:
+                    # Anchor quoted from the compact serialization (e.g. math as its LaTeX alttext)
+                    if compact_index is None:
+                        compact_index = AnchorIndex(self.html_paper, fuzzy=self.fuzzy_anchors, compact=True)
+                    span = compact_index.find(start_text, end_text)
+            if span is None:
                 print(f"  ❌ Could not find in HTML! -- {category_class}")
-                print(start_text)
-
-            def replacer(match):
-                full_text = match.group(0)
-                # return f"<span class='flaw {category_class} {conf_class}'>{full_text}</span>"
-                return f"<span class='flaw {category_class} {conf_class}' " \
-                    f"data-category='{category_key}' " \
-                    f"data-severity='{severity}' " \
-                    f"data-confidence='{confidence}' " \
-                    f"data-description='{description}'>{full_text}</span>"
-
-            # Replace only the first match
-            html_content = re.sub(pattern, replacer, html_content, count=1, flags=re.DOTALL)
+                print(start_text or start_id)
+                missed += 1
+                continue
+            if self.flaw_data == "inline":
+                spans.append((span[0], span[1], self._make_flaw_tag(flaw, category_class)))
+            else:
+                spans.append((span[0], span[1], self._make_flaw_id_tag(flaw, category_class, len(self.flaw_records))))
+                self.flaw_records.append([
+                    category_key,
+                    flaw.get("flaw_severity", "N/A"),
+                    flaw.get("flaw_confidence", 3),
+                    flaw.get("flaw_description", "")
+                ])
+
+        html_content = splice_spans(self.html_paper, spans)
+        self.anchor_stats = {"id": id_hits, "exact": exact_hits, "normalized": 0, "fuzzy": 0, "compact": 0, "missed": missed}
+        if anchor_index is not None:
+            self.anchor_stats.update(normalized=anchor_index.stats["normalized"], fuzzy=anchor_index.stats["fuzzy"])
+        if compact_index is not None:
+            self.anchor_stats["compact"] = compact_index.stats["normalized"] + compact_index.stats["fuzzy"]
+        print(f"[+] Located {len(spans)} flaws: {self.anchor_stats}")
 
         # Inject into template
-        env = Environment(loader=FileSystemLoader(str(self.template_directory)))
-        template = env.get_template(self.template_file)
-        self.annotated_html = template.render(
+        self.annotated_html = self._get_template().render(
             annotated_content=html_content,
             flaw_counts=self._get_flaw_count(),
-            title="Flaw-Annotated Document"
+            title="Flaw-Annotated Document",
+            flaw_data=self._flaw_data_json() if self.flaw_data == "embedded" else None
         )
+        metrics.record("annotate", seconds=round(time.perf_counter() - start, 6), flaws=len(self.flaws), **self.anchor_stats)
         print("[+] Annotated HTML file")
 
+    def _get_template(self):
+        """
+        The compiled template, loaded on first use.
+        """
+        if self._template is None:
+            bytecode_cache = None
+            if self.bytecode_cache_dir:
+                os.makedirs(self.bytecode_cache_dir, exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(self.bytecode_cache_dir)
+            env = Environment(
+                loader=FileSystemLoader(str(self.template_directory)),
+                bytecode_cache=bytecode_cache,
+                # The template is not edited while a batch runs
+                auto_reload=False
+            )
+            self._template = env.get_template(self.template_file)
+        return self._template
+
+    def _make_flaw_tag(self, flaw, category_class) -> str:
+        """
+        Opening <span> tag of a flaw with its category and confidence classes and data attributes.
+        """
+        category_key = flaw.get("flaw_category")
+        severity = flaw.get("flaw_severity", "N/A")
+        confidence = flaw.get("flaw_confidence", 3)
+        description = flaw.get("flaw_description", "")
+
+        # Determine confidence class
+        conf_class = f"conf{confidence}"
+        return f"<span class='flaw {category_class} {conf_class}' " \
+            f"data-category='{category_key}' " \
+            f"data-severity='{severity}' " \
+            f"data-confidence='{confidence}' " \
+            f"data-description='{description}'>"
+
+    def _make_flaw_id_tag(self, flaw, category_class, flaw_id) -> str:
+        """
+        Opening <span> tag of a flaw with its category and confidence classes and its flaw id only.
+        """
+        return f"<span class='flaw {category_class} conf{flaw.get('flaw_confidence', 3)}' data-id='{flaw_id}'>"
+
+    def _flaw_data_json(self) -> str:
+        # Compact JSON, safe inside a <script> element
+        return json.dumps(self.flaw_records, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+
     def save_annotated_html(self, html_directory, html_file):
         """
-        Save the annotated HTML to a file.
+        Save the annotated HTML to a file (and the flaw details next to it in "sidecar" mode).
         """
         if not self.annotated_html:
             raise ValueError("[-] Annotated HTML not generated. Please call annotate_html() first.")
         saved_path = save_html_to_file(html_content=self.annotated_html, directory=html_directory, filename=html_file)
         print(f"[+] Saved annotated HTML to {saved_path}")
+        if self.flaw_data == "sidecar":
+            sidecar_file = os.path.splitext(html_file)[0] + SIDECAR_EXTENSION
+            with open(os.path.join(html_directory, sidecar_file), "w", encoding="utf-8") as f:
+                f.write(self._flaw_data_json())
+            print(f"[+] Saved flaw details to {os.path.join(html_directory, sidecar_file)}")
@@ -0,0 +1,198 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from html_annotator import HTMLAnnotator
+from utils import save_json_to_file
+from metrics import metrics
+
+# HTMLAnnotator of a worker process, created once by _init_worker and reused for every paper
+_worker_annotator = None
+
+
+def find_papers(papers_dir: str, html_file_name: str, json_file_name: str) -> list:
+    """
+    Find the papers of a corpus laid out as `<papers_dir>/<paper_id>/` (as written by
+    HTML_BatchDownloader) that have both a cleaned HTML file and a flaws JSON file.
+
+    Args:
+        papers_dir (str): Root directory of the corpus.
+        html_file_name (str): File name of each cleaned paper (e.g. 'paper.html').
+        json_file_name (str): File name of each flaws file (e.g. 'flaws.json').
+
+    Returns:
+        list: The paper IDs (directory names), sorted.
+    """
+    if not os.path.isdir(papers_dir):
+        raise FileNotFoundError(f"[-] Directory not found: {papers_dir}")
+
+    paper_ids = []
+    for entry in sorted(os.scandir(papers_dir), key=lambda entry: entry.name):
+        if (
+            entry.is_dir()
+            and os.path.isfile(os.path.join(entry.path, html_file_name))
+            and os.path.isfile(os.path.join(entry.path, json_file_name))
+        ):
+            paper_ids.append(entry.name)
+    return paper_ids
+
+
+def record_annotation_metrics(result: dict) -> None:
+    """
+    Record the metrics of an annotation made by a worker process (see _annotate_one) in this process.
+    """
+    if result["status"] == "ok":
+        metrics.record("annotate", paper=result["paper_id"], seconds=result["elapsed_seconds"], flaws=result["flaws"], **result["located"])
+    else:
+        metrics.record("annotate", paper=result["paper_id"], failed=True, error=result["error"])
+
+
+def _init_worker(template_directory, template_file, fuzzy_anchors, bytecode_cache_dir, flaw_data):
+    global _worker_annotator
+    # The parent records the metrics of every result, a forked worker must not record them again
+    metrics.enabled = False
+    _worker_annotator = HTMLAnnotator(
+        template_directory=template_directory,
+        template_file=template_file,
+        fuzzy_anchors=fuzzy_anchors,
+        bytecode_cache_dir=bytecode_cache_dir,
+        flaw_data=flaw_data
+    )
+    # Compile (or load from the bytecode cache) before the first paper arrives
+    _worker_annotator._get_template()
+
+
+def _annotate_one(paper_dir, html_file_name, json_file_name, annotated_file_name):
+    result = {
+        "paper_id": os.path.basename(paper_dir),
+        "status": "error",
+        "flaws": 0,
+        "located": None,
+        "path": None,
+        "error": None,
+        "elapsed_seconds": None,
+    }
+    start = time.perf_counter()
+    try:
+        _worker_annotator.load_html(html_directory=paper_dir, html_file=html_file_name)
+        _worker_annotator.load_flaws(json_directory=paper_dir, json_file=json_file_name)
+        _worker_annotator.annotate_html()
+        _worker_annotator.save_annotated_html(html_directory=paper_dir, html_file=annotated_file_name)
+        result["flaws"] = len(_worker_annotator.flaws)
+        result["located"] = dict(_worker_annotator.anchor_stats)
+        result["path"] = os.path.join(paper_dir, annotated_file_name)
+        result["status"] = "ok"
+    except Exception as e:
+        result["error"] = str(e)
+    result["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+class HTML_BatchAnnotator:
+
+    def __init__(
+        self,
+        papers_dir,
+        html_file_name,
+        json_file_name,
+        annotated_file_name,
+        template_directory,
+        template_file,
+        fuzzy_anchors=True,
+        bytecode_cache_dir=None,
+        flaw_data="inline",
+        max_workers=None,
+        max_in_flight=None,
+    ):
+        """
+        Annotate every paper of a corpus with its flaws, across a process pool.
+
+        Every paper `<papers_dir>/<paper_id>/<html_file_name>` with its flaws
+        `<papers_dir>/<paper_id>/<json_file_name>` is annotated like `run_html_annotator.py` and
+        written to `<papers_dir>/<paper_id>/<annotated_file_name>`. Each worker process compiles
+        the template once (from the Jinja bytecode cache if `bytecode_cache_dir` is set) and
+        reuses it for all its papers, and at most `max_in_flight` papers are queued at once.
+
+        Args:
+            papers_dir (str): Root directory of the corpus.
+            html_file_name (str): File name of each cleaned paper (e.g. 'paper.html').
+            json_file_name (str): File name of each flaws file (e.g. 'flaws.json').
+            annotated_file_name (str): File name of each annotated paper (e.g. 'annotated.html').
+            template_directory (str): Directory of the Jinja template.
+            template_file (str): File name of the Jinja template.
+            fuzzy_anchors (bool): See HTMLAnnotator.
+            bytecode_cache_dir (str): Optional directory of the Jinja bytecode cache.
+            flaw_data (str): Where the flaw details go, see HTMLAnnotator.
+            max_workers (int): Number of worker processes (defaults to the number of CPU cores).
+            max_in_flight (int): Maximum number of submitted papers not finished yet (defaults to 2 per worker).
+        """
+        self.papers_dir = papers_dir
+        self.html_file_name = html_file_name
+        self.json_file_name = json_file_name
+        self.annotated_file_name = annotated_file_name
+        self.template_directory = template_directory
+        self.template_file = template_file
+        self.fuzzy_anchors = fuzzy_anchors
+        self.bytecode_cache_dir = bytecode_cache_dir
+        self.flaw_data = flaw_data
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_in_flight = max(max_in_flight or 2 * self.max_workers, 1)
+        self.results = []
+
+    def annotate_all(self, paper_ids: list = None) -> list:
+        """
+        Annotate every paper (or only `paper_ids`).
+
+        Returns:
+            list: One result dict per paper, in input order.
+        """
+        if paper_ids is None:
+            paper_ids = find_papers(self.papers_dir, self.html_file_name, self.json_file_name)
+        print(f"[*] Annotating {len(paper_ids)} papers with {self.max_workers} workers")
+
+        results = {}
+        start = time.perf_counter()
+        with ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_worker,
+            initargs=(
+                self.template_directory, self.template_file, self.fuzzy_anchors, self.bytecode_cache_dir, self.flaw_data
+            )
+        ) as executor:
+            pending = set()
+            for paper_id in paper_ids:
+                # Bounded queue: wait for a paper to finish before submitting more
+                if len(pending) >= self.max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect(done, results)
+                pending.add(executor.submit(
+                    _annotate_one,
+                    os.path.join(self.papers_dir, paper_id),
+                    self.html_file_name,
+                    self.json_file_name,
+                    self.annotated_file_name
+                ))
+            self._collect(pending, results)
+
+        self.results = [results[paper_id] for paper_id in paper_ids]
+        succeeded = sum(1 for result in self.results if result["status"] == "ok")
+        elapsed = time.perf_counter() - start
+        print(f"[+] Annotated {succeeded}/{len(self.results)} papers in {elapsed:.1f}s")
+        return self.results
+
+    def _collect(self, futures, results):
+        for future in futures:
+            result = future.result()
+            results[result["paper_id"]] = result
+            record_annotation_metrics(result)
+            if result["status"] == "ok":
+                print(f"[+] {result['paper_id']}: {result['flaws']} flaws ({result['elapsed_seconds']}s)")
+            else:
+                print(f"[-] {result['paper_id']}: {result['error']}")
+
+    def save_report(self, directory, filename) -> str:
+        """
+        Save the per-paper status report as JSON.
+        """
+        if not self.results:
+            raise ValueError("[-] No results available. Please call annotate_all() first.")
+        return save_json_to_file(data=self.results, directory=directory, filename=filename)
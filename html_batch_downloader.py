@@ -0,0 +1,289 @@
+import os
+import re
+import time
+import random
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html_downloader import HTML_Downloader
+from utils import save_json_to_file
+from metrics import metrics
+
+ARXIV_HTML_BASE_URL = "https://arxiv.org/html/"
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def normalize_arxiv_url(url_or_id: str) -> str:
+    """
+    Turn an arXiv ID (e.g. '2507.22291v2') or URL into an arXiv HTML URL.
+
+    Args:
+        url_or_id (str): An arXiv ID, an arXiv abs/html URL or any other URL.
+
+    Returns:
+        str: The URL to download.
+    """
+    url_or_id = url_or_id.strip()
+    if not url_or_id.startswith(("http://", "https://")):
+        return ARXIV_HTML_BASE_URL + url_or_id
+    # https://arxiv.org/abs/<id> -> https://arxiv.org/html/<id>
+    return re.sub(r"^(https?://arxiv\.org)/abs/", r"\1/html/", url_or_id).rstrip("/")
+
+
+def paper_id_from_url(url: str) -> str:
+    """
+    Derive a filesystem friendly paper ID from a paper URL (e.g. '2507_22291v2').
+    """
+    return url.rstrip("/").split("/")[-1].replace(".", "_")
+
+
+def read_url_list(filepath: str) -> list:
+    """
+    Reads a list of arXiv URLs or IDs, one per line. Empty lines and lines starting with '#' are ignored.
+
+    Args:
+        filepath (str): Path to the text file.
+
+    Returns:
+        list: The URLs/IDs listed in the file.
+    """
+    if not os.path.isfile(filepath):
+        raise FileNotFoundError(f"[-] File not found: {filepath}")
+
+    with open(filepath, "r", encoding="utf-8") as file:
+        lines = [line.strip() for line in file]
+
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+class HTML_BatchDownloader:
+
+    def __init__(
+        self,
+        html_urls,
+        html_file_name,
+        output_dir,
+        max_workers=8,
+        max_per_host=4,
+        max_retries=4,
+        backoff_factor=1.0,
+        timeout=60,
+        parser_backend="html.parser",
+        cache=None,
+        paragraph_ids=False,
+        streaming=False,
+    ):
+        """
+        Download and clean many arXiv HTML papers concurrently.
+
+        Every paper is written to `<output_dir>/<paper_id>/<html_file_name>` using the same
+        cleaning steps as `HTML_Downloader`, so the output is identical to the single-paper path.
+
+        Args:
+            html_urls (list): arXiv URLs or IDs.
+            html_file_name (str): File name of each cleaned paper (e.g. 'paper.html').
+            output_dir (str): Root directory for all papers.
+            max_workers (int): Number of worker threads.
+            max_per_host (int): Maximum number of in-flight requests per host.
+            max_retries (int): Number of retries on 429/5xx responses and connection errors.
+            backoff_factor (float): Base delay in seconds for exponential backoff.
+            timeout (float): Timeout in seconds for each request.
+            parser_backend (str): Parser backend used to clean the HTML ('html.parser' or 'lxml').
+            cache (DownloadCache): Optional cache for raw and cleaned HTML.
+            paragraph_ids (bool): Stamp block elements with stable paragraph ids.
+            streaming (bool): Clean every paper while it is downloaded (see HTML_Downloader),
+                requires the 'lxml' backend. The cache is not used in this mode.
+        """
+        # Keep the input order but drop duplicates
+        self.html_urls = list(dict.fromkeys(normalize_arxiv_url(url) for url in html_urls))
+        self.html_file_name = html_file_name
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.parser_backend = parser_backend
+        self.cache = cache
+        self.paragraph_ids = paragraph_ids
+        self.streaming = streaming
+        self.results = []
+
+        # Created on first use, papers that are not downloaded again do not need requests
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._host_semaphores = {}
+        self._host_lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                self._session = self._create_session()
+            return self._session
+
+    def _create_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        # One pooled connection per worker, retries are handled in _fetch
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _get_host_semaphore(self, url):
+        host = urlparse(url).netloc
+        with self._host_lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_semaphores[host]
+
+    def _get_backoff_delay(self, attempt, response=None):
+        # Honour Retry-After (in seconds) when the server sends one
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return float(retry_after)
+        return self.backoff_factor * (2 ** attempt) + random.uniform(0, self.backoff_factor)
+
+    def _fetch(self, url, result, headers=None, stream=False):
+        """
+        GET a URL with a per-host concurrency cap and retry with backoff on 429/5xx.
+        The number of attempts is recorded in `result`. With `stream`, the body of the
+        returned response is not read yet.
+
+        Returns:
+            requests.Response: The successful (or 304 Not Modified) response.
+        """
+        import requests
+        semaphore = self._get_host_semaphore(url)
+        attempt = 0
+        while True:
+            attempt += 1
+            result["attempts"] = attempt
+            response = None
+            try:
+                with semaphore:
+                    request_start = time.perf_counter()
+                    response = self.session.get(url, headers=headers, timeout=self.timeout, stream=stream)
+                if metrics.enabled:
+                    # A streamed body is counted by the clean stage
+                    size = {"streamed": True} if stream else {"bytes": len(response.content)}
+                    metrics.record(
+                        "download", labels={"status": str(response.status_code)},
+                        seconds=round(time.perf_counter() - request_start, 6), retry=attempt > 1, **size
+                    )
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    if stream and not response.ok:
+                        response.close()
+                    response.raise_for_status()
+                    return response
+                # Give the connection back to the pool before retrying
+                response.close()
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt > self.max_retries:
+                    raise
+
+            if attempt > self.max_retries:
+                response.raise_for_status()
+
+            # Sleep outside the semaphore so other papers can use the slot
+            delay = self._get_backoff_delay(attempt - 1, response)
+            print(f"[*] Retrying {url} in {delay:.1f}s (attempt {attempt}/{self.max_retries})")
+            time.sleep(delay)
+
+    def _download_one(self, url):
+        with metrics.paper(paper_id_from_url(url)):
+            return self._download_one_paper(url)
+
+    def _download_one_paper(self, url):
+        import requests
+        paper_id = paper_id_from_url(url)
+        result = {
+            "paper_id": paper_id,
+            "url": url,
+            "status": "failed",
+            "http_status": None,
+            "attempts": 0,
+            "bytes": 0,
+            "cache": None,
+            "cleaned_from_cache": False,
+            "elapsed_seconds": 0.0,
+            "path": None,
+            "error": None,
+        }
+        start = time.perf_counter()
+        try:
+            downloader = HTML_Downloader(
+                html_url=url,
+                html_file_name=self.html_file_name,
+                output_dir=os.path.join(self.output_dir, paper_id),
+                session=self.session,
+                timeout=self.timeout,
+                parser_backend=self.parser_backend,
+                cache=self.cache,
+                paragraph_ids=self.paragraph_ids,
+                streaming=self.streaming,
+            )
+            if self.streaming:
+                response = self._fetch(url, result, stream=True)
+                result["http_status"] = response.status_code
+                result["path"], result["bytes"] = downloader.save_html_stream(response)
+            else:
+                if self.cache is None:
+                    response = self._fetch(url, result)
+                    result["http_status"] = response.status_code
+                    result["bytes"] = len(response.content)
+                    raw_html, content_hash = response.text, None
+                else:
+                    def get(headers):
+                        response = self._fetch(url, result, headers=headers)
+                        result["http_status"] = response.status_code
+                        result["bytes"] = len(response.content)
+                        return response
+
+                    raw_html, content_hash, result["cache"] = self.cache.fetch(url, get)
+
+                html_content, result["cleaned_from_cache"] = downloader.process_html_cached(raw_html, content_hash)
+                result["path"] = downloader.save_html(html_content)
+            result["status"] = "ok"
+        except requests.HTTPError as e:
+            result["http_status"] = e.response.status_code if e.response is not None else None
+            result["error"] = str(e)
+        except Exception as e:
+            result["error"] = str(e)
+        result["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+        return result
+
+    def download_all(self) -> list:
+        """
+        Download, clean and save every paper.
+
+        Returns:
+            list: One result dict per paper, in input order.
+        """
+        print(f"[*] Downloading {len(self.html_urls)} papers with {self.max_workers} workers")
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._download_one, url): url for url in self.html_urls}
+            for future in as_completed(futures):
+                result = future.result()
+                results[result["url"]] = result
+                if result["status"] == "ok":
+                    print(f"[+] {result['paper_id']} ({result['elapsed_seconds']}s)")
+                else:
+                    print(f"[-] {result['paper_id']}: {result['error']}")
+
+        self.results = [results[url] for url in self.html_urls]
+        succeeded = sum(1 for result in self.results if result["status"] == "ok")
+        print(f"[+] Downloaded {succeeded}/{len(self.results)} papers")
+        return self.results
+
+    def save_report(self, directory, filename) -> str:
+        """
+        Save the per-paper status report as JSON.
+        """
+        if not self.results:
+            raise ValueError("[-] No results available. Please call download_all() first.")
+        return save_json_to_file(data=self.results, directory=directory, filename=filename)
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from pipeline import STAGES
+from html_batch_downloader import normalize_arxiv_url
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+
+class JobQueue:
+
+    def __init__(self, queue_path: str, max_attempts: int = 3):
+        """
+        Durable SQLite queue of pipeline jobs, shared by the worker and the processes adding jobs.
+
+        A job is one paper (arXiv URL or ID) and the stages to run on it. Jobs are claimed in the
+        order they were added and stay 'running' until they are marked 'done' or 'failed', so a
+        job of a worker that was killed is still in the queue: `recover` queues it again when the
+        next worker starts (the stages it had finished are skipped through the paper manifest).
+        A job interrupted `max_attempts` times is marked failed instead, so a paper that crashes
+        the worker is not retried forever. Two jobs of the same paper never run at the same time.
+
+        Args:
+            queue_path (str): Path of the SQLite file (e.g. './Cache/jobs.sqlite').
+            max_attempts (int): Number of times a job is claimed before it is given up.
+        """
+        self.queue_path = queue_path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(queue_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Autocommit, claims take the write lock explicitly. WAL lets readers work during a claim.
+        self._db = sqlite3.connect(queue_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                stages TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                result TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+        """)
+
+    def enqueue(self, url: str, stages=None) -> int:
+        """
+        Add a job.
+
+        Args:
+            url (str): arXiv URL or ID of the paper.
+            stages (list): Stages to run (see PaperPipeline.submit), all of them if None.
+
+        Returns:
+            int: The job id.
+        """
+        stages = STAGES if stages is None else stages
+        unknown = [stage for stage in stages if stage not in STAGES]
+        if unknown or not stages:
+            raise ValueError(f"[-] Unknown stages {unknown}. Choose among {STAGES}.")
+        # Stored in pipeline order
+        stages = [stage for stage in STAGES if stage in stages]
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (url, stages, status, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+                (normalize_arxiv_url(url), json.dumps(stages), now, now)
+            )
+        return cursor.lastrowid
+
+    def claim(self):
+        """
+        Take the oldest queued job whose paper has no running job, and mark it running.
+
+        Returns:
+            dict: {"id", "url", "stages", "attempts"}, or None if no job can be claimed.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, url, stages, attempts FROM jobs WHERE status = 'queued' "
+                    "AND url NOT IN (SELECT url FROM jobs WHERE status = 'running') ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                        (time.time(), row[0])
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"id": row[0], "url": row[1], "stages": json.loads(row[2]), "attempts": row[3] + 1}
+
+    def complete(self, job_id: int, result: dict = None) -> None:
+        """
+        Mark a job done, with the result of its paper (e.g. the status of every stage).
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'done', error = NULL, result = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(result or {}), time.time(), job_id)
+            )
+
+    def fail(self, job_id: int, error: str, result: dict = None) -> None:
+        """
+        Mark a job failed (see `retry_failed` to run the failed jobs again).
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, result = ?, updated_at = ? WHERE id = ?",
+                (str(error), json.dumps(result or {}), time.time(), job_id)
+            )
+
+    def recover(self) -> int:
+        """
+        Queue again the jobs left running by a worker that did not stop cleanly. Call it before
+        a worker starts claiming jobs, while no other worker uses the queue.
+
+        Returns:
+            int: The number of jobs queued again.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE status = 'running' AND attempts >= ?",
+                    (f"interrupted {self.max_attempts} times", now, self.max_attempts)
+                )
+                recovered = self._db.execute(
+                    "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'", (now,)
+                ).rowcount
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return recovered
+
+    def retry_failed(self) -> int:
+        """
+        Queue the failed jobs again, with a new budget of attempts.
+
+        Returns:
+            int: The number of jobs queued again.
+        """
+        with self._lock:
+            return self._db.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, error = NULL, updated_at = ? WHERE status = 'failed'",
+                (time.time(),)
+            ).rowcount
+
+    def counts(self) -> dict:
+        """
+        Number of jobs per status.
+        """
+        counts = {status: 0 for status in JOB_STATUSES}
+        with self._lock:
+            for status, count in self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall():
+                counts[status] = count
+        return counts
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
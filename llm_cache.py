@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class LLMResponseCache:
+
+    def __init__(self, cache_path: str, ttl_hours: float = None, max_size_mb: float = 512):
+        """
+        Persistent SQLite cache of LLM responses.
+
+        Entries are keyed by a hash of (model name, full prompt text, generation config) and store
+        the raw response text plus its usage metadata. Entries older than `ttl_hours` are treated
+        as missing, and least recently used entries are evicted once the cache exceeds `max_size_mb`.
+
+        Args:
+            cache_path (str): Path of the SQLite file (e.g. './Cache/gemini_responses.sqlite').
+            ttl_hours (float): Time to live of an entry in hours. None keeps entries forever.
+            max_size_mb (float): Maximum size of the cached responses in megabytes.
+        """
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_hours * 3600 if ttl_hours is not None else None
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(cache_path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                text TEXT NOT NULL,
+                usage_metadata TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_access ON responses (last_access);
+            CREATE INDEX IF NOT EXISTS responses_created ON responses (created_at);
+        """)
+        self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, config: dict = None) -> str:
+        """
+        Hash of the model name, the full prompt text and the generation config.
+        """
+        payload = json.dumps({"model": model, "prompt": prompt, "config": config or {}}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """
+        Return the cached response for a key, or None if it is missing or expired.
+
+        Returns:
+            dict: {"text": str, "usage_metadata": dict, "created_at": float}
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text, usage_metadata, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds is not None and now - row[2] > self.ttl_seconds:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        return {"text": row[0], "usage_metadata": json.loads(row[1]), "created_at": row[2]}
+
+    def put(self, key: str, model: str, text: str, usage_metadata: dict = None) -> None:
+        """
+        Store a response, then evict expired and least recently used entries.
+        """
+        now = time.time()
+        usage_json = json.dumps(usage_metadata or {})
+        size = len(text.encode("utf-8")) + len(usage_json)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, text, usage_metadata, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, text, usage_json, size, now, now)
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now):
+        # Called with the lock held
+        if self.ttl_seconds is not None:
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+
+        total_size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total_size -= size
+            if total_size <= self.max_size_bytes:
+                break
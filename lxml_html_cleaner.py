@@ -0,0 +1,266 @@
+import re
+from html_downloader import (
+    UNWANTED_TAGS,
+    LAYOUT_TAGS,
+    STRIP_PLACEHOLDERS,
+    MAX_PLACEHOLDER_LENGTH,
+    EMPTY_CONTAINER_TAGS,
+    CONTENT_TAGS,
+    collapse_whitespace_runs,
+    is_removed_attribute,
+    rewrite_citation_href,
+)
+
+REMOVED_TAGS = {"img", *UNWANTED_TAGS, *LAYOUT_TAGS}
+# Tags BeautifulSoup renders as <tag/>
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta",
+    "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex",
+    "nextid", "spacer",
+}
+# Attributes BeautifulSoup treats as whitespace separated lists
+LIST_ATTRIBUTES = {"class", "accesskey", "dropzone", "rel", "rev", "headers", "accept-charset", "archive", "sizes", "sandbox", "for"}
+PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+# Text inside these tags is not visible text for get_text()
+INVISIBLE_TEXT_TAGS = {"script", "style", "template"}
+ASCII_WHITESPACE = " \t\n\r\f"
+ESCAPE_PATTERN = re.compile(r"[&<>]")
+ESCAPES = {"&": "&amp;", "<": "&lt;", ">": "&gt;"}
+
+
+class LxmlHTMLCleaner:
+
+    def __init__(self):
+        """
+        Runs the `HTML_Downloader` cleaning pipeline on an lxml (libxml2) tree.
+
+        All rules (image and figure caption removal, citation link rewriting and the rules of
+        `HTML_Downloader._clean_html`) are fused into one walk over the document, and the result
+        is serialized the same way BeautifulSoup does. Requires the optional `lxml` package.
+        """
+        try:
+            import lxml.html
+            from lxml import etree
+        except ImportError:
+            raise ImportError("[-] The 'lxml' parser backend requires lxml. Install it with `pip install lxml`.")
+        self._lxml_html = lxml.html
+        self._comment = etree.Comment
+
+    def clean(self, raw_html: str) -> str:
+        """
+        Clean a raw arXiv HTML page.
+
+        Args:
+            raw_html (str): The raw HTML as returned by arxiv.org.
+
+        Returns:
+            str: The cleaned HTML.
+        """
+        return self._clean_document(self._lxml_html.document_fromstring(raw_html))
+
+    def _clean_document(self, document):
+        article = self._clean_tree(document)
+
+        if article is not None:
+            html_str = self._serialize(article)
+        else:
+            doctype = document.getroottree().docinfo.doctype
+            html_str = (doctype + "\n" if doctype else "") + self._serialize(document)
+
+        # Remove multiple empty lines (2 or more → 1)
+        html_str = re.sub(r'\n\s*\n+', '\n', html_str)
+
+        # Trim leading/trailing whitespace
+        html_str = html_str.strip()
+
+        return collapse_whitespace_runs(html_str)
+
+    def _clean_tree(self, document):
+        """
+        Clean the document in place and return the <article> element (None if there is none).
+
+        Pre-order visits remove images, unwanted tags and figure captions, rewrite citation
+        links, collapse whitespace-only text like BeautifulSoup does while parsing and find
+        the <article>. Post-order visits inside the <article> apply the rules of
+        `HTML_Downloader._clean_tree`. If there is no <article> the post-order rules are
+        applied to the whole document in a second walk.
+        """
+        article = None
+        node_info = {}
+        # (element, children done, inside <pre>/<textarea>, inside <article>)
+        stack = [(document, False, False, False)]
+        while stack:
+            element, children_done, in_pre, in_article = stack.pop()
+            if children_done:
+                self._clean_children(element, node_info, is_root=element is article)
+                continue
+
+            if element.tag in REMOVED_TAGS or (
+                element.tag == "figcaption" and self._get_text(element).lower().startswith("figure")
+            ):
+                element.drop_tree()
+                continue
+
+            if element.tag == "a" and element.get("href"):
+                element.set("href", rewrite_citation_href(element.get("href")))
+
+            if article is None and element.tag == "article":
+                article = element
+                in_article = True
+
+            in_pre = in_pre or element.tag in PRESERVE_WHITESPACE_TAGS
+            if not in_pre:
+                element.text = self._collapse_whitespace(element.text)
+
+            if in_article:
+                stack.append((element, True, in_pre, in_article))
+            children = []
+            for child in element:
+                if not in_pre:
+                    child.tail = self._collapse_whitespace(child.tail)
+                if child.tag is not self._comment:
+                    children.append((child, False, in_pre, in_article))
+            stack.extend(reversed(children))
+
+        if article is None:
+            stack = [(document, False)]
+            while stack:
+                element, children_done = stack.pop()
+                if children_done:
+                    self._clean_children(element, node_info, is_root=False)
+                    continue
+                stack.append((element, True))
+                stack.extend((child, False) for child in element if child.tag is not self._comment)
+            node_info.clear()
+
+        return article
+
+    def _clean_children(self, element, node_info, is_root):
+        """
+        Post-order step for one element: see `HTML_Downloader._clean_tree`.
+        """
+        if not is_root:
+            for attr in list(element.attrib):
+                if is_removed_attribute(attr):
+                    del element.attrib[attr]
+
+        text = ""
+        has_text = False
+        has_content = False
+        child_elements = []
+        meaningful_children = []
+
+        # BeautifulSoup children: the element text, then every child followed by its tail
+        children = [(None, element.text)] + [(child, child.tail) for child in element]
+        for child, run in children:
+            if child is not None and child.tag is self._comment:
+                if child.text and child.text.strip():
+                    meaningful_children.append(child)
+            elif child is not None:
+                child_text, child_has_text, child_has_content, child_unwrap = node_info.pop(child)
+                text = None if text is None or child_text is None else text + child_text
+                if child_text in STRIP_PLACEHOLDERS:
+                    child.drop_tree()
+                else:
+                    has_text = has_text or child_has_text
+                    has_content = has_content or child_has_content or child.tag in CONTENT_TAGS
+                    child_elements.append((child, child_has_text, child_has_content, child_unwrap))
+                    meaningful_children.append(child)
+
+            if run:
+                stripped = run.strip()
+                if stripped:
+                    has_text = True
+                    text = None if text is None else text + stripped
+                    meaningful_children.append(run)
+            if text is not None and len(text) > MAX_PLACEHOLDER_LENGTH:
+                text = None
+
+        for child, child_has_text, child_has_content, child_unwrap in child_elements:
+            if child.tag in EMPTY_CONTAINER_TAGS and not child_has_text and not child_has_content:
+                child.drop_tree()
+            elif child_unwrap:
+                child.drop_tag()
+
+        # A span is unwrapped if it only wraps another span, or if it has no attributes left
+        unwrap = element.tag == "span" and (
+            len(element.attrib) == 0
+            or (len(meaningful_children) == 1 and getattr(meaningful_children[0], "tag", None) == "span")
+        )
+        node_info[element] = (text, has_text, has_content, unwrap)
+
+    def _get_text(self, element):
+        """
+        Same as BeautifulSoup's get_text(strip=True): every text node stripped and joined.
+        """
+        parts = []
+        stack = [element]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                parts.append(item.strip())
+                continue
+            if item is not element and item.tail:
+                stack.append(item.tail)
+            if item.tag is not self._comment and item.tag not in INVISIBLE_TEXT_TAGS:
+                if item.text:
+                    parts.append(item.text.strip())
+                stack.extend(reversed(item))
+        return "".join(parts)
+
+    def _collapse_whitespace(self, text):
+        # BeautifulSoup replaces text made only of ASCII whitespace by a single newline or space
+        if not text or text.strip(ASCII_WHITESPACE):
+            return text
+        return "\n" if "\n" in text else " "
+
+    def _serialize(self, element):
+        """
+        Serialize an element the way BeautifulSoup's str() does with the default formatter.
+        """
+        parts = []
+        stack = [element]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                parts.append(item)
+                continue
+            # The tail follows the element (and its closing tag)
+            if item is not element and item.tail:
+                stack.append(self._escape(item.tail))
+            if item.tag is self._comment:
+                parts.append(f"<!--{item.text or ''}-->")
+                continue
+
+            parts.append(self._open_tag(item))
+            if item.tag in VOID_TAGS and not item.text and len(item) == 0:
+                parts.append("/>")
+                continue
+            parts.append(">")
+            if item.text:
+                parts.append(self._escape(item.text))
+            stack.append(f"</{item.tag}>")
+            stack.extend(reversed(item))
+        return "".join(parts)
+
+    def _open_tag(self, item):
+        """
+        The start tag of an element without its closing '>' (BeautifulSoup closes void tags with '/>').
+        """
+        parts = [f"<{item.tag}"]
+        # BeautifulSoup's default formatter writes the attributes sorted by name
+        for name, value in sorted(item.attrib.items()):
+            if name in LIST_ATTRIBUTES:
+                value = " ".join(value.split())
+            parts.append(f" {name}={self._quote_attribute(self._escape(value))}")
+        return "".join(parts)
+
+    def _escape(self, text):
+        return ESCAPE_PATTERN.sub(lambda match: ESCAPES[match.group(0)], text)
+
+    def _quote_attribute(self, value):
+        if '"' in value:
+            if "'" in value:
+                return '"' + value.replace('"', "&quot;") + '"'
+            return "'" + value + "'"
+        return '"' + value + '"'
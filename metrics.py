@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import threading
+import contextlib
+import contextvars
+from numbers import Number
+
+METRIC_PREFIX = "flaw_detection"
+# Token counts of the Gemini usage metadata recorded for every LLM call
+USAGE_FIELDS = (
+    "prompt_token_count",
+    "candidates_token_count",
+    "cached_content_token_count",
+    "thoughts_token_count",
+    "total_token_count",
+)
+
+# Paper the current thread / asyncio task works on, attached to every record
+_current_paper = contextvars.ContextVar("current_paper", default=None)
+
+
+class Metrics:
+
+    def __init__(self):
+        """
+        Per-stage instrumentation: timings and counters of the download, clean, llm and annotate
+        stages, attributed to the paper being processed.
+
+        Every `record` call appends one JSON line (timestamp, stage, paper, labels and values) to
+        `jsonl_path` and adds its numeric values to per-stage counters, which `write_prometheus`
+        saves in the Prometheus text format (e.g. for the node exporter textfile collector).
+        Disabled by default: `record` then returns immediately, callers with costly values check
+        `metrics.enabled` first.
+        """
+        self.enabled = False
+        self.jsonl_path = None
+        self.prometheus_path = None
+        # (stage, labels) -> {value name: sum}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_pid = None
+
+    def configure(self, enabled: bool = True, jsonl_path: str = None, prometheus_path: str = None) -> None:
+        """
+        Enable (or disable) the instrumentation and set where it is written.
+
+        Args:
+            enabled (bool): Record anything at all.
+            jsonl_path (str): JSON lines file the records are appended to (None to keep them in memory only).
+            prometheus_path (str): Prometheus text file written by `write_prometheus` (None to disable).
+        """
+        self.close()
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self._counters = {}
+
+    @contextlib.contextmanager
+    def paper(self, paper_id: str):
+        """
+        Attribute the records of this block (thread or asyncio task) to a paper.
+        """
+        token = _current_paper.set(paper_id)
+        try:
+            yield
+        finally:
+            _current_paper.reset(token)
+
+    def record(self, stage: str, labels: dict = None, paper: str = None, **values) -> None:
+        """
+        Record one event of a stage.
+
+        Args:
+            stage (str): Stage name (e.g. 'download', 'clean', 'llm', 'annotate').
+            labels (dict): Low-cardinality string labels (e.g. {"model": ...}) of the counters.
+            paper (str): Paper ID, defaults to the one set with `paper()`.
+            **values: Values of the event. Numbers (seconds, bytes, tokens, ...) are summed
+                into the counters, other values only go to the JSON lines.
+        """
+        if not self.enabled:
+            return
+        labels = labels or {}
+        entry = {"ts": round(time.time(), 3), "stage": stage, "paper": paper or _current_paper.get()}
+        entry.update(labels)
+        entry.update(values)
+        key = (stage, tuple(sorted(labels.items())))
+        with self._lock:
+            counters = self._counters.setdefault(key, {"calls": 0})
+            counters["calls"] += 1
+            for name, value in values.items():
+                if isinstance(value, Number):
+                    counters[name] = counters.get(name, 0) + value
+            if self.jsonl_path:
+                self._get_file().write(json.dumps(entry) + "\n")
+
+    def counters(self) -> dict:
+        """
+        The counters summed so far, as {"<stage>{labels}": {value name: sum}}.
+        """
+        with self._lock:
+            return {
+                stage + json.dumps(dict(labels), sort_keys=True) if labels else stage: dict(values)
+                for (stage, labels), values in self._counters.items()
+            }
+
+    def write_prometheus(self, path: str = None):
+        """
+        Save the counters in the Prometheus text exposition format, as
+        `flaw_detection_<value>_total{stage="...",<labels>}`.
+
+        Returns:
+            str: The path written, or None if there is nothing to write.
+        """
+        path = path or self.prometheus_path
+        if not self.enabled or not path:
+            return None
+        series = {}
+        with self._lock:
+            for (stage, labels), values in self._counters.items():
+                label_text = ",".join(
+                    f'{name}="{_escape_label(value)}"' for name, value in (("stage", stage),) + labels
+                )
+                for name, value in values.items():
+                    value = round(value, 6) if isinstance(value, float) else int(value)
+                    series.setdefault(f"{METRIC_PREFIX}_{name}_total", []).append(f"{{{label_text}}} {value}")
+
+        lines = []
+        for metric_name in sorted(series):
+            lines.append(f"# TYPE {metric_name} counter")
+            lines.extend(f"{metric_name}{sample}" for sample in series[metric_name])
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Written atomically so a collector never reads half a file
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temp_path, path)
+        return path
+
+    def close(self) -> None:
+        """
+        Flush the JSON lines and write the Prometheus file.
+        """
+        self.write_prometheus()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _get_file(self):
+        # Reopened in a forked process, which must not share the buffer of its parent
+        if self._file is None or self._file_pid != os.getpid():
+            directory = os.path.dirname(self.jsonl_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.jsonl_path, "a", encoding="utf-8", buffering=1)
+            self._file_pid = os.getpid()
+        return self._file
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def usage_values(usage_metadata: dict) -> dict:
+    """
+    The token counts of a usage metadata dict (see GeminiClient.last_usage_metadata), missing ones as 0.
+    """
+    return {field: (usage_metadata or {}).get(field) or 0 for field in USAGE_FIELDS}
+
+
+def summarize_metrics(jsonl_path: str) -> dict:
+    """
+    Sum the numeric values of a JSON lines metrics file per paper and stage, e.g. to attribute
+    time and tokens to each paper.
+
+    Returns:
+        dict: Paper ID (or "unattributed") -> stage -> {"calls": ..., value name: sum}.
+    """
+    if not os.path.isfile(jsonl_path):
+        raise FileNotFoundError(f"[-] Metrics file not found: {jsonl_path}")
+
+    summary = {}
+    with open(jsonl_path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            stage = summary.setdefault(entry.get("paper") or "unattributed", {}).setdefault(entry["stage"], {"calls": 0})
+            stage["calls"] += 1
+            for name, value in entry.items():
+                if name != "ts" and isinstance(value, Number):
+                    stage[name] = round(stage.get(name, 0) + value, 6)
+    return summary
+
+
+# Instrumentation shared by all modules, configured by the run scripts
+metrics = Metrics()
@@ -0,0 +1,151 @@
+from bs4 import BeautifulSoup, Tag, NavigableString, CData
+from html_downloader import PARAGRAPH_ID_ATTRIBUTE
+from utils import estimate_tokens
+
+PAPER_SERIALIZATIONS = ("html", "compact")
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+# Tags that start a new paragraph in the compact serialization
+BLOCK_TAGS = {
+    "article", "section", "div", "p", "figure", "figcaption", "blockquote", "pre", "ul", "ol", "dl", "dt", "dd",
+    "li", "table", "tr", "nav", "header", "footer", "main", "aside", "address", "hr", "br",
+}
+TEXT_STRING_TYPES = (NavigableString, CData)
+
+
+class _CompactWriter:
+    """
+    Collects inline text into paragraphs, each paragraph optionally starting with a prefix ('## ', '- ').
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self._parts = []
+        self._prefix = ""
+
+    def write(self, text):
+        self._parts.append(text)
+
+    def start_block(self, prefix=""):
+        if "".join(self._parts).strip():
+            self.end_block()
+        else:
+            # Nothing written yet, e.g. a <p> directly inside a <li>: keep the pending prefix
+            self._parts = []
+            prefix = self._prefix + prefix
+        self._prefix = prefix
+
+    def end_block(self):
+        # Visible text: collapse all whitespace, like a browser renders it
+        text = " ".join("".join(self._parts).split())
+        if text:
+            self.blocks.append(self._prefix + text)
+        self._parts = []
+        self._prefix = ""
+
+
+def html_to_compact_text(html_content: str) -> str:
+    """
+    Serialize a cleaned arXiv HTML paper as lightweight Markdown for the prompt.
+
+    Headings become '#' headings, paragraphs are separated by blank lines, list items start
+    with '- ', tables are flattened to one '| cell | cell |' line per row and math is kept as
+    its LaTeX `alttext` between '$' signs. Links, ids and all other tags are dropped. The
+    wording of every paragraph is the visible text of the HTML, so 'start_of_flaw' and
+    'end_of_flaw' quoted by the model can still be found in the HTML by the annotator.
+    Blocks stamped with a paragraph id (see html_downloader.stamp_paragraph_ids) start with
+    their id in brackets, e.g. '[p12] ', so the model can cite them instead.
+
+    Args:
+        html_content (str): The cleaned HTML of the paper.
+
+    Returns:
+        str: The compact text of the paper.
+    """
+    soup = BeautifulSoup(html_content, "html.parser")
+    writer = _CompactWriter()
+    _write_node(soup, writer)
+    writer.end_block()
+    return "\n\n".join(writer.blocks)
+
+
+def serialize_paper(html_content: str, mode: str = "html") -> str:
+    """
+    Serialize the paper for the prompt and report the estimated token reduction.
+
+    Args:
+        html_content (str): The cleaned HTML of the paper.
+        mode (str): 'html' to send the HTML as is, 'compact' for `html_to_compact_text`.
+
+    Returns:
+        str: The serialized paper.
+    """
+    if mode not in PAPER_SERIALIZATIONS:
+        raise ValueError(f"[-] Unknown paper serialization '{mode}'. Choose one of {PAPER_SERIALIZATIONS}.")
+    if mode == "html":
+        return html_content
+
+    paper = html_to_compact_text(html_content)
+    html_tokens = estimate_tokens(html_content)
+    paper_tokens = estimate_tokens(paper)
+    reduction = 100 * (1 - paper_tokens / html_tokens) if html_tokens else 0
+    print(f"[+] Compact paper: ~{paper_tokens} tokens instead of ~{html_tokens} ({reduction:.0f}% fewer)")
+    return paper
+
+
+def _write_node(node, writer):
+    for child in node.children:
+        if isinstance(child, Tag):
+            _write_tag(child, writer)
+        elif type(child) in TEXT_STRING_TYPES:
+            writer.write(str(child))
+
+
+def _write_tag(tag, writer):
+    if tag.name == "math":
+        latex = tag.get("alttext") or tag.get_text(" ", strip=True)
+        if tag.get("display") == "block":
+            writer.start_block()
+            writer.write(f"$${latex}$$")
+            writer.end_block()
+        else:
+            writer.write(f" ${latex}$ ")
+    elif tag.name == "table":
+        writer.end_block()
+        for row in tag.find_all("tr"):
+            # Nested tables are flattened into the cells of their parent row
+            if row.find_parent("table") is not tag:
+                continue
+            cells = [_cell_text(cell) for cell in row.find_all(["td", "th"]) if cell.find_parent("tr") is row]
+            if any(cells):
+                writer.blocks.append("| " + " | ".join(cells) + " |")
+    elif tag.name in HEADING_TAGS:
+        writer.start_block("#" * HEADING_TAGS[tag.name] + " " + _paragraph_marker(tag))
+        _write_node(tag, writer)
+        writer.end_block()
+    elif tag.name == "li":
+        writer.start_block("- " + _paragraph_marker(tag))
+        _write_node(tag, writer)
+        writer.end_block()
+    elif tag.name in BLOCK_TAGS:
+        writer.start_block(_paragraph_marker(tag))
+        _write_node(tag, writer)
+        writer.end_block()
+    else:
+        _write_node(tag, writer)
+
+
+def _paragraph_marker(tag):
+    paragraph_id = tag.get(PARAGRAPH_ID_ATTRIBUTE)
+    return f"[{paragraph_id}] " if paragraph_id else ""
+
+
+def _cell_text(cell):
+    text = _inline_text(cell)
+    return _paragraph_marker(cell) + text if text else ""
+
+
+def _inline_text(tag):
+    writer = _CompactWriter()
+    _write_node(tag, writer)
+    writer.end_block()
+    return " ".join(writer.blocks).replace("|", "\\|")
@@ -0,0 +1,546 @@
+import os
+import json
+import time
+import asyncio
+import signal
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from html_batch_downloader import HTML_BatchDownloader, normalize_arxiv_url, paper_id_from_url
+from html_batch_annotator import _init_worker, _annotate_one, record_annotation_metrics
+from html_downloader import HTML_Downloader
+from download_cache import IMMUTABLE_URL_PATTERN
+from prompt import get_prompt
+from utils import read_html_file, split_prompt, save_json_to_file
+from metrics import metrics
+
+STAGES = ("download", "detect", "annotate")
+# Bump a stage version when its code changes its output, so the stage is re-run for every paper
+STAGE_VERSIONS = {"download": "1", "detect": "1", "annotate": "1"}
+
+
+def file_hash(path: str):
+    """
+    sha256 of a file, or None if it does not exist.
+    """
+    if not os.path.isfile(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def inputs_hash(inputs: dict) -> str:
+    """
+    sha256 of the declared inputs of a stage (content hashes and settings).
+    """
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _init_annotate_worker(*args):
+    # Ctrl+C reaches the whole process group: the parent stops the pool, an interrupted worker would break it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker(*args)
+
+
+class PaperManifest:
+
+    def __init__(self, paper_dir: str, file_name: str = "manifest.json"):
+        """
+        Record of the stages run for one paper: for every stage, the hash of its inputs, its
+        version and the content hash of each output file.
+
+        A stage is up to date when its inputs hash is unchanged and all its outputs still exist
+        with the recorded content (outputs edited by hand are regenerated).
+
+        Args:
+            paper_dir (str): Directory of the paper.
+            file_name (str): File name of the manifest in the paper directory.
+        """
+        self.path = os.path.join(paper_dir, file_name)
+        self.paper_dir = paper_dir
+        self.stages = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as file:
+                    self.stages = json.load(file).get("stages", {})
+            except (json.JSONDecodeError, AttributeError):
+                print(f"[-] Ignoring the unreadable manifest {self.path}")
+
+    def is_up_to_date(self, stage: str, stage_inputs: dict) -> bool:
+        record = self.stages.get(stage)
+        if record is None or record.get("inputs_hash") != inputs_hash(stage_inputs):
+            return False
+        return all(
+            file_hash(os.path.join(self.paper_dir, name)) == content_hash
+            for name, content_hash in record.get("outputs", {}).items()
+        )
+
+    def record(self, stage: str, stage_inputs: dict, outputs: list) -> None:
+        self.stages[stage] = {
+            "version": STAGE_VERSIONS[stage],
+            "inputs_hash": inputs_hash(stage_inputs),
+            "outputs": {name: file_hash(os.path.join(self.paper_dir, name)) for name in outputs},
+            "completed_at": time.time(),
+        }
+        # Write-then-rename so an interrupted run never leaves a truncated manifest
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({"stages": self.stages}, file, indent=4)
+        os.replace(temporary_path, self.path)
+
+
+class PaperPipeline:
+
+    def __init__(
+        self,
+        papers_dir,
+        html_file_name,
+        json_file_name,
+        annotated_file_name,
+        gemini,
+        template_directory,
+        template_file,
+        parser_backend="html.parser",
+        paragraph_ids=False,
+        download_cache=None,
+        download_workers=8,
+        download_max_per_host=4,
+        download_max_retries=4,
+        download_timeout=60,
+        serialization="html",
+        detection_mode="single",
+        chunk_max_tokens=30000,
+        escalation_gemini=None,
+        cascade_min_confidence=3,
+        cascade_escalation_severities=("high",),
+        structured=True,
+        max_rerequests=1,
+        deadline=None,
+        fuzzy_anchors=True,
+        flaw_data="inline",
+        bytecode_cache_dir=None,
+        annotate_workers=None,
+        manifest_file_name="manifest.json",
+        flaw_store=None,
+        planner=None,
+    ):
+        """
+        Incremental download -> detect -> annotate pipeline over many papers.
+
+        Every paper lives in `<papers_dir>/<paper_id>/`. Each stage declares its inputs (content
+        hashes of the files it reads, its settings and its version) and its outputs, recorded
+        in a PaperManifest, and is skipped when they are unchanged: changing only the template
+        re-runs only annotation, a new prompt or model re-runs detection and annotation, and a
+        paper whose cleaned HTML did not change keeps its flaws. Versioned arXiv URLs are not
+        downloaded again, other URLs are revalidated through the download cache.
+
+        Stages run with their own worker pools and a paper moves on as soon as its previous
+        stage finishes: downloads on `download_workers` threads, detection on one event loop
+        shared by all papers (within the concurrency and rate limits of `gemini`) and
+        annotation on `annotate_workers` processes.
+
+        Args:
+            papers_dir (str): Root directory of the papers.
+            html_file_name (str): File name of each cleaned paper (e.g. 'paper.html').
+            json_file_name (str): File name of each flaws file (e.g. 'flaws.json').
+            annotated_file_name (str): File name of each annotated paper (e.g. 'annotated.html').
+            gemini (AsyncGeminiClient): Client of the detection stage.
+            template_directory (str): Directory of the Jinja template.
+            template_file (str): File name of the Jinja template.
+            parser_backend (str): See HTML_Downloader.
+            paragraph_ids (bool): See HTML_Downloader and ChunkedFlawDetector.
+            download_cache (DownloadCache): Optional cache for raw and cleaned HTML.
+            download_workers (int): Number of download threads.
+            download_max_per_host (int): See HTML_BatchDownloader.
+            download_max_retries (int): See HTML_BatchDownloader.
+            download_timeout (float): See HTML_BatchDownloader.
+            serialization (str): 'html' or 'compact', see paper_serializer.serialize_paper.
+            detection_mode (str): 'single', 'chunked', 'cascade' or 'auto' (whole, compact or chunked, as planned by `planner`).
+            chunk_max_tokens (int): See ChunkedFlawDetector.
+            escalation_gemini (AsyncGeminiClient): Client of the stronger model of the 'cascade' mode.
+            cascade_min_confidence (int): See CascadeFlawDetector.
+            cascade_escalation_severities (tuple): See CascadeFlawDetector.
+            structured (bool): See AsyncGeminiClient.generate_flaws.
+            max_rerequests (int): See AsyncGeminiClient.generate_flaws.
+            deadline (float): See AsyncGeminiClient.generate_flaws.
+            fuzzy_anchors (bool): See HTMLAnnotator.
+            flaw_data (str): See HTMLAnnotator.
+            bytecode_cache_dir (str): See HTMLAnnotator.
+            annotate_workers (int): Number of annotation processes (defaults to the number of CPU cores).
+            manifest_file_name (str): File name of the manifest of each paper.
+            flaw_store (FlawStore): Optional store the flaws of every detection are also saved to.
+            planner (BatchPlanner): Preflight of every paper before its detection: with the 'single' mode a
+                paper whose prompt is over the limits fails before it is sent. Required by the 'auto' mode.
+        """
+        self.papers_dir = papers_dir
+        self.html_file_name = html_file_name
+        self.json_file_name = json_file_name
+        self.annotated_file_name = annotated_file_name
+        self.gemini = gemini
+        self.template_directory = template_directory
+        self.template_file = template_file
+        self.parser_backend = parser_backend
+        self.paragraph_ids = paragraph_ids
+        self.download_cache = download_cache
+        self.download_workers = download_workers
+        self.download_max_per_host = download_max_per_host
+        self.download_max_retries = download_max_retries
+        self.download_timeout = download_timeout
+        self.serialization = serialization
+        self.detection_mode = detection_mode
+        self.chunk_max_tokens = chunk_max_tokens
+        if detection_mode == "cascade" and escalation_gemini is None:
+            raise ValueError("[-] The 'cascade' detection mode requires escalation_gemini.")
+        self.escalation_gemini = escalation_gemini
+        self.cascade_min_confidence = cascade_min_confidence
+        self.cascade_escalation_severities = cascade_escalation_severities
+        self.structured = structured
+        self.max_rerequests = max_rerequests
+        self.deadline = deadline
+        self.fuzzy_anchors = fuzzy_anchors
+        self.flaw_data = flaw_data
+        self.bytecode_cache_dir = bytecode_cache_dir
+        self.annotate_workers = annotate_workers or os.cpu_count() or 1
+        self.manifest_file_name = manifest_file_name
+        self.flaw_store = flaw_store
+        if detection_mode == "auto" and planner is None:
+            raise ValueError("[-] The 'auto' detection mode requires a planner.")
+        self.planner = planner
+        self.results = []
+
+        self._cleaner_key = HTML_Downloader(
+            html_url="", html_file_name="", output_dir=papers_dir,
+            parser_backend=parser_backend, paragraph_ids=paragraph_ids
+        ).cleaner_key
+        # Set by start(): (download thread pool, detection event loop, annotation process pool)
+        self._pools = None
+        self._loop_thread = None
+        self._downloader = None
+        self._template_hash = None
+
+    def run(self, html_urls: list) -> list:
+        """
+        Bring every paper up to date.
+
+        Args:
+            html_urls (list): arXiv URLs or IDs.
+
+        Returns:
+            list: One result dict per paper, in input order, with the status of every stage
+                ('ran', 'skipped' or 'failed').
+        """
+        # Keep the input order but drop duplicates
+        html_urls = list(dict.fromkeys(normalize_arxiv_url(url) for url in html_urls))
+        print(f"[*] Running the pipeline on {len(html_urls)} papers")
+        start = time.perf_counter()
+
+        self.start()
+        try:
+            papers = [self.submit(url) for url in html_urls]
+            for paper in papers:
+                paper["done"].wait()
+        finally:
+            self.stop()
+
+        for paper in papers:
+            del paper["done"], paper["requested"]
+        self.results = papers
+        elapsed = time.perf_counter() - start
+        counts = {stage: {} for stage in STAGES}
+        for paper in papers:
+            for stage, status in paper["stages"].items():
+                counts[stage][status] = counts[stage].get(status, 0) + 1
+        print(f"[+] Pipeline finished in {elapsed:.1f}s: {counts}")
+        return self.results
+
+    def start(self) -> None:
+        """
+        Start the worker pools of the stages: the download threads (and their HTTP session),
+        the detection event loop and the annotation processes (which compile the template once).
+
+        `run` starts and stops them around a batch, a long-running caller (see PipelineWorker)
+        starts them once and submits papers as they come. The template hash is read here, so
+        the pools must be restarted after a template change.
+        """
+        if self._pools is not None:
+            return
+        self._downloader = HTML_BatchDownloader(
+            html_urls=[],
+            html_file_name=self.html_file_name,
+            output_dir=self.papers_dir,
+            max_workers=self.download_workers,
+            max_per_host=self.download_max_per_host,
+            max_retries=self.download_max_retries,
+            timeout=self.download_timeout,
+            parser_backend=self.parser_backend,
+            cache=self.download_cache,
+            paragraph_ids=self.paragraph_ids,
+        )
+        self._template_hash = file_hash(os.path.join(self.template_directory, self.template_file))
+
+        # The detection event loop runs in its own thread, shared by all papers
+        loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+        self._loop_thread.start()
+        download_pool = ThreadPoolExecutor(max_workers=self.download_workers)
+        annotate_pool = ProcessPoolExecutor(
+            max_workers=self.annotate_workers,
+            initializer=_init_annotate_worker,
+            initargs=(
+                self.template_directory, self.template_file, self.fuzzy_anchors, self.bytecode_cache_dir, self.flaw_data
+            )
+        )
+        self._pools = (download_pool, loop, annotate_pool)
+
+    def submit(self, url: str, stages=STAGES) -> dict:
+        """
+        Bring one paper up to date in the background, once the pools are started.
+
+        Args:
+            url (str): arXiv URL or ID.
+            stages (tuple): Stages to run (each is still skipped when up to date). The other
+                stages are not run: the outputs recorded in the manifest of the paper are used.
+
+        Returns:
+            dict: The result of the paper, updated as its stages finish. Its "done" event is set
+                once the last requested stage has finished or a stage has failed.
+        """
+        url = normalize_arxiv_url(url)
+        paper = {
+            "paper_id": paper_id_from_url(url),
+            "url": url,
+            "stages": {},
+            "error": None,
+            "done": threading.Event(),
+            "requested": set(stages),
+        }
+        download_pool, _, _ = self._pools
+        download_pool.submit(self._download, self._downloader, paper)
+        return paper
+
+    def stop(self) -> None:
+        """
+        Stop the pools, after the papers submitted so far are done.
+        """
+        if self._pools is None:
+            return
+        download_pool, loop, annotate_pool = self._pools
+        download_pool.shutdown(wait=True)
+        annotate_pool.shutdown(wait=True)
+        loop.call_soon_threadsafe(loop.stop)
+        self._loop_thread.join()
+        loop.close()
+        self._pools = None
+
+    def _paper_dir(self, paper):
+        return os.path.join(self.papers_dir, paper["paper_id"])
+
+    def _fail(self, paper, stage, error):
+        paper["stages"][stage] = "failed"
+        paper["error"] = f"{stage}: {error}"
+        print(f"[-] {paper['paper_id']} {stage}: {error}")
+        paper["done"].set()
+
+    def _is_requested(self, paper, manifest, stage):
+        # A stage that is not requested uses the outputs recorded by a previous run
+        if stage in paper["requested"]:
+            return True
+        if stage not in manifest.stages:
+            self._fail(paper, stage, "not requested and never run")
+        else:
+            self._next_stage(paper, manifest, stage)
+        return False
+
+    def _next_stage(self, paper, manifest, stage):
+        # The paper is done after the last of its requested stages
+        later_stages = STAGES[STAGES.index(stage) + 1:]
+        if not paper["requested"].intersection(later_stages):
+            paper["done"].set()
+        elif stage == "download":
+            self._submit_detect(paper, manifest)
+        else:
+            self._submit_annotate(paper, manifest)
+
+    def _download(self, downloader, paper):
+        try:
+            paper_dir = self._paper_dir(paper)
+            manifest = PaperManifest(paper_dir, self.manifest_file_name)
+            if not self._is_requested(paper, manifest, "download"):
+                return
+            stage_inputs = {"url": paper["url"], "cleaner": self._cleaner_key, "version": STAGE_VERSIONS["download"]}
+            # Only versioned arXiv URLs are immutable, others are revalidated (the download cache makes that cheap)
+            if IMMUTABLE_URL_PATTERN.match(paper["url"]) and manifest.is_up_to_date("download", stage_inputs):
+                paper["stages"]["download"] = "skipped"
+            else:
+                result = downloader._download_one(paper["url"])
+                if result["status"] != "ok":
+                    return self._fail(paper, "download", result["error"])
+                manifest.record("download", stage_inputs, [self.html_file_name])
+                paper["stages"]["download"] = "ran"
+            self._next_stage(paper, manifest, "download")
+        except Exception as e:
+            self._fail(paper, "download", e)
+
+    def _submit_detect(self, paper, manifest):
+        if not self._is_requested(paper, manifest, "detect"):
+            return
+        paper_dir = self._paper_dir(paper)
+        chunked = self.detection_mode in ("chunked", "cascade", "auto")
+        # The 'auto' mode may send the whole paper, its compact text or its sections
+        prompts = [
+            get_prompt(serialization, self.paragraph_ids, section=section)
+            for serialization, section in (
+                [(self.serialization, False), ("compact", False), (self.serialization, True)]
+                if self.detection_mode == "auto" else [(self.serialization, chunked)]
+            )
+        ]
+        stage_inputs = {
+            "paper": manifest.stages["download"]["outputs"][self.html_file_name],
+            "prompt": hashlib.sha256("".join(prompts).encode("utf-8")).hexdigest(),
+            "model": self.gemini.model,
+            "serialization": self.serialization,
+            "detection_mode": self.detection_mode,
+            "chunk_max_tokens": self.chunk_max_tokens if chunked else None,
+            "escalation": [
+                self.escalation_gemini.model, self.cascade_min_confidence, list(self.cascade_escalation_severities)
+            ] if self.detection_mode == "cascade" else None,
+            "request_token_limit": self.planner.request_token_limit if self.detection_mode == "auto" else None,
+            "structured": self.structured,
+            "paragraph_ids": self.paragraph_ids,
+            "version": STAGE_VERSIONS["detect"],
+        }
+        if manifest.is_up_to_date("detect", stage_inputs):
+            paper["stages"]["detect"] = "skipped"
+            return self._next_stage(paper, manifest, "detect")
+
+        _, loop, _ = self._pools
+        future = asyncio.run_coroutine_threadsafe(self._detect(paper_dir), loop)
+
+        def detected(future):
+            try:
+                flaws, failed_chunks = future.result()
+                save_json_to_file(data=flaws, directory=paper_dir, filename=self.json_file_name)
+                if failed_chunks:
+                    # The partial flaws are kept but the stage is not recorded, so the next run detects the paper again
+                    return self._fail(paper, "detect", f"{failed_chunks} chunks failed, partial flaws saved")
+                if self.flaw_store is not None:
+                    self.flaw_store.add_run(paper["paper_id"], flaws, model=self._detection_model())
+                manifest.record("detect", stage_inputs, [self.json_file_name])
+                paper["stages"]["detect"] = "ran"
+                print(f"[+] {paper['paper_id']}: {len(flaws)} flaws")
+                self._next_stage(paper, manifest, "detect")
+            except Exception as e:
+                self._fail(paper, "detect", e)
+
+        future.add_done_callback(detected)
+
+    def _detection_model(self):
+        if self.detection_mode == "cascade":
+            return f"{self.gemini.model}+{self.escalation_gemini.model}"
+        return self.gemini.model
+
+    async def _detect(self, paper_dir):
+        # Runs in its own task, the LLM calls (and chunk tasks) of this paper are attributed to it
+        with metrics.paper(os.path.basename(paper_dir)):
+            return await self._detect_paper(paper_dir)
+
+    async def _detect_paper(self, paper_dir):
+        # Returns the flaws and the number of chunks that failed (their flaws are missing).
+        # The detectors need BeautifulSoup, not imported when every paper is up to date
+        from flaw_detector import ChunkedFlawDetector
+        from cascade_detector import CascadeFlawDetector
+        from paper_serializer import serialize_paper
+        html_content = await asyncio.to_thread(read_html_file, paper_dir, self.html_file_name)
+        detection_mode, serialization = self.detection_mode, self.serialization
+        if self.planner is not None and detection_mode in ("single", "auto"):
+            # Token counting calls the API and may parse the paper, off the event loop
+            detection_mode, serialization, _ = await asyncio.to_thread(
+                self.planner.resolve, html_content, os.path.basename(paper_dir), detection_mode
+            )
+        if detection_mode == "chunked":
+            detector = ChunkedFlawDetector(
+                gemini=self.gemini,
+                serialization=serialization,
+                max_tokens=self.chunk_max_tokens,
+                structured=self.structured,
+                paragraph_ids=self.paragraph_ids,
+                max_rerequests=self.max_rerequests,
+                deadline=self.deadline
+            )
+            flaws = await detector.detect_async(html_content)
+            return flaws, detector.failed_chunks
+        if detection_mode == "cascade":
+            detector = CascadeFlawDetector(
+                gemini=self.gemini,
+                escalation_gemini=self.escalation_gemini,
+                serialization=self.serialization,
+                max_tokens=self.chunk_max_tokens,
+                structured=self.structured,
+                paragraph_ids=self.paragraph_ids,
+                min_confidence=self.cascade_min_confidence,
+                escalation_severities=self.cascade_escalation_severities,
+                max_rerequests=self.max_rerequests,
+                deadline=self.deadline
+            )
+            flaws = await detector.detect_async(html_content)
+            return flaws, detector.failed_chunks
+
+        # The compact serialization parses the paper, off the event loop shared by all papers
+        paper = await asyncio.to_thread(serialize_paper, html_content, serialization)
+        prefix, prompt = split_prompt(prompt=get_prompt(serialization, self.paragraph_ids), html_content=paper)
+        flaws = await self.gemini.generate_flaws(
+            prompt,
+            structured=self.structured,
+            max_rerequests=self.max_rerequests,
+            deadline=self.deadline,
+            prefix=prefix,
+            paragraph_ids=self.paragraph_ids
+        )
+        return flaws, 0
+
+    def _submit_annotate(self, paper, manifest):
+        if not self._is_requested(paper, manifest, "annotate"):
+            return
+        paper_dir = self._paper_dir(paper)
+        stage_inputs = {
+            "paper": manifest.stages["download"]["outputs"][self.html_file_name],
+            "flaws": manifest.stages["detect"]["outputs"][self.json_file_name],
+            "template": self._template_hash,
+            "fuzzy_anchors": self.fuzzy_anchors,
+            "flaw_data": self.flaw_data,
+            "version": STAGE_VERSIONS["annotate"],
+        }
+        if manifest.is_up_to_date("annotate", stage_inputs):
+            paper["stages"]["annotate"] = "skipped"
+            paper["done"].set()
+            return
+
+        _, _, annotate_pool = self._pools
+        future = annotate_pool.submit(
+            _annotate_one, paper_dir, self.html_file_name, self.json_file_name, self.annotated_file_name
+        )
+
+        def annotated(future):
+            try:
+                result = future.result()
+                record_annotation_metrics(result)
+                if result["status"] != "ok":
+                    return self._fail(paper, "annotate", result["error"])
+                manifest.record("annotate", stage_inputs, [self.annotated_file_name])
+                paper["stages"]["annotate"] = "ran"
+                paper["done"].set()
+            except Exception as e:
+                self._fail(paper, "annotate", e)
+
+        future.add_done_callback(annotated)
+
+    def save_report(self, directory, filename) -> str:
+        """
+        Save the per-paper stage report as JSON.
+        """
+        if not self.results:
+            raise ValueError("[-] No results available. Please call run() first.")
+        return save_json_to_file(data=self.results, directory=directory, filename=filename)
@@ -0,0 +1,106 @@
+import signal
+import threading
+from metrics import metrics
+
+
+class PipelineWorker:
+
+    def __init__(self, pipeline, queue, max_in_flight: int = 16, poll_interval: float = 2.0):
+        """
+        Long-running service running the jobs of a JobQueue on one PaperPipeline.
+
+        The pipeline pools are started once and reused by every job: the HTTP session and its
+        pooled connections, the Gemini client with its event loop, rate limits and context
+        cache, and the annotation processes with their compiled template. Up to
+        `max_in_flight` jobs run at the same time, each paper moving on to its next stage as
+        soon as the previous one is done.
+
+        `stop` (SIGINT or SIGTERM in `run`) stops claiming jobs and lets the running ones
+        finish. A worker that is killed leaves its jobs running in the queue, and the next
+        worker queues them again (see JobQueue.recover).
+
+        Args:
+            pipeline (PaperPipeline): Pipeline running the stages of the jobs.
+            queue (JobQueue): Queue the jobs are claimed from.
+            max_in_flight (int): Maximum number of jobs running at the same time.
+            poll_interval (float): Seconds between two checks of an empty queue.
+        """
+        self.pipeline = pipeline
+        self.queue = queue
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.stats = {"recovered": 0, "done": 0, "failed": 0}
+        # job id -> result of its paper in the pipeline
+        self._running = {}
+        self._stopping = threading.Event()
+
+    def run(self, exit_when_empty: bool = False, handle_signals: bool = True) -> dict:
+        """
+        Claim and run jobs until `stop` is called.
+
+        Args:
+            exit_when_empty (bool): Also stop once the queue is empty and no job is running.
+            handle_signals (bool): Stop gracefully on SIGINT/SIGTERM (main thread only). A
+                second signal stops the worker at once.
+
+        Returns:
+            dict: Number of jobs recovered, done and failed.
+        """
+        if handle_signals and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self._handle_signal)
+            signal.signal(signal.SIGTERM, self._handle_signal)
+
+        self.stats["recovered"] = self.queue.recover()
+        if self.stats["recovered"]:
+            print(f"[*] Queued again {self.stats['recovered']} jobs interrupted by a previous worker")
+        print(f"[*] Worker started: {self.queue.counts()}")
+        self.pipeline.start()
+        try:
+            while True:
+                self._collect_finished()
+                if self._stopping.is_set():
+                    if not self._running:
+                        break
+                elif len(self._running) < self.max_in_flight:
+                    job = self.queue.claim()
+                    if job is not None:
+                        print(f"[*] Job {job['id']}: {job['url']} {job['stages']}")
+                        self._running[job["id"]] = self.pipeline.submit(job["url"], job["stages"])
+                        continue
+                    if exit_when_empty and not self._running:
+                        break
+                # Finished jobs are collected quickly, an empty queue is polled less often
+                self._stopping.wait(0.1 if self._running else self.poll_interval)
+        finally:
+            self.pipeline.stop()
+        print(f"[+] Worker stopped: {self.stats}")
+        return self.stats
+
+    def stop(self) -> None:
+        """
+        Stop claiming jobs, `run` returns once the running ones are done.
+        """
+        self._stopping.set()
+
+    def _handle_signal(self, signum, frame):
+        print(f"[*] Received signal {signum}, finishing {len(self._running)} running jobs (repeat to stop at once)")
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        self.stop()
+
+    def _collect_finished(self):
+        for job_id, paper in list(self._running.items()):
+            if not paper["done"].is_set():
+                continue
+            del self._running[job_id]
+            result = {"paper_id": paper["paper_id"], "stages": paper["stages"]}
+            if paper["error"]:
+                self.queue.fail(job_id, paper["error"], result)
+                self.stats["failed"] += 1
+                print(f"[-] Job {job_id} failed: {paper['error']}")
+            else:
+                self.queue.complete(job_id, result)
+                self.stats["done"] += 1
+                print(f"[+] Job {job_id} done: {paper['stages']}")
+            # A long-running worker never reaches metrics.close(), keep the Prometheus file current
+            metrics.write_prometheus()
@@ -0,0 +1,375 @@
+import os
+import math
+import time
+import sqlite3
+import hashlib
+import threading
+from prompt import get_prompt
+from utils import estimate_tokens, fill_paper_in_prompt
+
+# How a paper is sent: whole in the configured serialization, whole as compact text, or one request per chunk
+STRATEGIES = ("whole", "compact", "chunked")
+
+
+class TokenCounter:
+
+    def __init__(self, gemini=None, model: str = None, cache_path: str = None, max_api_failures: int = 3):
+        """
+        Prompt token counts from the Gemini count-tokens call, with the local estimate as fallback.
+
+        Counts are cached by a hash of the model and the text (in SQLite at `cache_path`, across
+        runs), so a prompt is counted by the API once. Without `gemini`, or once the call failed
+        `max_api_failures` times in a row, `utils.estimate_tokens` is used instead, scaled by
+        the ratio of the API counts to the local estimates seen so far, so the fallback follows
+        the real tokenizer of the papers (markup and LaTeX are not 4 characters per token).
+
+        Args:
+            gemini (GeminiClient or AsyncGeminiClient): Client whose `genai.Client` counts the tokens. None only estimates.
+            model (str): Model whose tokenizer counts the prompts (defaults to the model of `gemini`).
+            cache_path (str): Path of the SQLite cache (e.g. './Cache/token_counts.sqlite'). None keeps counts in memory.
+            max_api_failures (int): Consecutive failed calls after which only the local estimate is used.
+        """
+        self.gemini = gemini
+        self.model = model or getattr(gemini, "model", None)
+        self.max_api_failures = max_api_failures
+        self.stats = {"api": 0, "cached": 0, "estimated": 0}
+        self._api_failures = 0
+        self._counts = {}
+        # Sums of the API counts and of the local estimates of the same texts
+        self._api_tokens = 0
+        self._estimated_tokens = 0
+        self._lock = threading.Lock()
+
+        self._db = None
+        if cache_path:
+            directory = os.path.dirname(cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(cache_path, check_same_thread=False)
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS token_counts (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    tokens INTEGER NOT NULL,
+                    estimated_tokens INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                );
+            """)
+            self._db.commit()
+            row = self._db.execute(
+                "SELECT SUM(tokens), SUM(estimated_tokens) FROM token_counts WHERE model IS ?", (self.model,)
+            ).fetchone()
+            self._api_tokens, self._estimated_tokens = row[0] or 0, row[1] or 0
+
+    @property
+    def tokens_per_estimate(self) -> float:
+        """
+        Ratio of the API counts to the local estimates, 1.0 before the first API count.
+        """
+        return self._api_tokens / self._estimated_tokens if self._estimated_tokens else 1.0
+
+    def count(self, text: str) -> int:
+        """
+        Number of tokens of a prompt.
+
+        Args:
+            text (str): The full prompt text.
+
+        Returns:
+            int: Tokens counted by the API (or cached), else the calibrated local estimate.
+        """
+        key = hashlib.sha256(f"{self.model}\n{text}".encode("utf-8")).hexdigest()
+        with self._lock:
+            tokens = self._counts.get(key)
+            if tokens is None and self._db is not None:
+                row = self._db.execute("SELECT tokens FROM token_counts WHERE key = ?", (key,)).fetchone()
+                tokens = row[0] if row else None
+            if tokens is not None:
+                self._counts[key] = tokens
+                self.stats["cached"] += 1
+                return tokens
+            use_api = self.gemini is not None and self._api_failures < self.max_api_failures
+
+        estimated = estimate_tokens(text)
+        if use_api:
+            try:
+                tokens = self.gemini.client.models.count_tokens(model=self.model, contents=text).total_tokens
+            except Exception as e:
+                with self._lock:
+                    self._api_failures += 1
+                    if self._api_failures == self.max_api_failures:
+                        print(f"[-] Token counting failed {self._api_failures} times ({e}), using local estimates")
+            else:
+                with self._lock:
+                    self._api_failures = 0
+                    self._counts[key] = tokens
+                    self._api_tokens += tokens
+                    self._estimated_tokens += estimated
+                    self.stats["api"] += 1
+                    if self._db is not None:
+                        self._db.execute(
+                            "INSERT OR REPLACE INTO token_counts (key, model, tokens, estimated_tokens, created_at) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (key, self.model, tokens, estimated, time.time())
+                        )
+                        self._db.commit()
+                return tokens
+
+        # Estimates are not cached: they improve as the API counts more prompts
+        with self._lock:
+            self.stats["estimated"] += 1
+            return math.ceil(estimated * self.tokens_per_estimate)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class BatchPlanner:
+
+    def __init__(
+        self,
+        counter: TokenCounter,
+        serialization: str = "html",
+        paragraph_ids: bool = False,
+        max_prompt_tokens: int = 1048576,
+        chunk_max_tokens: int = 30000,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+        max_concurrency: int = 8,
+        output_tokens_per_request: int = 2000,
+        seconds_per_request: float = 30.0,
+        price: tuple = None
+    ):
+        """
+        Decide how each paper is sent before any request, and plan the tokens, cost and time of a batch.
+
+        A paper is sent whole when its full prompt fits in the request limit, else whole as
+        compact text (html serialization only) when that fits, else chunked along its sections
+        like ChunkedFlawDetector. The request limit is the input limit of the model, and the
+        tokens per minute quota when it is lower, since a larger request is rejected however
+        long it waits. The batch plan adds up requests, input and output tokens and their cost,
+        and estimates the wall time as the slowest of the requests per minute quota, the tokens
+        per minute quota and `max_concurrency` requests of `seconds_per_request` each.
+
+        Args:
+            counter (TokenCounter): Counts the prompt tokens.
+            serialization (str): Configured serialization, 'html' or 'compact' (see paper_serializer).
+            paragraph_ids (bool): The papers were cleaned with paragraph ids (see prompt.get_prompt).
+            max_prompt_tokens (int): Input token limit of the model.
+            chunk_max_tokens (int): Token budget of a chunked request (see ChunkedFlawDetector).
+            requests_per_minute (float): Requests per minute quota. None if unlimited.
+            tokens_per_minute (float): Tokens per minute quota. None if unlimited.
+            max_concurrency (int): Maximum number of concurrent requests.
+            output_tokens_per_request (int): Expected number of output tokens of a request.
+            seconds_per_request (float): Expected latency of a request in seconds.
+            price (tuple): (input, output) price in USD per million tokens, None to skip the cost.
+        """
+        self.counter = counter
+        self.serialization = serialization
+        self.paragraph_ids = paragraph_ids
+        self.max_prompt_tokens = max_prompt_tokens
+        self.chunk_max_tokens = chunk_max_tokens
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.output_tokens_per_request = output_tokens_per_request
+        self.seconds_per_request = seconds_per_request
+        self.price = price
+
+    @property
+    def request_token_limit(self) -> int:
+        """
+        Largest prompt that can be sent: the model input limit, or the tokens per minute quota if lower.
+        """
+        if self.tokens_per_minute:
+            return int(min(self.max_prompt_tokens, self.tokens_per_minute))
+        return self.max_prompt_tokens
+
+    def plan_paper(self, html_content: str, paper_id: str = None) -> dict:
+        """
+        Count the prompt tokens of a paper and choose how to send it.
+
+        Args:
+            html_content (str): The cleaned HTML of the paper.
+            paper_id (str): Paper ID, for the plan and the log.
+
+        Returns:
+            dict: "paper_id", "strategy" (see STRATEGIES), "serialization" and "requests" to
+                send it, its "input_tokens" and expected "output_tokens" and "cost_usd", the
+                prompt tokens "whole_tokens" (and "compact_tokens" when counted), the
+                "largest_request_tokens" and "fits" (False when even a chunk is over the limit).
+        """
+        limit = self.request_token_limit
+        plan = {"paper_id": paper_id, "whole_tokens": self._count_whole(html_content, self.serialization), "compact_tokens": None}
+        if self.serialization == "compact":
+            plan["compact_tokens"] = plan["whole_tokens"]
+        if plan["whole_tokens"] <= limit:
+            request_tokens = [plan["whole_tokens"]]
+            plan.update(strategy="whole", serialization=self.serialization)
+        else:
+            if plan["compact_tokens"] is None:
+                plan["compact_tokens"] = self._count_whole(html_content, "compact")
+            if plan["compact_tokens"] is not None and plan["compact_tokens"] <= limit:
+                request_tokens = [plan["compact_tokens"]]
+                plan.update(strategy="compact", serialization="compact")
+            else:
+                # The detector needs BeautifulSoup, only imported when a paper does not fit whole
+                from flaw_detector import ChunkedFlawDetector
+                detector = ChunkedFlawDetector(
+                    gemini=None,
+                    serialization=self.serialization,
+                    max_tokens=min(self.chunk_max_tokens, limit),
+                    paragraph_ids=self.paragraph_ids
+                )
+                _, prompts = detector.build_prompts(html_content)
+                request_tokens = [self.counter.count(prefix + request) for prefix, request in prompts]
+                plan.update(strategy="chunked", serialization=self.serialization)
+
+        plan["requests"] = len(request_tokens)
+        plan["input_tokens"] = sum(request_tokens)
+        plan["output_tokens"] = plan["requests"] * self.output_tokens_per_request
+        plan["largest_request_tokens"] = max(request_tokens, default=0)
+        plan["fits"] = plan["largest_request_tokens"] <= limit
+        plan["cost_usd"] = self._cost(plan["input_tokens"], plan["output_tokens"])
+
+        message = f"{paper_id or 'Paper'}: ~{plan['whole_tokens']} tokens whole, {plan['strategy']} in {plan['requests']} requests"
+        print(f"[*] {message}" if plan["fits"] else f"[-] {message}, the largest is over the limit of {limit} tokens")
+        return plan
+
+    def resolve(self, html_content: str, paper_id: str = None, detection_mode: str = "auto") -> tuple:
+        """
+        Preflight of one paper before its detection.
+
+        Args:
+            html_content (str): The cleaned HTML of the paper.
+            paper_id (str): Paper ID, for the plan and the log.
+            detection_mode (str): 'auto' sends the paper as planned, 'single' only checks that
+                the whole prompt fits and raises ValueError before any request when it does not.
+
+        Returns:
+            tuple: (detection mode 'single' or 'chunked', serialization, plan of the paper).
+        """
+        plan = self.plan_paper(html_content, paper_id)
+        if detection_mode == "auto":
+            return ("chunked" if plan["strategy"] == "chunked" else "single"), plan["serialization"], plan
+        if plan["strategy"] != "whole":
+            raise ValueError(
+                f"[-] The prompt of {paper_id or 'the paper'} has ~{plan['whole_tokens']} tokens, over the limit of "
+                f"{self.request_token_limit}. Use the 'auto' or 'chunked' detection mode."
+            )
+        return detection_mode, self.serialization, plan
+
+    def plan_batch(self, papers) -> dict:
+        """
+        Plan a batch of papers.
+
+        Args:
+            papers: Iterable of (paper_id, cleaned HTML) pairs, read one at a time.
+
+        Returns:
+            dict: "papers" (the plan of each paper), "totals" (papers per strategy, requests,
+                tokens, cost) and "schedule" (minutes needed by each limit, the estimated wall
+                time, the limit that bounds it and the concurrency that saturates the quotas).
+        """
+        plans = [self.plan_paper(html_content, paper_id) for paper_id, html_content in papers]
+        totals = {
+            "papers": len(plans),
+            "strategies": {strategy: sum(1 for plan in plans if plan["strategy"] == strategy) for strategy in STRATEGIES},
+            "not_fitting": [plan["paper_id"] for plan in plans if not plan["fits"]],
+            "requests": sum(plan["requests"] for plan in plans),
+            "input_tokens": sum(plan["input_tokens"] for plan in plans),
+            "output_tokens": sum(plan["output_tokens"] for plan in plans),
+        }
+        totals["cost_usd"] = self._cost(totals["input_tokens"], totals["output_tokens"])
+        return {"papers": plans, "totals": totals, "schedule": self.schedule(totals)}
+
+    def schedule(self, totals: dict) -> dict:
+        """
+        Wall time of the requests and tokens of `totals` under the quotas and the concurrency.
+        """
+        requests = totals["requests"]
+        tokens = totals["input_tokens"] + totals["output_tokens"]
+        minutes = {
+            "requests_per_minute": requests / self.requests_per_minute if self.requests_per_minute else 0.0,
+            "tokens_per_minute": tokens / self.tokens_per_minute if self.tokens_per_minute else 0.0,
+            "max_concurrency": requests * self.seconds_per_request / self.max_concurrency / 60,
+        }
+        bottleneck = max(minutes, key=minutes.get)
+
+        # Requests per minute allowed by the quotas, and the concurrency that keeps them busy
+        rates = []
+        if self.requests_per_minute:
+            rates.append(self.requests_per_minute)
+        if self.tokens_per_minute and requests:
+            rates.append(self.tokens_per_minute / (tokens / requests))
+        saturating_concurrency = math.ceil(min(rates) * self.seconds_per_request / 60) if rates else None
+
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "max_concurrency": self.max_concurrency,
+            "seconds_per_request": self.seconds_per_request,
+            "minutes_by_limit": {limit: round(value, 2) for limit, value in minutes.items()},
+            "estimated_minutes": round(minutes[bottleneck], 2),
+            "bottleneck": bottleneck,
+            "saturating_concurrency": saturating_concurrency,
+        }
+
+    def _count_whole(self, html_content, serialization):
+        # The paper is serialized exactly as the single-prompt detection sends it
+        if serialization == "compact":
+            from paper_serializer import html_to_compact_text
+            html_content = html_to_compact_text(html_content)
+        return self.counter.count(fill_paper_in_prompt(get_prompt(serialization, self.paragraph_ids), html_content))
+
+    def _cost(self, input_tokens, output_tokens):
+        if not self.price:
+            return None
+        input_price, output_price = self.price
+        return round((input_tokens * input_price + output_tokens * output_price) / 1e6, 4)
+
+
+def build_planner(gemini=None) -> BatchPlanner:
+    """
+    The preflight planner configured in config.py (used by run_preflight.py, run_gemini_client.py and run_pipeline.py).
+
+    Args:
+        gemini (AsyncGeminiClient): Client counting the tokens, None to use the local estimate only.
+    """
+    # config is only needed here, importing it lazily keeps the planner usable without it
+    from config import (
+        GEMINI_MODEL,
+        GEMINI_MAX_CONCURRENCY,
+        GEMINI_REQUESTS_PER_MINUTE,
+        GEMINI_TOKENS_PER_MINUTE,
+        GEMINI_MAX_INPUT_TOKENS,
+        GEMINI_PRICES,
+        PAPER_SERIALIZATION,
+        PARAGRAPH_IDS,
+        CHUNK_MAX_TOKENS,
+        PREFLIGHT_COUNT_WITH_API,
+        PREFLIGHT_TOKEN_CACHE_PATH,
+        PREFLIGHT_OUTPUT_TOKENS_PER_REQUEST,
+        PREFLIGHT_SECONDS_PER_REQUEST
+    )
+    counter = TokenCounter(
+        gemini=gemini if PREFLIGHT_COUNT_WITH_API else None,
+        model=GEMINI_MODEL,
+        cache_path=PREFLIGHT_TOKEN_CACHE_PATH
+    )
+    return BatchPlanner(
+        counter=counter,
+        serialization=PAPER_SERIALIZATION,
+        paragraph_ids=PARAGRAPH_IDS,
+        max_prompt_tokens=GEMINI_MAX_INPUT_TOKENS,
+        chunk_max_tokens=CHUNK_MAX_TOKENS,
+        requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+        tokens_per_minute=GEMINI_TOKENS_PER_MINUTE,
+        max_concurrency=GEMINI_MAX_CONCURRENCY,
+        output_tokens_per_request=PREFLIGHT_OUTPUT_TOKENS_PER_REQUEST,
+        seconds_per_request=PREFLIGHT_SECONDS_PER_REQUEST,
+        price=GEMINI_PRICES.get(GEMINI_MODEL)
+    )
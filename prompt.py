@@ -76,3 +76,79 @@ Paper:
 {paper}
 <END OF PAPER>
 """
+
+# Same prompt for a paper serialized with paper_serializer.html_to_compact_text
+prompt_1_compact = prompt_1.replace(
+    "provided with a paper in HTML format.",
+    "provided with a paper in lightweight Markdown format."
+).replace(
+    "- Focus on visible text; ignore HTML tags unless they contain essential content (e.g., equations, figures).",
+    "- Equations are given as LaTeX between $ signs and tables as rows of cells separated by |."
+)
+
+
+def _for_one_section(prompt):
+    # Adapt a whole-paper prompt to a single section sent with a summary of the paper
+    return prompt.replace(
+        "- Carefully examine the paper and detect any flaws matching the criteria below.",
+        "- You are given ONE section of the paper, preceded by a short summary of the whole paper for context.\n"
+        "- Carefully examine the section and detect any flaws matching the criteria below.\n"
+        "- Only report flaws located in the section: start_of_flaw and end_of_flaw must be quoted from the section, "
+        "never from the summary."
+    )
+
+
+# Prompts used by flaw_detector.ChunkedFlawDetector, one request per section
+prompt_1_section = _for_one_section(prompt_1)
+prompt_1_section_compact = _for_one_section(prompt_1_compact)
+
+
+def _with_paragraph_ids(prompt, id_notation):
+    # Cite paragraphs by their stable id (html_downloader.stamp_paragraph_ids) instead of quoting 5-word anchors
+    return prompt.replace(
+        "- Carefully examine the",
+        f"- Every paragraph, heading, list item and table cell has a short id (e.g. p12), given as {id_notation}.\n"
+        "- Carefully examine the",
+        1
+    ).replace(
+        "- start_of_flaw: first 5 words of the paragraph where flaw occurs\n"
+        "- end_of_flaw: last 5 words of the paragraph where flaw occurs",
+        "- start_id: id of the first paragraph where flaw occurs\n"
+        "- end_id: id of the last paragraph where flaw occurs (the same as start_id if the flaw is in one paragraph)"
+    ).replace(
+        "the text between start_of_flaw and end_of_flaw",
+        "the paragraphs from start_id to end_id"
+    ).replace(
+        "  start_of_flaw, end_of_flaw, flaw_category,",
+        "  start_id, end_id, flaw_category,"
+    ).replace(
+        '"start_of_flaw": "our experiments show that the",\n'
+        '        "end_of_flaw": "confidence intervals cannot be found.",',
+        '"start_id": "p12",\n'
+        '        "end_id": "p14",'
+    ).replace(
+        "start_of_flaw and end_of_flaw must be quoted from the section, never from the summary.",
+        "start_id and end_id must be ids of paragraphs of the section."
+    )
+
+
+# Prompts asking for paragraph ids (start_id/end_id) instead of text anchors, for papers cleaned with paragraph ids
+prompt_1_ids = _with_paragraph_ids(prompt_1, "its data-pid attribute")
+prompt_1_compact_ids = _with_paragraph_ids(prompt_1_compact, "[p12] at its start")
+prompt_1_section_ids = _with_paragraph_ids(prompt_1_section, "its data-pid attribute")
+prompt_1_section_compact_ids = _with_paragraph_ids(prompt_1_section_compact, "[p12] at its start")
+
+
+def get_prompt(serialization: str = "html", paragraph_ids: bool = False, section: bool = False) -> str:
+    """
+    Prompt template for a paper serialization ('html' or 'compact'), asking for paragraph ids or
+    text anchors, for the whole paper or for one section (flaw_detector.ChunkedFlawDetector).
+    """
+    compact = serialization == "compact"
+    if section:
+        if paragraph_ids:
+            return prompt_1_section_compact_ids if compact else prompt_1_section_ids
+        return prompt_1_section_compact if compact else prompt_1_section
+    if paragraph_ids:
+        return prompt_1_compact_ids if compact else prompt_1_ids
+    return prompt_1_compact if compact else prompt_1
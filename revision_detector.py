@@ -0,0 +1,394 @@
+import asyncio
+import difflib
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from anchor_index import AnchorIndex
+from annotation_engine import PARAGRAPH_TAG_PATTERN, index_paragraph_ids
+from flaw_detector import ChunkedFlawDetector, merge_flaws
+from paper_serializer import html_to_compact_text
+from utils import estimate_tokens
+
+# Marks the paragraphs left out between two windows of changed paragraphs in a request
+WINDOW_SEPARATOR = "\n<p>[...]</p>\n"
+REVISION_NOTE = (
+    "Only the paragraphs changed in the new version of the paper are shown below, with their section "
+    "heading and neighbouring paragraphs; [...] marks the unchanged paragraphs left out."
+)
+
+
+def split_paragraphs(html_content: str, index: AnchorIndex) -> list:
+    """
+    Split cleaned HTML into paragraphs: the outermost elements that can carry a paragraph id
+    (see html_downloader.PARAGRAPH_ID_TAGS), and the visible text between them.
+
+    Args:
+        html_content (str): The cleaned HTML of the paper.
+        index (AnchorIndex): Index of the same HTML, gives the normalized visible text.
+
+    Returns:
+        list: Paragraphs as (start offset, end offset, normalized visible text), in document
+            order. Paragraphs without visible text are left out.
+    """
+    paragraphs = []
+
+    def add(start, end):
+        text = index.text[bisect_left(index.starts, start):bisect_left(index.starts, end)]
+        if text:
+            paragraphs.append((start, end, text))
+
+    position = 0
+    # Names of the open elements of the current paragraph
+    stack = []
+    for match in PARAGRAPH_TAG_PATTERN.finditer(html_content):
+        closing, name, attributes = match.groups()
+        if name is None:
+            continue
+        name = name.lower()
+        if not closing:
+            if attributes.rstrip().endswith("/"):
+                continue
+            if not stack:
+                add(position, match.start())
+                position = match.start()
+            stack.append(name)
+        elif name in stack:
+            # Close the innermost open element with this name (and any unclosed element inside it)
+            while stack.pop() != name:
+                pass
+            if not stack:
+                add(position, match.end())
+                position = match.end()
+    add(position, len(html_content))
+    return paragraphs
+
+
+class PaperRevision:
+
+    def __init__(self, previous_html: str, html_content: str):
+        """
+        Alignment of the paragraphs of two versions of a paper.
+
+        Both versions are split with `split_paragraphs` and their visible texts are aligned with
+        difflib, so a paragraph is unchanged when its text is the same, whatever the markup and
+        paragraph ids around it.
+
+        Args:
+            previous_html (str): The cleaned HTML of the previous version.
+            html_content (str): The cleaned HTML of the new version.
+        """
+        self.previous_html = previous_html
+        self.html_content = html_content
+        self.previous_index = AnchorIndex(previous_html, fuzzy=False)
+        self.index = AnchorIndex(html_content, fuzzy=False)
+        self.previous_paragraphs = split_paragraphs(previous_html, self.previous_index)
+        self.paragraphs = split_paragraphs(html_content, self.index)
+
+        matcher = difflib.SequenceMatcher(
+            None,
+            [paragraph[2] for paragraph in self.previous_paragraphs],
+            [paragraph[2] for paragraph in self.paragraphs],
+            autojunk=False
+        )
+        # Previous paragraph -> the same paragraph in the new version
+        self.paragraph_map = {}
+        # Edited previous paragraph -> the new paragraphs that replace it
+        self.replacements = {}
+        self.changed = []
+        for operation, previous_start, previous_end, start, end in matcher.get_opcodes():
+            for offset in range(previous_end - previous_start):
+                if operation == "equal":
+                    self.paragraph_map[previous_start + offset] = start + offset
+                elif operation == "replace":
+                    self.replacements[previous_start + offset] = list(range(start, end))
+            if operation in ("replace", "insert"):
+                self.changed.extend(range(start, end))
+
+        self._previous_starts = [paragraph[0] for paragraph in self.previous_paragraphs]
+        self._starts = [paragraph[0] for paragraph in self.paragraphs]
+        self._previous_ids, self._previous_paragraph_ids = self._index_ids(
+            previous_html, self.previous_paragraphs, self._previous_starts
+        )
+        self._ids, self._paragraph_ids = self._index_ids(html_content, self.paragraphs, self._starts)
+
+    def carry_flaw(self, flaw: dict):
+        """
+        Re-anchor a flaw of the previous version in the new version.
+
+        Returns:
+            tuple: (flaw for the new version or None if it cannot be carried, list of the new
+                paragraphs it covers, to be checked again when it is not carried; both are empty
+                when the flaw is not found in the previous version or its paragraphs were removed)
+        """
+        if flaw.get("start_id"):
+            span = self._id_span(flaw)
+        else:
+            located = self.previous_index.find(flaw.get("start_of_flaw", ""), flaw.get("end_of_flaw", ""))
+            span = None if located is None else (
+                self._paragraph_at(self._previous_starts, located[0]),
+                self._paragraph_at(self._previous_starts, located[1] - 1),
+            )
+        if span is None:
+            return None, []
+
+        first, last = span
+        mapped = [self.paragraph_map.get(position) for position in range(first, last + 1)]
+        recheck = [position for position in mapped if position is not None]
+        for position in range(first, last + 1):
+            recheck.extend(self.replacements.get(position, []))
+        # Every paragraph of the flaw is unchanged and still in one piece
+        if None in mapped or mapped[-1] - mapped[0] != last - first:
+            return None, recheck
+
+        if flaw.get("start_id"):
+            start_id = self._map_id(flaw["start_id"])
+            # An unknown end id only marks the first paragraph (see annotation_engine.find_paragraph_span)
+            end_id = self._map_id(flaw["end_id"]) if flaw.get("end_id") in self._previous_ids else start_id
+            if start_id is None or end_id is None:
+                return None, recheck
+            return {**flaw, "start_id": start_id, "end_id": end_id}, recheck
+
+        # Text anchors are unchanged, they only need to lead to the same paragraphs
+        located = self.index.find(flaw.get("start_of_flaw", ""), flaw.get("end_of_flaw", ""))
+        if located is None or (
+            self._paragraph_at(self._starts, located[0]), self._paragraph_at(self._starts, located[1] - 1)
+        ) != (mapped[0], mapped[-1]):
+            return None, recheck
+        return flaw, recheck
+
+    def windows(self, positions: list, context: int = 1) -> list:
+        """
+        Group new paragraphs into windows with `context` paragraphs before and after each, and
+        the heading of the section they are in.
+
+        Returns:
+            list: Windows as lists of paragraph positions, in document order.
+        """
+        windows = []
+        for position in sorted(set(positions)):
+            first = max(position - context, 0)
+            last = min(position + context, len(self.paragraphs) - 1)
+            if windows and first <= windows[-1][-1] + 1:
+                windows[-1].extend(range(windows[-1][-1] + 1, last + 1))
+            else:
+                windows.append(list(range(first, last + 1)))
+
+        for window in windows:
+            if self._is_heading(window[0]):
+                continue
+            heading = next(
+                (position for position in range(window[0] - 1, -1, -1) if self._is_heading(position)),
+                None
+            )
+            if heading is not None:
+                window.insert(0, heading)
+        return windows
+
+    def paragraph_html(self, position: int) -> str:
+        start, end, _ = self.paragraphs[position]
+        return self.html_content[start:end].strip()
+
+    def _is_heading(self, position):
+        html = self.paragraph_html(position)
+        return len(html) > 2 and html[0] == "<" and html[1] in "hH" and html[2].isdigit()
+
+    def _id_span(self, flaw):
+        first = self._previous_ids.get(flaw["start_id"])
+        last = self._previous_ids.get(flaw.get("end_id") or flaw["start_id"], first)
+        if first is None:
+            return None
+        return min(first[0], last[0]), max(first[0], last[0])
+
+    def _map_id(self, paragraph_id):
+        # The id at the same rank in the same paragraph of the new version
+        position, rank = self._previous_ids[paragraph_id]
+        new_position = self.paragraph_map.get(position)
+        new_ids = self._paragraph_ids.get(new_position, [])
+        if len(new_ids) != len(self._previous_paragraph_ids[position]):
+            return None
+        return new_ids[rank]
+
+    def _index_ids(self, html_content, paragraphs, starts):
+        """
+        Returns:
+            tuple: ({paragraph id: (paragraph position, rank of the id in its paragraph)},
+                {paragraph position: [its ids in document order]})
+        """
+        ids = {}
+        paragraph_ids = {}
+        spans = sorted(index_paragraph_ids(html_content).items(), key=lambda item: item[1][0])
+        for paragraph_id, (content_start, _) in spans:
+            position = self._paragraph_at(starts, content_start)
+            if position is None or content_start >= paragraphs[position][1]:
+                continue
+            ids_of_paragraph = paragraph_ids.setdefault(position, [])
+            ids[paragraph_id] = (position, len(ids_of_paragraph))
+            ids_of_paragraph.append(paragraph_id)
+        return ids, paragraph_ids
+
+    def _paragraph_at(self, starts, offset):
+        position = bisect_right(starts, offset) - 1
+        return position if position >= 0 else None
+
+
+class RevisionFlawDetector(ChunkedFlawDetector):
+
+    def __init__(
+        self,
+        gemini,
+        serialization="html",
+        max_tokens=30000,
+        max_workers=8,
+        structured=True,
+        paragraph_ids=False,
+        context_paragraphs=1,
+        max_rerequests=1,
+        bypass_cache=False,
+        deadline=None
+    ):
+        """
+        Detect the flaws of a new version of a paper from the flaws of its previous version.
+
+        The paragraphs of both versions are aligned (see PaperRevision). Flaws of the previous
+        version whose paragraphs are unchanged are carried over, with their paragraph ids mapped
+        to the new version. Only the changed and new paragraphs, with `context_paragraphs`
+        neighbours and their section heading, are sent to the model with the summary of the
+        paper, together with the paragraphs of flaws that could not be carried over, packed into
+        requests of `max_tokens` like ChunkedFlawDetector chunks. The counters of the last
+        update are in `self.stats`.
+
+        Args:
+            gemini (GeminiClient or AsyncGeminiClient): See ChunkedFlawDetector.
+            serialization (str): 'html' or 'compact', see paper_serializer.serialize_paper.
+            max_tokens (int): Estimated token budget of one request.
+            max_workers (int): Maximum number of concurrent requests.
+            structured (bool): Ask for schema-constrained JSON output.
+            paragraph_ids (bool): Both versions were cleaned with paragraph ids.
+            context_paragraphs (int): Unchanged paragraphs sent before and after each changed one.
+            max_rerequests (int): See ChunkedFlawDetector.
+            bypass_cache (bool): See ChunkedFlawDetector.
+            deadline (float): See ChunkedFlawDetector.
+        """
+        super().__init__(
+            gemini, serialization=serialization, max_tokens=max_tokens, max_workers=max_workers,
+            structured=structured, paragraph_ids=paragraph_ids, max_rerequests=max_rerequests,
+            bypass_cache=bypass_cache, deadline=deadline
+        )
+        self.context_paragraphs = context_paragraphs
+        self.stats = {}
+
+    def detect_revision(self, html_content: str, previous_html: str, previous_flaws: list) -> list:
+        """
+        Detect the flaws of the new version of a paper.
+
+        Args:
+            html_content (str): The cleaned HTML of the new version.
+            previous_html (str): The cleaned HTML of the previous version.
+            previous_flaws (list): The flaws of the previous version.
+
+        Returns:
+            list: The flaws carried over and the flaws found in the changed paragraphs, merged.
+        """
+        if asyncio.iscoroutinefunction(self.gemini.generate_text):
+            return asyncio.run(self.detect_revision_async(html_content, previous_html, previous_flaws))
+
+        carried, chunks, prompts = self._prepare_revision(html_content, previous_html, previous_flaws)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            flaw_lists = list(executor.map(self._detect_chunk, chunks, prompts))
+        return self._merge_revision(carried, flaw_lists, html_content)
+
+    async def detect_revision_async(self, html_content: str, previous_html: str, previous_flaws: list) -> list:
+        """
+        Same as `detect_revision` on the running event loop.
+        """
+        carried, chunks, prompts = await asyncio.to_thread(self._prepare_revision, html_content, previous_html, previous_flaws)
+        flaw_lists = await self._detect_chunks_async(chunks, prompts)
+        return await asyncio.to_thread(self._merge_revision, carried, flaw_lists, html_content)
+
+    def _prepare_revision(self, html_content, previous_html, previous_flaws):
+        revision = PaperRevision(previous_html, html_content)
+        carried = []
+        recheck = []
+        rechecked = 0
+        dropped = 0
+        for flaw in previous_flaws if isinstance(previous_flaws, list) else []:
+            if not isinstance(flaw, dict):
+                continue
+            new_flaw, paragraphs = revision.carry_flaw(flaw)
+            if new_flaw is not None:
+                carried.append(new_flaw)
+            elif paragraphs:
+                recheck.extend(paragraphs)
+                rechecked += 1
+            else:
+                # Not found in the previous version, or all its paragraphs were removed
+                dropped += 1
+
+        summary = self.summarize(html_content) + "\n" + REVISION_NOTE
+        overhead = estimate_tokens(self.prompt) + estimate_tokens(summary)
+        windows = revision.windows(revision.changed + recheck, context=self.context_paragraphs)
+        chunks = self._pack_windows(revision, windows, budget=max(self.max_tokens - overhead, 1))
+        prompts = [self.build_prompt(chunk["html"], summary) for chunk in chunks]
+
+        paper = html_to_compact_text(html_content) if self.serialization == "compact" else html_content
+        self.stats = {
+            "paragraphs": len(revision.paragraphs),
+            "changed_paragraphs": len(revision.changed),
+            "rechecked_paragraphs": len(set(recheck) - set(revision.changed)),
+            "requests": len(chunks),
+            "estimated_tokens": sum(estimate_tokens(prefix) + estimate_tokens(request) for prefix, request in prompts),
+            "estimated_full_tokens": estimate_tokens(self.prompt) + estimate_tokens(paper),
+            "carried_flaws": len(carried),
+            "rechecked_flaws": rechecked,
+            "dropped_flaws": dropped,
+        }
+        print(
+            f"[*] {self.stats['changed_paragraphs']}/{self.stats['paragraphs']} paragraphs changed, "
+            f"{len(carried)} flaws carried over, {self.stats['rechecked_flaws']} to check again, {dropped} dropped"
+        )
+        print(f"[*] Detecting flaws in {len(chunks)} chunks of changes")
+        return carried, chunks, prompts
+
+    def _merge_revision(self, carried, flaw_lists, html_content):
+        # Failed chunks are None, see ChunkedFlawDetector._merge
+        self.failed_chunks = self.stats["failed_requests"] = sum(1 for flaws in flaw_lists if flaws is None)
+        flaw_lists = [flaws for flaws in flaw_lists if flaws is not None]
+        if self.failed_chunks:
+            print(f"[-] {self.failed_chunks} requests failed, the flaws of their changes are missing")
+        self.stats["new_flaws"] = sum(len(flaws) for flaws in flaw_lists)
+        flaws = merge_flaws([carried] + flaw_lists, html_content)
+        full_tokens = self.stats["estimated_full_tokens"]
+        reduction = 100 * (1 - self.stats["estimated_tokens"] / full_tokens) if full_tokens else 0
+        print(
+            f"[+] {len(flaws)} flaws ({len(carried)} carried over, {self.stats['new_flaws']} found in the changes), "
+            f"~{self.stats['estimated_tokens']} tokens sent instead of ~{full_tokens} ({reduction:.0f}% fewer)"
+        )
+        return flaws
+
+    def _pack_windows(self, revision, windows, budget):
+        # Greedily pack windows under the budget, a window over the budget is split between paragraphs
+        chunks = []
+        current = []
+        current_tokens = 0
+        for window in windows:
+            pieces = []
+            piece_tokens = 0
+            for position in window:
+                html = revision.paragraph_html(position)
+                tokens = estimate_tokens(html)
+                if pieces and piece_tokens + tokens > budget:
+                    current, current_tokens = self._add_piece(chunks, current, current_tokens, "\n".join(pieces), piece_tokens, budget)
+                    pieces, piece_tokens = [], 0
+                pieces.append(html)
+                piece_tokens += tokens
+            if pieces:
+                current, current_tokens = self._add_piece(chunks, current, current_tokens, "\n".join(pieces), piece_tokens, budget)
+        if current:
+            chunks.append({"title": f"Changes {len(chunks) + 1}", "html": WINDOW_SEPARATOR.join(current)})
+        return chunks
+
+    def _add_piece(self, chunks, current, current_tokens, piece, piece_tokens, budget):
+        if current and current_tokens + piece_tokens > budget:
+            chunks.append({"title": f"Changes {len(chunks) + 1}", "html": WINDOW_SEPARATOR.join(current)})
+            current, current_tokens = [], 0
+        current.append(piece)
+        return current, current_tokens + piece_tokens
@@ -0,0 +1,53 @@
+import os
+from benchmark import BenchmarkSuite, compare_to_baseline, load_baseline
+from utils import save_json_to_file
+from config import (
+    HTML_PARSER_BACKEND,
+    HTML_TEMPLATE_DIRECTORY,
+    HTML_TEMPLATE_FILE_NAME,
+    BENCHMARK_SIZES,
+    BENCHMARK_REPEATS,
+    BENCHMARK_DIRECTORY,
+    BENCHMARK_REPORT_FILE_NAME,
+    BENCHMARK_BASELINE_FILE,
+    BENCHMARK_REGRESSION_THRESHOLD,
+    BENCHMARK_MIN_SECONDS,
+    BENCHMARK_UPDATE_BASELINE
+)
+
+
+if __name__ == "__main__":
+
+    suite = BenchmarkSuite(
+        sizes=BENCHMARK_SIZES,
+        repeats=BENCHMARK_REPEATS,
+        parser_backend=HTML_PARSER_BACKEND,
+        template_directory=HTML_TEMPLATE_DIRECTORY,
+        template_file=HTML_TEMPLATE_FILE_NAME
+    )
+    results = suite.run()
+    report = {"parser_backend": HTML_PARSER_BACKEND, "repeats": BENCHMARK_REPEATS, "results": results}
+
+    baseline = load_baseline(BENCHMARK_BASELINE_FILE)
+    if baseline is None:
+        print(f"[*] No baseline found at {BENCHMARK_BASELINE_FILE}")
+    else:
+        report["comparison"] = compare_to_baseline(
+            results, baseline["results"], BENCHMARK_REGRESSION_THRESHOLD, BENCHMARK_MIN_SECONDS
+        )
+        regressions = [entry for entry in report["comparison"] if entry["regressed"]]
+        for entry in regressions:
+            print(f"[-] Regression in {entry['stage']} ({entry['size']}): time x{entry['time_ratio']}, memory x{entry['memory_ratio']}")
+        if not regressions:
+            print(f"[+] No regression against the baseline (threshold x{BENCHMARK_REGRESSION_THRESHOLD})")
+
+    report_path = save_json_to_file(data=report, directory=BENCHMARK_DIRECTORY, filename=BENCHMARK_REPORT_FILE_NAME)
+    print(f"[+] Saved benchmark report to {report_path}")
+
+    if BENCHMARK_UPDATE_BASELINE or baseline is None:
+        baseline_path = save_json_to_file(
+            data={key: value for key, value in report.items() if key != "comparison"},
+            directory=os.path.dirname(BENCHMARK_BASELINE_FILE) or ".",
+            filename=os.path.basename(BENCHMARK_BASELINE_FILE)
+        )
+        print(f"[+] Saved benchmark baseline to {baseline_path}")
@@ -0,0 +1,38 @@
+import os
+from flaw_store import FlawStore
+from utils import read_json_file, save_json_to_file
+from config import (
+    HTML_DIRECTORY,
+    JSON_FILE_NAME,
+    FLAW_STORE_PATH,
+    FLAW_STORE_SUMMARY_FILE_NAME
+)
+
+if __name__ == "__main__":
+
+    if not FLAW_STORE_PATH:
+        raise ValueError("[-] Set FLAW_STORE_PATH in `config.py` to use the flaw store.")
+    flaw_store = FlawStore(FLAW_STORE_PATH)
+
+    # Import the flaws of every <HTML_DIRECTORY>/<paper_id>/ in one transaction, unchanged ones are skipped
+    runs = []
+    for paper_id in sorted(os.listdir(HTML_DIRECTORY)):
+        paper_dir = os.path.join(HTML_DIRECTORY, paper_id)
+        json_path = os.path.join(paper_dir, JSON_FILE_NAME)
+        if os.path.isfile(json_path):
+            flaws = read_json_file(directory=paper_dir, filename=JSON_FILE_NAME)
+            runs.append({"paper_id": paper_id, "flaws": flaws, "created_at": os.path.getmtime(json_path)})
+    flaw_store.add_runs(runs)
+    print(f"[+] Imported the flaws of {len(runs)} papers into {FLAW_STORE_PATH}")
+
+    summary = {
+        "papers": len(flaw_store.paper_ids()),
+        "by_category": flaw_store.count_flaws(group_by=("category",)),
+        "by_severity": flaw_store.count_flaws(group_by=("severity",)),
+        "by_model_and_category_group": flaw_store.count_flaws(group_by=("model", "category_group")),
+    }
+    for row in summary["by_category"]:
+        print(f"[*] {row['category']}: {row['count']} flaws")
+    summary_path = save_json_to_file(data=summary, directory=HTML_DIRECTORY, filename=FLAW_STORE_SUMMARY_FILE_NAME)
+    print(f"[+] Saved flaw store summary to {summary_path}")
+    flaw_store.close()
@@ -1,18 +1,56 @@
 import os
-from gemini_client import GeminiClient
-from prompt import prompt_1 as PROMPT
+import asyncio
+from async_gemini_client import AsyncGeminiClient
+from llm_cache import LLMResponseCache
+from prompt import get_prompt
+from paper_serializer import serialize_paper
+from flaw_detector import ChunkedFlawDetector
+from cascade_detector import CascadeFlawDetector
+from flaw_stream_parser import collect_streamed_flaws
+from flaw_schema import structured_output_config
+from flaw_store import FlawStore
+from html_batch_downloader import paper_id_from_url
+from preflight import build_planner
+from metrics import metrics
 from config import (
     GEMINI_MODEL,
+    GEMINI_CACHE_PATH,
+    GEMINI_CACHE_TTL_HOURS,
+    GEMINI_CACHE_MAX_SIZE_MB,
+    GEMINI_CACHE_BYPASS,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_REQUESTS_PER_MINUTE,
+    GEMINI_TOKENS_PER_MINUTE,
+    GEMINI_MAX_RETRIES,
+    GEMINI_TIMEOUT,
+    GEMINI_DEADLINE,
+    GEMINI_STREAM,
+    GEMINI_STRUCTURED_OUTPUT,
+    GEMINI_MAX_REREQUESTS,
+    GEMINI_CONTEXT_CACHE_TTL,
+    PAPER_SERIALIZATION,
+    PARAGRAPH_IDS,
+    DETECTION_MODE,
+    CHUNK_MAX_TOKENS,
+    GEMINI_ESCALATION_MODEL,
+    CASCADE_MIN_CONFIDENCE,
+    CASCADE_ESCALATION_SEVERITIES,
+    CASCADE_REPORT_FILE_NAME,
     HTML_DIRECTORY, 
     HTML_FILE_NAME,
     JSON_DIRECTORY,
-    JSON_FILE_NAME
+    JSON_FILE_NAME,
+    HTML_URL,
+    FLAW_STORE_PATH,
+    PREFLIGHT_ENABLED,
+    METRICS_ENABLED,
+    METRICS_JSONL_FILE,
+    METRICS_PROMETHEUS_FILE
 )
 from utils import (
     read_html_file,
-    fill_paper_in_prompt,
-    save_json_to_file,
-    convert_json_string_to_json
+    split_prompt,
+    save_json_to_file
 )
 from dotenv import load_dotenv
 load_dotenv()
@@ -21,9 +59,113 @@ API_KEY = os.getenv("GEMINI_API_KEY")
 
 if __name__ == "__main__":
 
-    gemini = GeminiClient(api_key=API_KEY, model=GEMINI_MODEL)
+    metrics.configure(enabled=METRICS_ENABLED, jsonl_path=METRICS_JSONL_FILE, prometheus_path=METRICS_PROMETHEUS_FILE)
+
+    cache = None
+    if GEMINI_CACHE_PATH:
+        cache = LLMResponseCache(
+            cache_path=GEMINI_CACHE_PATH,
+            ttl_hours=GEMINI_CACHE_TTL_HOURS,
+            max_size_mb=GEMINI_CACHE_MAX_SIZE_MB
+        )
+
+    gemini = AsyncGeminiClient(
+        api_key=API_KEY,
+        model=GEMINI_MODEL,
+        cache=cache,
+        max_concurrency=GEMINI_MAX_CONCURRENCY,
+        requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+        tokens_per_minute=GEMINI_TOKENS_PER_MINUTE,
+        max_retries=GEMINI_MAX_RETRIES,
+        timeout=GEMINI_TIMEOUT,
+        context_cache_ttl=GEMINI_CONTEXT_CACHE_TTL
+    )
     html_content = read_html_file(directory=HTML_DIRECTORY, filename=HTML_FILE_NAME)
-    prompt = fill_paper_in_prompt(prompt=PROMPT, html_content=html_content)
-    llm_response = gemini.generate_text(prompt)
-    cleaned_llm_response = convert_json_string_to_json(llm_response)
+    detection_mode, serialization = DETECTION_MODE, PAPER_SERIALIZATION
+    if DETECTION_MODE == "auto" or (PREFLIGHT_ENABLED and DETECTION_MODE == "single"):
+        # Count the prompt tokens first: send whole, compact or chunked ('auto'), or fail before any request
+        planner = build_planner(gemini)
+        detection_mode, serialization, _ = planner.resolve(html_content, paper_id_from_url(HTML_URL), DETECTION_MODE)
+        planner.counter.close()
+
+    if detection_mode == "chunked":
+        detector = ChunkedFlawDetector(
+            gemini=gemini,
+            serialization=serialization,
+            max_tokens=CHUNK_MAX_TOKENS,
+            structured=GEMINI_STRUCTURED_OUTPUT,
+            paragraph_ids=PARAGRAPH_IDS,
+            max_rerequests=GEMINI_MAX_REREQUESTS,
+            bypass_cache=GEMINI_CACHE_BYPASS,
+            deadline=GEMINI_DEADLINE
+        )
+        cleaned_llm_response = detector.detect(html_content)
+    elif detection_mode == "cascade":
+        # Rate limits are per model: the stronger model gets its own client
+        escalation_gemini = AsyncGeminiClient(
+            api_key=API_KEY,
+            model=GEMINI_ESCALATION_MODEL,
+            cache=cache,
+            max_concurrency=GEMINI_MAX_CONCURRENCY,
+            requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+            tokens_per_minute=GEMINI_TOKENS_PER_MINUTE,
+            max_retries=GEMINI_MAX_RETRIES,
+            timeout=GEMINI_TIMEOUT,
+            context_cache_ttl=GEMINI_CONTEXT_CACHE_TTL
+        )
+        detector = CascadeFlawDetector(
+            gemini=gemini,
+            escalation_gemini=escalation_gemini,
+            serialization=PAPER_SERIALIZATION,
+            max_tokens=CHUNK_MAX_TOKENS,
+            structured=GEMINI_STRUCTURED_OUTPUT,
+            paragraph_ids=PARAGRAPH_IDS,
+            min_confidence=CASCADE_MIN_CONFIDENCE,
+            escalation_severities=CASCADE_ESCALATION_SEVERITIES,
+            max_rerequests=GEMINI_MAX_REREQUESTS,
+            bypass_cache=GEMINI_CACHE_BYPASS,
+            deadline=GEMINI_DEADLINE
+        )
+        cleaned_llm_response = detector.detect(html_content)
+        report_path = save_json_to_file(data=detector.stats, directory=JSON_DIRECTORY, filename=CASCADE_REPORT_FILE_NAME)
+        print(f"[+] Saved cascade report to {report_path}")
+    else:
+        paper = serialize_paper(html_content, mode=serialization)
+        prompt_template = get_prompt(serialization, paragraph_ids=PARAGRAPH_IDS)
+        # Only the paper varies between papers, the prefix can be served from the context cache
+        prefix, prompt = split_prompt(prompt=prompt_template, html_content=paper)
+        if GEMINI_STREAM:
+            stream_config = structured_output_config(paragraph_ids=PARAGRAPH_IDS) if GEMINI_STRUCTURED_OUTPUT else None
+            received_flaws = []
+
+            def save_received_flaw(flaw):
+                # The flaws received so far are on disk even if the run is killed mid-stream
+                received_flaws.append(flaw)
+                save_json_to_file(data=received_flaws, directory=JSON_DIRECTORY, filename=JSON_FILE_NAME)
+
+            streamed_flaws = asyncio.run(collect_streamed_flaws(
+                gemini.generate_text_stream(
+                    prompt, config=stream_config, bypass_cache=GEMINI_CACHE_BYPASS, prefix=prefix, deadline=GEMINI_DEADLINE
+                ),
+                on_flaw=save_received_flaw
+            ))
+            cleaned_llm_response = gemini.flaw_parser.validate(streamed_flaws)
+        else:
+            cleaned_llm_response = asyncio.run(gemini.generate_flaws(
+                prompt,
+                structured=GEMINI_STRUCTURED_OUTPUT,
+                max_rerequests=GEMINI_MAX_REREQUESTS,
+                bypass_cache=GEMINI_CACHE_BYPASS,
+                deadline=GEMINI_DEADLINE,
+                prefix=prefix,
+                paragraph_ids=PARAGRAPH_IDS
+            ))
+    print(f"[*] Response parsing: {gemini.flaw_parser.stats}")
     save_json_to_file(data=cleaned_llm_response, directory=JSON_DIRECTORY, filename=JSON_FILE_NAME)
+    if FLAW_STORE_PATH:
+        flaw_store = FlawStore(FLAW_STORE_PATH)
+        model = f"{GEMINI_MODEL}+{GEMINI_ESCALATION_MODEL}" if DETECTION_MODE == "cascade" else GEMINI_MODEL
+        run_id = flaw_store.add_run(paper_id_from_url(HTML_URL), cleaned_llm_response, model=model)
+        print(f"[+] Saved the flaws to the flaw store (run {run_id})")
+        flaw_store.close()
+    metrics.close()
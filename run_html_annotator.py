@@ -1,4 +1,7 @@
 from html_annotator import HTMLAnnotator
+from flaw_store import FlawStore
+from html_batch_downloader import paper_id_from_url
+from metrics import metrics
 from config import (
     HTML_FILE_NAME,
     HTML_DIRECTORY,
@@ -7,16 +10,32 @@ from config import (
     JSON_DIRECTORY,
     JSON_FILE_NAME,
     ANNOTATED_HTML_FILE,
-    ANNOTATED_HTML_DIRECTORY
+    ANNOTATED_HTML_DIRECTORY,
+    ANCHOR_FUZZY_MATCHING,
+    ANNOTATION_FLAW_DATA,
+    HTML_URL,
+    FLAW_STORE_PATH,
+    METRICS_ENABLED,
+    METRICS_JSONL_FILE,
+    METRICS_PROMETHEUS_FILE
 )
 
 # Example usage
 if __name__ == "__main__":
+    metrics.configure(enabled=METRICS_ENABLED, jsonl_path=METRICS_JSONL_FILE, prometheus_path=METRICS_PROMETHEUS_FILE)
     annotator = HTMLAnnotator(
         template_directory=HTML_TEMPLATE_DIRECTORY,
         template_file=HTML_TEMPLATE_FILE_NAME,
+        fuzzy_anchors=ANCHOR_FUZZY_MATCHING,
+        flaw_data=ANNOTATION_FLAW_DATA
     )
     annotator.load_html(html_directory=HTML_DIRECTORY, html_file=HTML_FILE_NAME)
-    annotator.load_flaws(json_directory=JSON_DIRECTORY, json_file=JSON_FILE_NAME)
+    if FLAW_STORE_PATH:
+        flaw_store = FlawStore(FLAW_STORE_PATH)
+        annotator.load_flaws_from_store(flaw_store, paper_id_from_url(HTML_URL))
+        flaw_store.close()
+    else:
+        annotator.load_flaws(json_directory=JSON_DIRECTORY, json_file=JSON_FILE_NAME)
     annotator.annotate_html()
-    annotator.save_annotated_html(html_directory=ANNOTATED_HTML_DIRECTORY, html_file=ANNOTATED_HTML_FILE)
\ No newline at end of file
+    annotator.save_annotated_html(html_directory=ANNOTATED_HTML_DIRECTORY, html_file=ANNOTATED_HTML_FILE)
+    metrics.close()
@@ -0,0 +1,41 @@
+from html_batch_annotator import HTML_BatchAnnotator
+from metrics import metrics
+from config import (
+    HTML_FILE_NAME,
+    HTML_DIRECTORY,
+    HTML_TEMPLATE_DIRECTORY,
+    HTML_TEMPLATE_FILE_NAME,
+    JSON_FILE_NAME,
+    ANNOTATED_HTML_FILE,
+    ANCHOR_FUZZY_MATCHING,
+    ANNOTATION_FLAW_DATA,
+    ANNOTATION_MAX_WORKERS,
+    ANNOTATION_MAX_IN_FLIGHT,
+    ANNOTATION_REPORT_FILE_NAME,
+    JINJA_BYTECODE_CACHE_DIRECTORY,
+    METRICS_ENABLED,
+    METRICS_JSONL_FILE,
+    METRICS_PROMETHEUS_FILE
+)
+
+if __name__ == "__main__":
+
+    metrics.configure(enabled=METRICS_ENABLED, jsonl_path=METRICS_JSONL_FILE, prometheus_path=METRICS_PROMETHEUS_FILE)
+
+    batch_annotator = HTML_BatchAnnotator(
+        papers_dir=HTML_DIRECTORY,
+        html_file_name=HTML_FILE_NAME,
+        json_file_name=JSON_FILE_NAME,
+        annotated_file_name=ANNOTATED_HTML_FILE,
+        template_directory=HTML_TEMPLATE_DIRECTORY,
+        template_file=HTML_TEMPLATE_FILE_NAME,
+        fuzzy_anchors=ANCHOR_FUZZY_MATCHING,
+        flaw_data=ANNOTATION_FLAW_DATA,
+        bytecode_cache_dir=JINJA_BYTECODE_CACHE_DIRECTORY,
+        max_workers=ANNOTATION_MAX_WORKERS,
+        max_in_flight=ANNOTATION_MAX_IN_FLIGHT
+    )
+    batch_annotator.annotate_all()
+    report_path = batch_annotator.save_report(directory=HTML_DIRECTORY, filename=ANNOTATION_REPORT_FILE_NAME)
+    print(f"[+] Saved annotation report to {report_path}")
+    metrics.close()
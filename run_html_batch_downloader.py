@@ -0,0 +1,47 @@
+from html_batch_downloader import HTML_BatchDownloader, read_url_list
+from download_cache import DownloadCache
+from metrics import metrics
+from config import (
+    HTML_URL_LIST_FILE,
+    HTML_FILE_NAME,
+    HTML_DIRECTORY,
+    DOWNLOAD_REPORT_FILE_NAME,
+    DOWNLOAD_MAX_WORKERS,
+    DOWNLOAD_MAX_PER_HOST,
+    DOWNLOAD_MAX_RETRIES,
+    DOWNLOAD_TIMEOUT,
+    HTML_PARSER_BACKEND,
+    PARAGRAPH_IDS,
+    HTML_STREAMING,
+    DOWNLOAD_CACHE_DIRECTORY,
+    DOWNLOAD_CACHE_MAX_SIZE_MB,
+    METRICS_ENABLED,
+    METRICS_JSONL_FILE,
+    METRICS_PROMETHEUS_FILE
+)
+
+if __name__ == "__main__":
+
+    metrics.configure(enabled=METRICS_ENABLED, jsonl_path=METRICS_JSONL_FILE, prometheus_path=METRICS_PROMETHEUS_FILE)
+
+    cache = None
+    if DOWNLOAD_CACHE_DIRECTORY and not HTML_STREAMING:
+        cache = DownloadCache(cache_dir=DOWNLOAD_CACHE_DIRECTORY, max_size_mb=DOWNLOAD_CACHE_MAX_SIZE_MB)
+
+    batch_download = HTML_BatchDownloader(
+        html_urls=read_url_list(HTML_URL_LIST_FILE),
+        html_file_name=HTML_FILE_NAME,
+        output_dir=HTML_DIRECTORY,
+        max_workers=DOWNLOAD_MAX_WORKERS,
+        max_per_host=DOWNLOAD_MAX_PER_HOST,
+        max_retries=DOWNLOAD_MAX_RETRIES,
+        timeout=DOWNLOAD_TIMEOUT,
+        parser_backend=HTML_PARSER_BACKEND,
+        cache=cache,
+        paragraph_ids=PARAGRAPH_IDS,
+        streaming=HTML_STREAMING
+    )
+    batch_download.download_all()
+    report_path = batch_download.save_report(directory=HTML_DIRECTORY, filename=DOWNLOAD_REPORT_FILE_NAME)
+    print(f"[+] Saved download report to {report_path}")
+    metrics.close()
@@ -1,11 +1,36 @@
 from html_downloader import HTML_Downloader
-from config import HTML_URL, HTML_FILE_NAME, HTML_DIRECTORY
+from download_cache import DownloadCache
+from metrics import metrics
+from config import (
+    HTML_URL,
+    HTML_FILE_NAME,
+    HTML_DIRECTORY,
+    HTML_PARSER_BACKEND,
+    PARAGRAPH_IDS,
+    HTML_STREAMING,
+    DOWNLOAD_CACHE_DIRECTORY,
+    DOWNLOAD_CACHE_MAX_SIZE_MB,
+    METRICS_ENABLED,
+    METRICS_JSONL_FILE,
+    METRICS_PROMETHEUS_FILE
+)
 
 if __name__ == "__main__":
 
+    metrics.configure(enabled=METRICS_ENABLED, jsonl_path=METRICS_JSONL_FILE, prometheus_path=METRICS_PROMETHEUS_FILE)
+
+    cache = None
+    if DOWNLOAD_CACHE_DIRECTORY and not HTML_STREAMING:
+        cache = DownloadCache(cache_dir=DOWNLOAD_CACHE_DIRECTORY, max_size_mb=DOWNLOAD_CACHE_MAX_SIZE_MB)
+
     html_download = HTML_Downloader(
         html_url=HTML_URL,
         html_file_name=HTML_FILE_NAME,
-        output_dir=HTML_DIRECTORY
+        output_dir=HTML_DIRECTORY,
+        parser_backend=HTML_PARSER_BACKEND,
+        cache=cache,
+        paragraph_ids=PARAGRAPH_IDS,
+        streaming=HTML_STREAMING
     )
     html_download.download_html()
+    metrics.close()
@@ -0,0 +1,14 @@
+from benchmark import run_memory_benchmark
+from utils import save_json_to_file
+from config import (
+    MEMORY_BENCHMARK_SIZES,
+    BENCHMARK_DIRECTORY,
+    MEMORY_BENCHMARK_REPORT_FILE_NAME
+)
+
+
+if __name__ == "__main__":
+
+    results = run_memory_benchmark(sizes=MEMORY_BENCHMARK_SIZES)
+    report_path = save_json_to_file(data=results, directory=BENCHMARK_DIRECTORY, filename=MEMORY_BENCHMARK_REPORT_FILE_NAME)
+    print(f"[+] Saved memory benchmark report to {report_path}")
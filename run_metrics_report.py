@@ -0,0 +1,24 @@
+import os
+from metrics import summarize_metrics
+from utils import save_json_to_file
+from config import (
+    METRICS_JSONL_FILE,
+    METRICS_SUMMARY_FILE_NAME
+)
+
+if __name__ == "__main__":
+
+    summary = summarize_metrics(METRICS_JSONL_FILE)
+    for paper_id, stages in summary.items():
+        llm = stages.get("llm", {})
+        seconds = sum(stage.get("seconds", 0) for stage in stages.values())
+        print(
+            f"[+] {paper_id}: {seconds:.1f}s, {llm.get('calls', 0)} LLM calls, "
+            f"{llm.get('prompt_token_count', 0)} prompt / {llm.get('candidates_token_count', 0)} output / "
+            f"{llm.get('cached_content_token_count', 0)} cached tokens"
+        )
+
+    summary_path = save_json_to_file(
+        data=summary, directory=os.path.dirname(METRICS_JSONL_FILE) or ".", filename=METRICS_SUMMARY_FILE_NAME
+    )
+    print(f"[+] Saved metrics summary to {summary_path}")
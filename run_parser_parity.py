@@ -0,0 +1,77 @@
+import os
+import time
+import difflib
+from html_downloader import HTML_Downloader, PARSER_BACKENDS
+from utils import read_html_file, save_json_to_file
+from config import (
+    HTML_DIRECTORY,
+    PARSER_PARITY_DIRECTORY,
+    PARSER_PARITY_REPORT_FILE_NAME
+)
+
+REFERENCE_BACKEND = "html.parser"
+
+
+def clean_with_backend(raw_html: str, parser_backend: str):
+    """
+    Clean raw HTML with a parser backend.
+
+    Returns:
+        tuple: (cleaned HTML, cleaning time in seconds)
+    """
+    downloader = HTML_Downloader(
+        html_url="",
+        html_file_name="",
+        output_dir=HTML_DIRECTORY,
+        parser_backend=parser_backend
+    )
+    start = time.perf_counter()
+    html_content = downloader.process_html(raw_html)
+    return html_content, time.perf_counter() - start
+
+
+def compare_backends(raw_html: str, max_diff_lines: int = 40) -> dict:
+    """
+    Clean raw HTML with every backend and diff the output against the html.parser output.
+    """
+    reference, reference_seconds = clean_with_backend(raw_html, REFERENCE_BACKEND)
+    result = {REFERENCE_BACKEND: {"seconds": round(reference_seconds, 4), "identical": True}}
+
+    for parser_backend in PARSER_BACKENDS:
+        if parser_backend == REFERENCE_BACKEND:
+            continue
+        html_content, seconds = clean_with_backend(raw_html, parser_backend)
+        diff = list(difflib.unified_diff(
+            reference.splitlines(keepends=True),
+            html_content.splitlines(keepends=True),
+            fromfile=REFERENCE_BACKEND,
+            tofile=parser_backend
+        ))
+        result[parser_backend] = {
+            "seconds": round(seconds, 4),
+            "speedup": round(reference_seconds / seconds, 2) if seconds else None,
+            "identical": html_content == reference,
+            "diff": "".join(diff[:max_diff_lines])
+        }
+    return result
+
+
+if __name__ == "__main__":
+
+    if not os.path.isdir(PARSER_PARITY_DIRECTORY):
+        raise FileNotFoundError(f"[-] Directory not found: {PARSER_PARITY_DIRECTORY} (place raw arXiv HTML files in it)")
+
+    report = {}
+    for filename in sorted(os.listdir(PARSER_PARITY_DIRECTORY)):
+        if not filename.endswith(".html"):
+            continue
+        raw_html = read_html_file(directory=PARSER_PARITY_DIRECTORY, filename=filename)
+        report[filename] = compare_backends(raw_html)
+        for parser_backend, result in report[filename].items():
+            status = "[+]" if result["identical"] else "[-]"
+            print(f"{status} {filename} {parser_backend}: {result['seconds']}s identical={result['identical']}")
+            if not result["identical"]:
+                print(result["diff"])
+
+    report_path = save_json_to_file(data=report, directory=HTML_DIRECTORY, filename=PARSER_PARITY_REPORT_FILE_NAME)
+    print(f"[+] Saved parser parity report to {report_path}")
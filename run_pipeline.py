@@ -0,0 +1,146 @@
+import os
+from pipeline import PaperPipeline
+from async_gemini_client import AsyncGeminiClient
+from download_cache import DownloadCache
+from html_batch_downloader import read_url_list
+from llm_cache import LLMResponseCache
+from flaw_store import FlawStore
+from preflight import build_planner
+from metrics import metrics
+from config import (
+    HTML_URL_LIST_FILE,
+    HTML_FILE_NAME,
+    HTML_DIRECTORY,
+    HTML_TEMPLATE_DIRECTORY,
+    HTML_TEMPLATE_FILE_NAME,
+    HTML_PARSER_BACKEND,
+    PARAGRAPH_IDS,
+    JSON_FILE_NAME,
+    ANNOTATED_HTML_FILE,
+    DOWNLOAD_MAX_WORKERS,
+    DOWNLOAD_MAX_PER_HOST,
+    DOWNLOAD_MAX_RETRIES,
+    DOWNLOAD_TIMEOUT,
+    DOWNLOAD_CACHE_DIRECTORY,
+    DOWNLOAD_CACHE_MAX_SIZE_MB,
+    GEMINI_MODEL,
+    GEMINI_CACHE_PATH,
+    GEMINI_CACHE_TTL_HOURS,
+    GEMINI_CACHE_MAX_SIZE_MB,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_REQUESTS_PER_MINUTE,
+    GEMINI_TOKENS_PER_MINUTE,
+    GEMINI_MAX_RETRIES,
+    GEMINI_TIMEOUT,
+    GEMINI_DEADLINE,
+    GEMINI_STRUCTURED_OUTPUT,
+    GEMINI_MAX_REREQUESTS,
+    GEMINI_CONTEXT_CACHE_TTL,
+    PAPER_SERIALIZATION,
+    DETECTION_MODE,
+    CHUNK_MAX_TOKENS,
+    GEMINI_ESCALATION_MODEL,
+    CASCADE_MIN_CONFIDENCE,
+    CASCADE_ESCALATION_SEVERITIES,
+    ANCHOR_FUZZY_MATCHING,
+    ANNOTATION_FLAW_DATA,
+    ANNOTATION_MAX_WORKERS,
+    JINJA_BYTECODE_CACHE_DIRECTORY,
+    PIPELINE_MANIFEST_FILE_NAME,
+    PIPELINE_REPORT_FILE_NAME,
+    FLAW_STORE_PATH,
+    PREFLIGHT_ENABLED,
+    METRICS_ENABLED,
+    METRICS_JSONL_FILE,
+    METRICS_PROMETHEUS_FILE
+)
+from dotenv import load_dotenv
+load_dotenv()
+API_KEY = os.getenv("GEMINI_API_KEY")
+
+
+def build_pipeline() -> PaperPipeline:
+    """
+    The pipeline configured in config.py (also used by run_pipeline_worker.py).
+    """
+    download_cache = None
+    if DOWNLOAD_CACHE_DIRECTORY:
+        download_cache = DownloadCache(cache_dir=DOWNLOAD_CACHE_DIRECTORY, max_size_mb=DOWNLOAD_CACHE_MAX_SIZE_MB)
+
+    llm_cache = None
+    if GEMINI_CACHE_PATH:
+        llm_cache = LLMResponseCache(
+            cache_path=GEMINI_CACHE_PATH,
+            ttl_hours=GEMINI_CACHE_TTL_HOURS,
+            max_size_mb=GEMINI_CACHE_MAX_SIZE_MB
+        )
+
+    gemini = AsyncGeminiClient(
+        api_key=API_KEY,
+        model=GEMINI_MODEL,
+        cache=llm_cache,
+        max_concurrency=GEMINI_MAX_CONCURRENCY,
+        requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+        tokens_per_minute=GEMINI_TOKENS_PER_MINUTE,
+        max_retries=GEMINI_MAX_RETRIES,
+        timeout=GEMINI_TIMEOUT,
+        context_cache_ttl=GEMINI_CONTEXT_CACHE_TTL
+    )
+
+    escalation_gemini = None
+    if DETECTION_MODE == "cascade":
+        escalation_gemini = AsyncGeminiClient(
+            api_key=API_KEY,
+            model=GEMINI_ESCALATION_MODEL,
+            cache=llm_cache,
+            max_concurrency=GEMINI_MAX_CONCURRENCY,
+            requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+            tokens_per_minute=GEMINI_TOKENS_PER_MINUTE,
+            max_retries=GEMINI_MAX_RETRIES,
+            timeout=GEMINI_TIMEOUT,
+            context_cache_ttl=GEMINI_CONTEXT_CACHE_TTL
+        )
+
+    return PaperPipeline(
+        papers_dir=HTML_DIRECTORY,
+        html_file_name=HTML_FILE_NAME,
+        json_file_name=JSON_FILE_NAME,
+        annotated_file_name=ANNOTATED_HTML_FILE,
+        gemini=gemini,
+        template_directory=HTML_TEMPLATE_DIRECTORY,
+        template_file=HTML_TEMPLATE_FILE_NAME,
+        parser_backend=HTML_PARSER_BACKEND,
+        paragraph_ids=PARAGRAPH_IDS,
+        download_cache=download_cache,
+        download_workers=DOWNLOAD_MAX_WORKERS,
+        download_max_per_host=DOWNLOAD_MAX_PER_HOST,
+        download_max_retries=DOWNLOAD_MAX_RETRIES,
+        download_timeout=DOWNLOAD_TIMEOUT,
+        serialization=PAPER_SERIALIZATION,
+        detection_mode=DETECTION_MODE,
+        chunk_max_tokens=CHUNK_MAX_TOKENS,
+        escalation_gemini=escalation_gemini,
+        cascade_min_confidence=CASCADE_MIN_CONFIDENCE,
+        cascade_escalation_severities=CASCADE_ESCALATION_SEVERITIES,
+        structured=GEMINI_STRUCTURED_OUTPUT,
+        max_rerequests=GEMINI_MAX_REREQUESTS,
+        deadline=GEMINI_DEADLINE,
+        fuzzy_anchors=ANCHOR_FUZZY_MATCHING,
+        flaw_data=ANNOTATION_FLAW_DATA,
+        bytecode_cache_dir=JINJA_BYTECODE_CACHE_DIRECTORY,
+        annotate_workers=ANNOTATION_MAX_WORKERS,
+        manifest_file_name=PIPELINE_MANIFEST_FILE_NAME,
+        flaw_store=FlawStore(FLAW_STORE_PATH) if FLAW_STORE_PATH else None,
+        planner=build_planner(gemini) if PREFLIGHT_ENABLED or DETECTION_MODE == "auto" else None
+    )
+
+
+if __name__ == "__main__":
+
+    metrics.configure(enabled=METRICS_ENABLED, jsonl_path=METRICS_JSONL_FILE, prometheus_path=METRICS_PROMETHEUS_FILE)
+
+    pipeline = build_pipeline()
+    pipeline.run(read_url_list(HTML_URL_LIST_FILE))
+    report_path = pipeline.save_report(directory=HTML_DIRECTORY, filename=PIPELINE_REPORT_FILE_NAME)
+    print(f"[+] Saved pipeline report to {report_path}")
+    metrics.close()
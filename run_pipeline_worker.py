@@ -0,0 +1,57 @@
+import argparse
+from config import (
+    HTML_URL_LIST_FILE,
+    WORKER_QUEUE_PATH,
+    WORKER_MAX_IN_FLIGHT,
+    WORKER_POLL_INTERVAL,
+    WORKER_MAX_ATTEMPTS,
+    METRICS_ENABLED,
+    METRICS_JSONL_FILE,
+    METRICS_PROMETHEUS_FILE
+)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Run the pipeline as a long-running worker fed by a local job queue, or add jobs to the queue."
+    )
+    parser.add_argument("--enqueue", nargs="+", metavar="URL", help="add jobs for these arXiv URLs or IDs")
+    parser.add_argument("--enqueue-list", action="store_true", help="add jobs for every URL of HTML_URL_LIST_FILE")
+    parser.add_argument("--stages", nargs="+", help="stages of the added jobs (download, detect, annotate), all by default")
+    parser.add_argument("--retry-failed", action="store_true", help="queue the failed jobs again")
+    parser.add_argument("--status", action="store_true", help="print the number of jobs per status")
+    parser.add_argument("--drain", action="store_true", help="stop the worker once the queue is empty")
+    args = parser.parse_args()
+
+    # Imported after parsing the arguments so --help and adding jobs start fast
+    from job_queue import JobQueue
+    queue = JobQueue(WORKER_QUEUE_PATH, max_attempts=WORKER_MAX_ATTEMPTS)
+
+    if args.enqueue or args.enqueue_list or args.retry_failed or args.status:
+        urls = list(args.enqueue or [])
+        if args.enqueue_list:
+            from html_batch_downloader import read_url_list
+            urls += read_url_list(HTML_URL_LIST_FILE)
+        for url in urls:
+            job_id = queue.enqueue(url, stages=args.stages)
+            print(f"[+] Job {job_id}: {url} {args.stages or 'all stages'}")
+        if args.retry_failed:
+            print(f"[+] Queued again {queue.retry_failed()} failed jobs")
+        print(f"[*] Jobs: {queue.counts()}")
+        queue.close()
+    else:
+        from metrics import metrics
+        from pipeline_worker import PipelineWorker
+        from run_pipeline import build_pipeline
+
+        metrics.configure(enabled=METRICS_ENABLED, jsonl_path=METRICS_JSONL_FILE, prometheus_path=METRICS_PROMETHEUS_FILE)
+        worker = PipelineWorker(
+            pipeline=build_pipeline(),
+            queue=queue,
+            max_in_flight=WORKER_MAX_IN_FLIGHT,
+            poll_interval=WORKER_POLL_INTERVAL
+        )
+        worker.run(exit_when_empty=args.drain)
+        queue.close()
+        metrics.close()
@@ -0,0 +1,57 @@
+import os
+from preflight import build_planner
+from utils import read_html_file, save_json_to_file
+from config import (
+    HTML_URL,
+    HTML_DIRECTORY,
+    HTML_FILE_NAME,
+    GEMINI_MODEL,
+    PREFLIGHT_COUNT_WITH_API,
+    PREFLIGHT_REPORT_FILE_NAME
+)
+from dotenv import load_dotenv
+load_dotenv()
+API_KEY = os.getenv("GEMINI_API_KEY")
+
+
+def iter_papers():
+    """
+    (paper_id, cleaned HTML) of every <HTML_DIRECTORY>/<paper_id>/ with HTML_FILE_NAME, one at a time,
+    or of the single paper of HTML_URL in HTML_DIRECTORY.
+    """
+    paper_dirs = [
+        os.path.join(HTML_DIRECTORY, name) for name in sorted(os.listdir(HTML_DIRECTORY))
+        if os.path.isfile(os.path.join(HTML_DIRECTORY, name, HTML_FILE_NAME))
+    ]
+    if not paper_dirs:
+        from html_batch_downloader import paper_id_from_url
+        yield paper_id_from_url(HTML_URL), read_html_file(directory=HTML_DIRECTORY, filename=HTML_FILE_NAME)
+        return
+    for paper_dir in paper_dirs:
+        yield os.path.basename(paper_dir), read_html_file(directory=paper_dir, filename=HTML_FILE_NAME)
+
+
+if __name__ == "__main__":
+
+    gemini = None
+    if PREFLIGHT_COUNT_WITH_API and API_KEY:
+        from async_gemini_client import AsyncGeminiClient
+        gemini = AsyncGeminiClient(api_key=API_KEY, model=GEMINI_MODEL)
+    else:
+        print("[*] Counting tokens with the local estimate (set GEMINI_API_KEY and PREFLIGHT_COUNT_WITH_API to use the API)")
+
+    planner = build_planner(gemini)
+    batch_plan = planner.plan_batch(iter_papers())
+    totals, schedule = batch_plan["totals"], batch_plan["schedule"]
+    print(f"[*] Token counts: {planner.counter.stats}")
+    print(f"[+] {totals['papers']} papers: {totals['strategies']}, {totals['requests']} requests")
+    print(f"[+] ~{totals['input_tokens']} input and ~{totals['output_tokens']} output tokens, cost: {totals['cost_usd']} USD")
+    print(
+        f"[+] ~{schedule['estimated_minutes']} minutes, bound by {schedule['bottleneck']} "
+        f"(concurrency saturating the quotas: {schedule['saturating_concurrency']})"
+    )
+    if totals["not_fitting"]:
+        print(f"[-] Requests over the limit of {planner.request_token_limit} tokens: {totals['not_fitting']}")
+    report_path = save_json_to_file(data=batch_plan, directory=HTML_DIRECTORY, filename=PREFLIGHT_REPORT_FILE_NAME)
+    print(f"[+] Saved preflight plan to {report_path}")
+    planner.counter.close()
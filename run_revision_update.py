@@ -0,0 +1,97 @@
+import os
+from async_gemini_client import AsyncGeminiClient
+from llm_cache import LLMResponseCache
+from revision_detector import RevisionFlawDetector
+from flaw_store import FlawStore
+from html_batch_downloader import paper_id_from_url
+from metrics import metrics
+from config import (
+    GEMINI_MODEL,
+    GEMINI_CACHE_PATH,
+    GEMINI_CACHE_TTL_HOURS,
+    GEMINI_CACHE_MAX_SIZE_MB,
+    GEMINI_MAX_CONCURRENCY,
+    GEMINI_REQUESTS_PER_MINUTE,
+    GEMINI_TOKENS_PER_MINUTE,
+    GEMINI_MAX_RETRIES,
+    GEMINI_TIMEOUT,
+    GEMINI_STRUCTURED_OUTPUT,
+    GEMINI_MAX_REREQUESTS,
+    GEMINI_CACHE_BYPASS,
+    GEMINI_DEADLINE,
+    GEMINI_CONTEXT_CACHE_TTL,
+    PAPER_SERIALIZATION,
+    PARAGRAPH_IDS,
+    CHUNK_MAX_TOKENS,
+    HTML_DIRECTORY,
+    HTML_FILE_NAME,
+    JSON_DIRECTORY,
+    JSON_FILE_NAME,
+    REVISION_PREVIOUS_DIRECTORY,
+    REVISION_CONTEXT_PARAGRAPHS,
+    REVISION_REPORT_FILE_NAME,
+    HTML_URL,
+    FLAW_STORE_PATH,
+    METRICS_ENABLED,
+    METRICS_JSONL_FILE,
+    METRICS_PROMETHEUS_FILE
+)
+from utils import (
+    read_html_file,
+    read_json_file,
+    save_json_to_file
+)
+from dotenv import load_dotenv
+load_dotenv()
+API_KEY = os.getenv("GEMINI_API_KEY")
+
+
+if __name__ == "__main__":
+
+    metrics.configure(enabled=METRICS_ENABLED, jsonl_path=METRICS_JSONL_FILE, prometheus_path=METRICS_PROMETHEUS_FILE)
+
+    cache = None
+    if GEMINI_CACHE_PATH:
+        cache = LLMResponseCache(
+            cache_path=GEMINI_CACHE_PATH,
+            ttl_hours=GEMINI_CACHE_TTL_HOURS,
+            max_size_mb=GEMINI_CACHE_MAX_SIZE_MB
+        )
+
+    gemini = AsyncGeminiClient(
+        api_key=API_KEY,
+        model=GEMINI_MODEL,
+        cache=cache,
+        max_concurrency=GEMINI_MAX_CONCURRENCY,
+        requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+        tokens_per_minute=GEMINI_TOKENS_PER_MINUTE,
+        max_retries=GEMINI_MAX_RETRIES,
+        timeout=GEMINI_TIMEOUT,
+        context_cache_ttl=GEMINI_CONTEXT_CACHE_TTL
+    )
+    previous_html = read_html_file(directory=REVISION_PREVIOUS_DIRECTORY, filename=HTML_FILE_NAME)
+    previous_flaws = read_json_file(directory=REVISION_PREVIOUS_DIRECTORY, filename=JSON_FILE_NAME)
+    html_content = read_html_file(directory=HTML_DIRECTORY, filename=HTML_FILE_NAME)
+
+    detector = RevisionFlawDetector(
+        gemini=gemini,
+        serialization=PAPER_SERIALIZATION,
+        max_tokens=CHUNK_MAX_TOKENS,
+        structured=GEMINI_STRUCTURED_OUTPUT,
+        paragraph_ids=PARAGRAPH_IDS,
+        context_paragraphs=REVISION_CONTEXT_PARAGRAPHS,
+        max_rerequests=GEMINI_MAX_REREQUESTS,
+        bypass_cache=GEMINI_CACHE_BYPASS,
+        deadline=GEMINI_DEADLINE
+    )
+    flaws = detector.detect_revision(html_content, previous_html, previous_flaws)
+    print(f"[*] Response parsing: {gemini.flaw_parser.stats}")
+    save_json_to_file(data=flaws, directory=JSON_DIRECTORY, filename=JSON_FILE_NAME)
+    if FLAW_STORE_PATH:
+        flaw_store = FlawStore(FLAW_STORE_PATH)
+        run_id = flaw_store.add_run(paper_id_from_url(HTML_URL), flaws, model=GEMINI_MODEL)
+        print(f"[+] Saved the flaws to the flaw store (run {run_id})")
+        flaw_store.close()
+    report_path = save_json_to_file(data=detector.stats, directory=JSON_DIRECTORY, filename=REVISION_REPORT_FILE_NAME)
+    print(f"[+] Saved revision report to {report_path}")
+    metrics.close()
@@ -0,0 +1,66 @@
+import time
+from html_annotator import HTMLAnnotator, FLAW_DATA_MODES
+from utils import save_json_to_file
+from config import (
+    HTML_FILE_NAME,
+    HTML_DIRECTORY,
+    HTML_TEMPLATE_DIRECTORY,
+    HTML_TEMPLATE_FILE_NAME,
+    JSON_DIRECTORY,
+    JSON_FILE_NAME,
+    ANCHOR_FUZZY_MATCHING,
+    VIEWER_COMPARISON_REPORT_FILE_NAME
+)
+
+REFERENCE_MODE = "inline"
+
+
+def annotate_with_mode(flaw_data: str) -> dict:
+    """
+    Annotate the configured paper with a flaw data mode and measure its output.
+
+    Returns:
+        dict: Sizes in bytes of the page and of the flaw details (embedded or sidecar), the
+            number of flaws and the annotation time.
+    """
+    annotator = HTMLAnnotator(
+        template_directory=HTML_TEMPLATE_DIRECTORY,
+        template_file=HTML_TEMPLATE_FILE_NAME,
+        fuzzy_anchors=ANCHOR_FUZZY_MATCHING,
+        flaw_data=flaw_data
+    )
+    annotator.load_html(html_directory=HTML_DIRECTORY, html_file=HTML_FILE_NAME)
+    annotator.load_flaws(json_directory=JSON_DIRECTORY, json_file=JSON_FILE_NAME)
+    # Compile the template first, only the annotation itself is timed
+    annotator._get_template()
+    start = time.perf_counter()
+    annotator.annotate_html()
+    seconds = time.perf_counter() - start
+
+    flaw_data_bytes = len(annotator._flaw_data_json().encode("utf-8")) if flaw_data != "inline" else 0
+    return {
+        "page_bytes": len(annotator.annotated_html.encode("utf-8")),
+        "flaw_data_bytes": flaw_data_bytes,
+        "sidecar_bytes": flaw_data_bytes if flaw_data == "sidecar" else 0,
+        "flaws": sum(annotator.anchor_stats.values()) - annotator.anchor_stats["missed"],
+        "seconds": round(seconds, 4),
+    }
+
+
+if __name__ == "__main__":
+
+    report = {}
+    for flaw_data in FLAW_DATA_MODES:
+        report[flaw_data] = annotate_with_mode(flaw_data)
+
+    reference_bytes = report[REFERENCE_MODE]["page_bytes"]
+    for flaw_data, result in report.items():
+        total_bytes = result["page_bytes"] + result["sidecar_bytes"]
+        result["size_vs_inline"] = round(total_bytes / reference_bytes, 3) if reference_bytes else None
+        print(
+            f"[+] {flaw_data}: page {result['page_bytes']} bytes, sidecar {result['sidecar_bytes']} bytes, "
+            f"{result['flaws']} flaws, {result['seconds']}s ({100 * result['size_vs_inline']:.1f}% of inline)"
+        )
+
+    report_path = save_json_to_file(data=report, directory=HTML_DIRECTORY, filename=VIEWER_COMPARISON_REPORT_FILE_NAME)
+    print(f"[+] Saved viewer comparison report to {report_path}")
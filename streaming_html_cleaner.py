@@ -0,0 +1,398 @@
+import re
+from lxml_html_cleaner import LxmlHTMLCleaner, REMOVED_TAGS, VOID_TAGS, PRESERVE_WHITESPACE_TAGS
+from html_downloader import (
+    STRIP_PLACEHOLDERS,
+    MAX_PLACEHOLDER_LENGTH,
+    EMPTY_CONTAINER_TAGS,
+    CONTENT_TAGS,
+    WHITESPACE_RUN_PATTERN,
+    PRESERVE_WHITESPACE_TAG_PATTERN,
+    PARAGRAPH_ID_TAG_PATTERN,
+    PARAGRAPH_ID_ATTRIBUTE,
+    is_removed_attribute,
+    rewrite_citation_href,
+)
+
+BLANK_LINES_PATTERN = re.compile(r"\n\s*\n+")
+
+
+class _Frame:
+    # An open element inside the <article>, with the running state of the post-order rules
+    __slots__ = (
+        "element", "in_pre", "open_tag", "written", "pieces", "run", "text_done",
+        "text", "has_text", "has_content", "meaningful", "single_span",
+    )
+
+    def __init__(self, element, in_pre, open_tag, written=False):
+        self.element = element
+        self.in_pre = in_pre
+        self.open_tag = open_tag
+        # Written frames have their start tag in the output and write their content as it comes,
+        # the others keep it in `pieces` until their fate is known
+        self.written = written
+        self.pieces = []
+        # Text of the current BeautifulSoup string (element text or tail, merged over removed tags)
+        self.run = []
+        self.text_done = False
+        # Same values as in LxmlHTMLCleaner._clean_children
+        self.text = ""
+        self.has_text = False
+        self.has_content = False
+        self.meaningful = 0
+        self.single_span = False
+
+
+class _CleanedHTMLWriter:
+
+    def __init__(self, file, paragraph_ids=False):
+        """
+        Applies the string rules of the cleaner (blank lines, trimming, whitespace runs and
+        paragraph ids) to HTML written piece by piece. Trailing whitespace is held back until
+        the next visible character, so every rule sees complete whitespace runs.
+        """
+        self.file = file
+        self.paragraph_ids = paragraph_ids
+        self._pending = ""
+        self._last_char = ""
+        self._depth = 0
+        self._paragraph_count = 0
+        self.bytes_written = 0
+
+    def write(self, html):
+        self._pending += html
+        end = len(self._pending.rstrip())
+        if end == 0:
+            return
+        head, self._pending = self._pending[:end], self._pending[end:]
+        head = BLANK_LINES_PATTERN.sub("\n", head)
+        if not self._last_char:
+            head = head.lstrip()
+        # The last character written is the context of a whitespace run at the start of `head`
+        head = self._collapse_whitespace_runs(self._last_char + head)[len(self._last_char):]
+        if self.paragraph_ids:
+            head = PARAGRAPH_ID_TAG_PATTERN.sub(self._stamp, head)
+        self.file.write(head)
+        self.bytes_written += len(head.encode("utf-8"))
+        self._last_char = head[-1]
+
+    def close(self):
+        # Trailing whitespace of the document is trimmed
+        self._pending = ""
+
+    def _collapse_whitespace_runs(self, html_str):
+        # html_downloader.collapse_whitespace_runs, with the <pre>/<textarea> depth kept between writes
+        def collapse(match):
+            return "\n" if "\n" in match.group(0) else " "
+
+        parts = []
+        position = 0
+        for preserve_tag in PRESERVE_WHITESPACE_TAG_PATTERN.finditer(html_str):
+            segment = html_str[position:preserve_tag.start()]
+            parts.append(WHITESPACE_RUN_PATTERN.sub(collapse, segment) if self._depth == 0 else segment)
+            parts.append(preserve_tag.group(0))
+            position = preserve_tag.end()
+            self._depth = max(self._depth - 1, 0) if preserve_tag.group(1) else self._depth + 1
+        segment = html_str[position:]
+        parts.append(WHITESPACE_RUN_PATTERN.sub(collapse, segment) if self._depth == 0 else segment)
+        return "".join(parts)
+
+    def _stamp(self, match):
+        # html_downloader.stamp_paragraph_ids, with the counter kept between writes
+        if match.group(1) is None or f"{PARAGRAPH_ID_ATTRIBUTE}=" in match.group(2):
+            return match.group(0)
+        self._paragraph_count += 1
+        return f'<{match.group(1)} {PARAGRAPH_ID_ATTRIBUTE}="p{self._paragraph_count}"{match.group(2)}>'
+
+
+class StreamingHTMLCleaner(LxmlHTMLCleaner):
+
+    def __init__(self, paragraph_ids=False):
+        """
+        Runs the `LxmlHTMLCleaner` pipeline on a document fed piece by piece, writing the cleaned
+        HTML as it goes, with the same result.
+
+        The document is parsed with lxml's incremental (pull) parser. Inside the <article> every
+        element is cleaned when it ends and then removed from the tree, so only the open elements
+        and the content whose fate is still unknown are in memory: an element is written as soon
+        as its visible text is too long to be a '{strip}' placeholder (it can then no longer be
+        removed), while short elements and <span> tags that may be unwrapped are kept until they
+        end. Figure captions are cleaned as a whole when they end. Peak memory therefore depends
+        on the largest such element, not on the size of the document. A document without an
+        <article> is kept whole and cleaned at the end.
+
+        Args:
+            paragraph_ids (bool): Stamp block elements with paragraph ids (see stamp_paragraph_ids).
+        """
+        super().__init__()
+        from lxml import etree
+        self._etree = etree
+        self._element_lookup = self._lxml_html.HtmlElementClassLookup()
+        self.paragraph_ids = paragraph_ids
+
+    def clean_stream(self, chunks, file) -> int:
+        """
+        Clean a raw arXiv HTML page given as an iterable of text chunks.
+
+        Args:
+            chunks: Iterable of str pieces of the raw HTML (e.g. a decoded HTTP response stream).
+            file: Text file object the cleaned HTML is written to.
+
+        Returns:
+            int: Number of bytes written (UTF-8).
+        """
+        self._parser = self._etree.HTMLPullParser(events=("start", "end"))
+        # Same element classes as lxml.html (drop_tree, drop_tag, ...)
+        self._parser.set_element_class_lookup(self._element_lookup)
+        self._writer = _CleanedHTMLWriter(file, paragraph_ids=self.paragraph_ids)
+        self._frames = []
+        # Cleaning result of ended elements, until their parent has read their tail
+        self._results = {}
+        self._skip = None
+        self._outer_pre = 0
+        self._state = "before"
+
+        for chunk in chunks:
+            if chunk:
+                self._parser.feed(chunk)
+                self._handle_events()
+        document = self._parser.close()
+        self._handle_events()
+
+        if self._state == "before" and document is not None:
+            # No <article>: clean the whole document like LxmlHTMLCleaner
+            self._writer.write(self._clean_document(document))
+        self._writer.close()
+        self._parser = None
+        self._results = {}
+        return self._writer.bytes_written
+
+    def _handle_events(self):
+        for event, element in self._parser.read_events():
+            if self._skip is not None:
+                if event == "end" and element is self._skip:
+                    self._skip = None
+                    if self._state == "inside":
+                        self._end_skipped(element)
+                continue
+            if not isinstance(element.tag, str):
+                continue
+            if self._state == "inside":
+                if event == "start":
+                    self._start(element)
+                else:
+                    self._end(element)
+            elif self._state == "before":
+                self._before_article(event, element)
+            elif event == "end":
+                # After the <article>: nothing more is written
+                element.clear()
+
+    def _before_article(self, event, element):
+        if event == "end":
+            if element.tag in PRESERVE_WHITESPACE_TAGS:
+                self._outer_pre = max(self._outer_pre - 1, 0)
+            return
+        if element.tag in REMOVED_TAGS:
+            self._skip = element
+        elif element.tag == "article":
+            # The <article> keeps its attributes and is always written
+            in_pre = self._outer_pre > 0
+            self._frames.append(_Frame(element, in_pre, self._open_tag(element), written=True))
+            self._writer.write(self._open_tag(element) + ">")
+            self._state = "inside"
+        elif element.tag in PRESERVE_WHITESPACE_TAGS:
+            self._outer_pre += 1
+
+    def _start(self, element):
+        parent = self._frames[-1]
+        self._drain(parent, until=element)
+
+        if element.tag in REMOVED_TAGS or element.tag == "figcaption":
+            # Removed, or a figure caption (cleaned as a whole once its text is known)
+            self._skip = element
+            return
+        # The element is kept in some form: the text before it is complete
+        self._flush_run(parent)
+
+        if element.tag == "a" and element.get("href"):
+            element.set("href", rewrite_citation_href(element.get("href")))
+        for attr in list(element.attrib):
+            if is_removed_attribute(attr):
+                del element.attrib[attr]
+        in_pre = parent.in_pre or element.tag in PRESERVE_WHITESPACE_TAGS
+        self._frames.append(_Frame(element, in_pre, self._open_tag(element)))
+
+    def _end(self, element):
+        frame = self._frames.pop()
+        self._drain(frame, until=None)
+        self._flush_run(frame)
+
+        if frame.element.tag == "article":
+            self._writer.write("</article>")
+            self._state = "after"
+            element.clear()
+            return
+
+        unwrap = self._is_unwrapped(frame)
+        element.clear(keep_tail=True)
+        close_tag = f"</{element.tag}>"
+        if frame.written:
+            # Already written: only the end tag is left (none for an unwrapped <span>)
+            if not unwrap:
+                self._writer.write(close_tag)
+            self._results[element] = (element.tag, None, True, frame.has_content, False, "", "")
+            return
+
+        inner = "".join(frame.pieces)
+        if element.tag in VOID_TAGS and not inner:
+            full = frame.open_tag + "/>"
+        else:
+            full = frame.open_tag + ">" + inner + close_tag
+        unwrap = unwrap or (element.tag == "span" and frame.meaningful == 1 and frame.single_span)
+        self._results[element] = (element.tag, frame.text, frame.has_text, frame.has_content, unwrap, full, inner)
+
+    def _end_skipped(self, element):
+        if element.tag == "figcaption" and not self._get_text(element).lower().startswith("figure"):
+            in_pre = self._frames[-1].in_pre
+            self._results[element] = self._clean_subtree(element, in_pre)
+        element.clear(keep_tail=True)
+
+    def _clean_subtree(self, element, in_pre):
+        """
+        Clean a complete element with the LxmlHTMLCleaner rules.
+
+        Returns:
+            tuple: (tag, text, has_text, has_content, unwrap, serialized element, serialized content)
+        """
+        node_info = {}
+        stack = [(element, False, in_pre)]
+        while stack:
+            item, children_done, item_in_pre = stack.pop()
+            if children_done:
+                self._clean_children(item, node_info, is_root=False)
+                continue
+            if item is not element and (item.tag in REMOVED_TAGS or (
+                item.tag == "figcaption" and self._get_text(item).lower().startswith("figure")
+            )):
+                item.drop_tree()
+                continue
+            if item.tag == "a" and item.get("href"):
+                item.set("href", rewrite_citation_href(item.get("href")))
+            item_in_pre = item_in_pre or item.tag in PRESERVE_WHITESPACE_TAGS
+            if not item_in_pre:
+                item.text = self._collapse_whitespace(item.text)
+            stack.append((item, True, item_in_pre))
+            children = []
+            for child in item:
+                if not item_in_pre:
+                    child.tail = self._collapse_whitespace(child.tail)
+                if child.tag is not self._comment:
+                    children.append((child, False, item_in_pre))
+            stack.extend(reversed(children))
+
+        text, has_text, has_content, unwrap = node_info.pop(element)
+        tail, element.tail = element.tail, None
+        full = self._serialize(element)
+        element.tail = tail
+        open_tag = self._open_tag(element)
+        inner = full[len(open_tag) + 1:-len(f"</{element.tag}>")] if full.endswith(f"</{element.tag}>") else ""
+        return (element.tag, text, has_text, has_content, unwrap, full, inner)
+
+    def _drain(self, frame, until):
+        """
+        Add the children of a frame that are complete (all before `until`) to its state, write
+        or keep their cleaned HTML and remove them from the tree.
+        """
+        element = frame.element
+        if not frame.text_done:
+            frame.text_done = True
+            self._add_run(frame, element.text)
+        for child in list(element):
+            if child is until:
+                break
+            if child.tag is self._comment:
+                self._flush_run(frame)
+                if child.text and child.text.strip():
+                    self._add_meaningful(frame, is_span=False)
+                self._emit(frame, f"<!--{child.text or ''}-->")
+            else:
+                result = self._results.pop(child, None)
+                # Removed tags have no result, their tail joins the current text
+                if result is not None:
+                    self._flush_run(frame)
+                    self._add_child(frame, result)
+            self._add_run(frame, child.tail)
+            element.remove(child)
+
+    def _add_child(self, frame, result):
+        tag, child_text, child_has_text, child_has_content, child_unwrap, full, inner = result
+        frame.text = None if frame.text is None or child_text is None else frame.text + child_text
+        if child_text not in STRIP_PLACEHOLDERS:
+            frame.has_text = frame.has_text or child_has_text
+            frame.has_content = frame.has_content or child_has_content or tag in CONTENT_TAGS
+            self._add_meaningful(frame, is_span=tag == "span")
+            if tag in EMPTY_CONTAINER_TAGS and not child_has_text and not child_has_content:
+                pass
+            elif child_unwrap:
+                self._emit(frame, inner)
+            else:
+                self._emit(frame, full)
+        self._check_text(frame)
+
+    def _add_run(self, frame, text):
+        if text:
+            frame.run.append(text if frame.in_pre else self._collapse_whitespace(text))
+
+    def _flush_run(self, frame):
+        if not frame.run:
+            return
+        run = "".join(frame.run)
+        frame.run = []
+        if run.strip():
+            frame.has_text = True
+            frame.text = None if frame.text is None else frame.text + run.strip()
+            self._add_meaningful(frame, is_span=False)
+            self._check_text(frame)
+        self._emit(frame, self._escape(run))
+
+    def _add_meaningful(self, frame, is_span):
+        frame.meaningful += 1
+        frame.single_span = frame.meaningful == 1 and is_span
+        self._commit()
+
+    def _check_text(self, frame):
+        if frame.text is not None and len(frame.text) > MAX_PLACEHOLDER_LENGTH:
+            frame.text = None
+        if frame.text is None:
+            # Too long to be a placeholder: so is the text of every open ancestor
+            for ancestor in self._frames:
+                ancestor.text = None
+                ancestor.has_text = True
+            self._commit()
+
+    def _commit(self):
+        """
+        Write the open frames whose fate is known: their parent is written and they cannot be
+        removed (text too long for a placeholder) nor unwrapped (not a <span>, a <span> without
+        attributes which is always unwrapped, or with more than one meaningful child).
+        """
+        for parent, frame in zip(self._frames, self._frames[1:]):
+            if frame.written:
+                continue
+            if not parent.written or frame.text is not None:
+                return
+            if frame.element.tag == "span" and not (self._is_unwrapped(frame) or frame.meaningful > 1):
+                return
+            frame.written = True
+            content = "".join(frame.pieces)
+            frame.pieces = None
+            self._writer.write(content if self._is_unwrapped(frame) else frame.open_tag + ">" + content)
+
+    def _is_unwrapped(self, frame):
+        return frame.element.tag == "span" and len(frame.element.attrib) == 0
+
+    def _emit(self, frame, html):
+        if frame.written:
+            self._writer.write(html)
+        else:
+            frame.pieces.append(html)
@@ -0,0 +1,106 @@
+import json
+import random
+from flaw_schema import FLAW_CATEGORIES, FLAW_SEVERITIES
+
+WORDS = (
+    "the model results show that our method improves baseline accuracy on all datasets we evaluate "
+    "however limitations remain training data performance robust proposed approach experiments loss"
+).split()
+
+
+def generate_paper(
+    sections: int = 5,
+    paragraphs_per_section: int = 6,
+    table_rows: int = 4,
+    span_depth: int = 3,
+    flaw_rate: float = 0.3,
+    seed: int = 0
+) -> tuple:
+    """
+    Generate a synthetic raw arXiv-style (LaTeXML) HTML paper and a matching set of flaws.
+
+    The page has what the cleaner has to deal with on real papers: scripts, styles, navigation,
+    header and footer, an <article> with a title, an abstract and `sections` sections of
+    paragraphs with citation links, inline MathML, nested <span> tags, '{strip}' placeholders,
+    empty <div>/<figure> containers, figures with images and tables, and a bibliography.
+
+    Args:
+        sections (int): Number of sections.
+        paragraphs_per_section (int): Number of paragraphs per section.
+        table_rows (int): Number of rows of the table of each section.
+        span_depth (int): Nesting depth of the <span> tags of each paragraph.
+        flaw_rate (float): Fraction of the paragraphs that get a flaw.
+        seed (int): Seed of the random generator, the same arguments always give the same paper.
+
+    Returns:
+        tuple: (raw HTML, list of flaw dicts whose anchors are quoted from the paragraphs)
+    """
+    rng = random.Random(seed)
+
+    def sentence(length=12):
+        return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+    flaws = []
+    parts = [
+        '<!DOCTYPE html><html lang="en"><head><title>Synthetic Paper</title>',
+        '<script>window.MathJax = {};</script><style>.ltx_p { margin: 0; }</style>',
+        '<link rel="stylesheet" href="ltx-article.css"></head><body>',
+        '<nav class="ltx_page_navbar"><a href="#S1">Contents</a></nav><header class="ltx_page_header">arXiv</header>',
+        '<div class="ltx_page_main"><div class="ltx_page_content"><article class="ltx_document ltx_authors_1line">',
+        '<h1 class="ltx_title ltx_title_document">A Synthetic Paper for Benchmarks</h1>',
+        f'<div class="ltx_abstract"><h6 class="ltx_title ltx_title_abstract">Abstract</h6><p class="ltx_p">{sentence(40)}</p></div>',
+    ]
+    for s in range(1, sections + 1):
+        parts.append(
+            f'<section id="S{s}" class="ltx_section">'
+            f'<h2 class="ltx_title ltx_title_section"><span class="ltx_tag ltx_tag_section">{s} </span>Section {s}</h2>'
+        )
+        for p in range(1, paragraphs_per_section + 1):
+            first = sentence()
+            nested = sentence(6)
+            for depth in range(span_depth):
+                nested = f'<span class="ltx_text" id="S{s}.p{p}.s{depth}">{nested}</span>' if depth % 2 else f"<span>{nested}</span>"
+            parts.append(
+                f'<div id="S{s}.p{p}" class="ltx_para"><p class="ltx_p" data-ltx="1">{first} {nested} '
+                f'<cite class="ltx_cite">[<a href="https://arxiv.org/html/2501.00001v1#bib.bib{p}" class="ltx_ref">{p}</a>]</cite> '
+                f'<math id="S{s}.p{p}.m1" class="ltx_Math" alttext="x_{{{p}}}^2" display="inline"><semantics>'
+                f'<msubsup><mi>x</mi><mn>{p}</mn><mn>2</mn></msubsup></semantics></math> &amp; {sentence(8)}</p>\n\n</div>'
+                '<div class="ltx_para"><div>  </div><span> </span></div>'
+                '<span class="ltx_ERROR undefined">{strip}</span>'
+            )
+            if rng.random() < flaw_rate:
+                words = first[:-1].split()
+                flaws.append({
+                    "start_of_flaw": " ".join(words[:5]),
+                    "end_of_flaw": " ".join(words[-4:]) + ".",
+                    "flaw_category": rng.choice(FLAW_CATEGORIES),
+                    "flaw_description": sentence(30),
+                    "flaw_severity": rng.choice(FLAW_SEVERITIES),
+                    "flaw_confidence": rng.randint(1, 5),
+                })
+        parts.append(
+            f'<figure id="S{s}.F1" class="ltx_figure"><img src="x{s}.png" class="ltx_graphics" alt="" width="300" height="200"/>'
+            f'<figcaption class="ltx_caption">Figure {s}: {sentence(8)}</figcaption></figure>'
+        )
+        rows = "".join(
+            f'<tr class="ltx_tr"><td class="ltx_td">{sentence(3)}</td><td class="ltx_td">{rng.randint(0, 100)}.{rng.randint(0, 9)}</td></tr>'
+            for _ in range(table_rows)
+        )
+        parts.append(
+            f'<figure id="S{s}.T1" class="ltx_table"><figcaption class="ltx_caption">Table {s}: {sentence(6)}</figcaption>'
+            f'<table class="ltx_tabular">{rows}</table></figure><figure class="ltx_figure"><div></div></figure></section>'
+        )
+    references = "".join(
+        f'<li id="bib.bib{i}" class="ltx_bibitem"><span class="ltx_bibblock">{sentence(10)}</span></li>'
+        for i in range(1, paragraphs_per_section + 1)
+    )
+    parts.append(f'<section id="bib" class="ltx_bibliography"><h2 class="ltx_title">References</h2><ul>{references}</ul></section>')
+    parts.append('</article></div></div><footer class="ltx_page_footer">Generated by LaTeXML</footer><svg><circle r="1"/></svg></body></html>')
+    return "\n".join(parts), flaws
+
+
+def flaws_to_response_text(flaws: list) -> str:
+    """
+    The flaws as the model would return them (a JSON array), e.g. as FakeGeminiClient response.
+    """
+    return json.dumps(flaws, indent=4)
@@ -0,0 +1,59 @@
+from anchor_index import AnchorIndex, normalize_text
+
+PAPER = (
+    "<article><h2>Training</h2><p>The <em>model</em> is trained on the test&nbsp;set\n"
+    "for ten epochs. We compare A &amp; B with the model’s baseline.</p>"
+    "<p>The loss <math alttext=\"x^{2}+1\"><msup><mi>x</mi><mn>2</mn></msup><mo>+</mo><mn>1</mn></math>"
+    " is minimized with a learning rate of 0.1.</p></article>"
+)
+
+
+def flaw_text(index, start_text, end_text):
+    span = index.find(start_text, end_text)
+    return None if span is None else PAPER[span[0]:span[1]]
+
+
+def test_normalize_text():
+    assert normalize_text("The  Model&#8217;s\n“best” &amp; run—all") == "themodel's\"best\"&run-all"
+
+
+def test_anchors_across_tags_entities_and_line_breaks():
+    index = AnchorIndex(PAPER, fuzzy=False)
+    assert flaw_text(index, "The model is trained", "test set for ten epochs.") == (
+        "The <em>model</em> is trained on the test&nbsp;set\nfor ten epochs."
+    )
+    assert flaw_text(index, "compare A & B", "the model's baseline.") == (
+        "compare A &amp; B with the model’s baseline."
+    )
+    # The end anchor is searched after the start anchor only
+    assert index.find("for ten epochs.", "The model is trained") is None
+    assert index.stats == {"normalized": 2, "fuzzy": 0, "missed": 1}
+
+
+def test_fuzzy_match_within_the_error_ratio():
+    index = AnchorIndex(PAPER, max_error_ratio=0.1)
+    assert flaw_text(index, "The model is traimed on", "for ten epochs.") == (
+        "The <em>model</em> is trained on the test&nbsp;set\nfor ten epochs."
+    )
+    assert flaw_text(index, "We compare A & B", "the models baseline.") == (
+        "We compare A &amp; B with the model’s baseline."
+    )
+    # Too many edits for the ratio, and anchors too short to be matched fuzzily
+    assert index.find("The mdoel si trianed on", "for ten epochs.") is None
+    assert index.find("The model", "fro ten") is None
+    assert index.stats == {"normalized": 0, "fuzzy": 2, "missed": 2}
+
+    assert AnchorIndex(PAPER, fuzzy=False).find("The model is traimed on", "for ten epochs.") is None
+
+
+def test_compact_anchors_map_math_back_to_the_whole_element():
+    index = AnchorIndex(PAPER, fuzzy=False, compact=True)
+    assert flaw_text(index, "The loss $x^{2}+1$", "learning rate of 0.1.") == (
+        "The loss <math alttext=\"x^{2}+1\"><msup><mi>x</mi><mn>2</mn></msup><mo>+</mo><mn>1</mn></math>"
+        " is minimized with a learning rate of 0.1."
+    )
+    assert flaw_text(index, "## Training\n[p1] The model is", "trained") == "Training</h2><p>The <em>model</em> is trained"
+    assert index.stats == {"normalized": 2, "fuzzy": 0, "missed": 0}
+
+    # The plain index only knows the MathML content
+    assert AnchorIndex(PAPER, fuzzy=False).find("The loss $x^{2}+1$", "learning rate of 0.1.") is None
@@ -0,0 +1,69 @@
+import re
+import random
+from annotation_engine import find_flaw_span, splice_spans
+from lxml_html_cleaner import LxmlHTMLCleaner
+from synthetic_paper import generate_paper
+
+
+def replace_flaws(html_content, flaws):
+    # The annotation before splice_spans: one regex replace on the whole document per flaw
+    for flaw in flaws:
+        pattern = re.escape(flaw["start_of_flaw"]) + r"(.*?)" + re.escape(flaw["end_of_flaw"])
+        html_content = re.sub(
+            pattern, lambda match: f"{flaw_tag(flaw)}{match.group(0)}</span>", html_content, count=1, flags=re.DOTALL
+        )
+    return html_content
+
+
+def flaw_tag(flaw):
+    return f"<span class='flaw' data-category='{flaw['flaw_category']}'>"
+
+
+def test_splice_spans_matches_the_per_flaw_replace():
+    raw_html, flaws = generate_paper(sections=6, seed=3)
+    html_content = LxmlHTMLCleaner().clean(raw_html)
+    random.Random(0).shuffle(flaws)
+    spans = []
+    for flaw in flaws:
+        start, end = find_flaw_span(html_content, flaw["start_of_flaw"], flaw["end_of_flaw"])
+        spans.append((start, end, flaw_tag(flaw)))
+    assert splice_spans(html_content, spans) == replace_flaws(html_content, flaws)
+
+
+def test_find_flaw_span_takes_the_first_end_after_the_first_start():
+    html_content = "<p>end. A start, then the end. Another start and end.</p>"
+    start, end = find_flaw_span(html_content, "start", "end.")
+    assert html_content[start:end] == "start, then the end."
+    assert find_flaw_span(html_content, "Another", "then") is None
+    assert find_flaw_span(html_content, "missing", "end.") is None
+
+
+def test_find_flaw_span_retries_plain_text_anchors_escaped():
+    html_content = "<p>We compare A &amp; B when x &lt; 3.</p>"
+    start, end = find_flaw_span(html_content, "A & B", "x < 3.")
+    assert html_content[start:end] == "A &amp; B when x &lt; 3."
+
+
+def test_splice_spans_nests_spans():
+    spans = [(0, 6, "<span a>"), (2, 4, "<span b>")]
+    assert splice_spans("abcdef", spans) == "<span a>ab<span b>cd</span>ef</span>"
+
+
+def test_splice_spans_opens_the_longer_span_first_at_the_same_offset():
+    spans = [(0, 2, "<span b>"), (0, 6, "<span a>"), (4, 6, "<span c>")]
+    assert splice_spans("abcdef", spans) == "<span a><span b>ab</span>cd<span c>ef</span></span>"
+
+
+def test_splice_spans_keeps_identical_spans():
+    spans = [(2, 4, "<span a>"), (2, 4, "<span b>")]
+    assert splice_spans("abcdef", spans) == "ab<span a><span b>cd</span></span>ef"
+
+
+def test_splice_spans_splits_partially_overlapping_spans():
+    spans = [(0, 4, "<span a>"), (2, 6, "<span b>")]
+    # b is closed with a and re-opened after it, so the tags stay balanced
+    assert splice_spans("abcdef", spans) == "<span a>ab<span b>cd</span></span><span b>ef</span>"
+
+
+def test_splice_spans_without_spans_returns_the_html():
+    assert splice_spans("abcdef", []) == "abcdef"
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import time
+import pytest
+from google.genai import errors
+from async_gemini_client import AsyncGeminiClient, TokenBucket
+from fake_gemini_client import FakeGeminiClient
+from llm_cache import LLMResponseCache
+from metrics import metrics
+
+FLAW = {
+    "flaw_category": "4b",
+    "flaw_severity": "low",
+    "flaw_confidence": 4,
+    "flaw_description": "d",
+    "start_of_flaw": "a b c d e",
+    "end_of_flaw": "f g h i j",
+}
+
+
+@pytest.fixture
+def recorded_metrics():
+    metrics.configure(enabled=True)
+    yield metrics
+    metrics.configure(enabled=False)
+
+
+def make_client(fake, **kwargs):
+    kwargs.setdefault("backoff_factor", 0.01)
+    return AsyncGeminiClient(model="m", client=fake, **kwargs)
+
+
+def test_token_bucket_waits_for_the_refill():
+    async def acquire_all():
+        bucket = TokenBucket(rate_per_minute=1200, capacity=2)
+        start = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire(1)
+        return time.monotonic() - start
+
+    # 2 tokens at once, then 4 more at 20 per second
+    assert 0.18 <= asyncio.run(acquire_all()) < 1
+
+
+def test_requests_per_minute_bucket_spaces_the_requests():
+    fake = FakeGeminiClient(response_text="[]")
+    client = make_client(fake, requests_per_minute=1200)
+
+    async def run():
+        client._setup_limits()
+        # One request at once, then 20 per second
+        client._request_bucket = TokenBucket(client.requests_per_minute, capacity=1)
+        start = time.monotonic()
+        await client.generate_many(["a", "b", "c", "d", "e"])
+        return time.monotonic() - start
+
+    assert 0.18 <= asyncio.run(run()) < 1
+    assert fake.calls == 5
+
+
+def test_tokens_per_minute_bucket_takes_prompt_and_output_tokens():
+    fake = FakeGeminiClient(response_text="x" * 400, latency=0)
+    client = make_client(fake, tokens_per_minute=6000)
+
+    async def run():
+        await client.generate_text("p" * 4000)
+        return client._token_bucket.tokens
+
+    tokens = asyncio.run(run())
+    used = client.last_usage_metadata["total_token_count"]
+    assert used > 1000
+    # Refilled at 100 tokens per second meanwhile
+    assert 6000 - used <= tokens < 6000 - used + 50
+
+
+def test_concurrency_is_bounded():
+    fake = FakeGeminiClient(response_text="[]", latency=0.05)
+    client = make_client(fake, max_concurrency=3)
+    asyncio.run(client.generate_many([f"prompt {i}" for i in range(10)]))
+    assert fake.max_active == 3
+
+
+def test_429_is_retried():
+    fake = FakeGeminiClient(response_text="[]", fail_first=2, error_code=429)
+    client = make_client(fake, max_retries=3)
+    assert asyncio.run(client.generate_text("p")) == "[]"
+    assert fake.calls == 3
+    assert client.stats == {"requests": 3, "retries": 2, "failures": 0, "cache_hits": 0}
+
+
+def test_retry_budget_runs_out(recorded_metrics):
+    fake = FakeGeminiClient(response_text="[]", fail_first=10, error_code=503)
+    client = make_client(fake, max_retries=2)
+    with pytest.raises(errors.ServerError):
+        asyncio.run(client.generate_text("p"))
+    assert fake.calls == 3
+    assert client.stats["failures"] == 1
+    assert recorded_metrics.counters()['llm_failure{"model": "m"}']["calls"] == 1
+
+
+def test_client_errors_are_not_retried():
+    fake = FakeGeminiClient(response_text="[]", fail_first=1, error_code=400)
+    client = make_client(fake, max_retries=3)
+    with pytest.raises(errors.ClientError):
+        asyncio.run(client.generate_text("p"))
+    assert fake.calls == 1
+
+
+def test_deadline_raises_timeout_error_and_records_the_failure(recorded_metrics):
+    fake = FakeGeminiClient(response_text="[]", latency=2)
+    client = make_client(fake)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError, match="deadline of 0.2 seconds"):
+        asyncio.run(client.generate_text("p", deadline=0.2))
+    assert time.monotonic() - start < 1
+    assert client.stats["failures"] == 1
+    assert recorded_metrics.counters()['llm_failure{"model": "m"}']["calls"] == 1
+
+
+def test_attempt_timeouts_within_the_deadline_are_not_a_deadline(recorded_metrics):
+    fake = FakeGeminiClient(response_text="[]", latency=2)
+    client = make_client(fake, timeout=0.05, max_retries=1)
+    with pytest.raises(TimeoutError) as raised:
+        asyncio.run(client.generate_text("p", deadline=10))
+    assert "deadline" not in str(raised.value)
+    assert fake.calls == 2
+    assert recorded_metrics.counters()['llm_failure{"model": "m"}']["calls"] == 1
+
+
+def test_stream_deadline_records_the_failure(recorded_metrics):
+    fake = FakeGeminiClient(response_text="x" * 300, latency=6, stream_chunk_size=50)
+    client = make_client(fake)
+
+    async def collect():
+        return [text async for text in client.generate_text_stream("p", deadline=0.2)]
+
+    with pytest.raises(TimeoutError, match="deadline of 0.2 seconds"):
+        asyncio.run(collect())
+    assert recorded_metrics.counters()['llm_failure{"model": "m"}']["calls"] == 1
+
+
+def test_unparsable_flaw_response_is_not_cached(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "responses.sqlite"))
+    bad = AsyncGeminiClient(model="m", cache=cache, client=FakeGeminiClient(response_text="no flaws here", latency=0))
+    with pytest.raises(ValueError):
+        asyncio.run(bad.generate_flaws("p", structured=False, max_rerequests=0))
+
+    fake = FakeGeminiClient(response_text=json.dumps([FLAW]), latency=0)
+    good = AsyncGeminiClient(model="m", cache=cache, client=fake)
+    # The bad response is not served again, even without re-requests
+    assert asyncio.run(good.generate_flaws("p", structured=False, max_rerequests=0)) == [FLAW]
+    assert fake.calls == 1
+    # The parsed response is cached and served again
+    assert asyncio.run(good.generate_flaws("p", structured=False)) == [FLAW]
+    assert fake.calls == 1
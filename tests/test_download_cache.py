@@ -0,0 +1,70 @@
+import requests
+from benchmark import LocalPaperServer
+from download_cache import DownloadCache
+from html_downloader import HTML_Downloader
+from synthetic_paper import generate_paper
+
+RAW_HTML = generate_paper(sections=2, seed=1)[0]
+
+
+def make_downloader(url, output_dir, cache, **kwargs):
+    return HTML_Downloader(url, "paper.html", output_dir=str(output_dir), cache=cache, parser_backend="lxml", **kwargs)
+
+
+def test_cached_response_is_revalidated_with_a_conditional_get(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"))
+    with LocalPaperServer() as server:
+        url = server.add_paper("2501.00001", RAW_HTML)
+        sent_headers = []
+
+        def get(headers):
+            sent_headers.append(headers)
+            return requests.get(url, headers=headers, timeout=5)
+
+        raw_html, content_hash, status = cache.fetch(url, get)
+        assert (raw_html, status) == (RAW_HTML, "miss")
+        assert sent_headers[0] == {}
+
+        assert cache.fetch(url, get) == (RAW_HTML, content_hash, "revalidated")
+        assert "If-None-Match" in sent_headers[1]
+
+        # The paper changed: the ETag no longer matches and the new content replaces the old one
+        server.add_paper("2501.00001", RAW_HTML + "<p>v2</p>")
+        raw_html, new_hash, status = cache.fetch(url, get)
+        assert (raw_html, status) == (RAW_HTML + "<p>v2</p>", "miss")
+        assert new_hash != content_hash
+        assert cache.size() == len(raw_html.encode("utf-8"))
+
+
+def test_cleaned_html_is_invalidated_when_the_cleaner_key_changes(tmp_path, monkeypatch):
+    cache = DownloadCache(str(tmp_path / "cache"))
+    url = "http://127.0.0.1/html/2501.00001"
+    downloader = make_downloader(url, tmp_path, cache)
+    html_content, cached = downloader.process_html_cached(RAW_HTML, "hash")
+    assert not cached
+    assert downloader.process_html_cached(RAW_HTML, "hash") == (html_content, True)
+
+    with_ids = make_downloader(url, tmp_path, cache, paragraph_ids=True)
+    assert with_ids.cleaner_key != downloader.cleaner_key
+    html_with_ids, cached = with_ids.process_html_cached(RAW_HTML, "hash")
+    assert not cached
+    assert html_with_ids != html_content
+
+    # New cleaning rules bump CLEANER_VERSION
+    monkeypatch.setattr("html_downloader.CLEANER_VERSION", 999)
+    assert downloader.process_html_cached(RAW_HTML, "hash") == (html_content, False)
+
+
+def test_least_recently_used_entries_are_evicted_over_the_size_limit(tmp_path):
+    entry_size = 1000
+    cache = DownloadCache(str(tmp_path / "cache"), max_size_mb=2.5 * entry_size / (1024 * 1024))
+    for name in ("a", "b"):
+        cache.store_cleaned(name, "key", name * entry_size)
+    # "a" becomes the most recently used
+    assert cache.get_cleaned("a", "key") == "a" * entry_size
+
+    cache.store_cleaned("c", "key", "c" * entry_size)
+    assert cache.size() == 2 * entry_size
+    assert cache.get_cleaned("b", "key") is None
+    assert cache.get_cleaned("a", "key") == "a" * entry_size
+    assert cache.get_cleaned("c", "key") == "c" * entry_size
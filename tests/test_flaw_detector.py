@@ -0,0 +1,73 @@
+import json
+from async_gemini_client import AsyncGeminiClient
+from fake_gemini_client import FakeGeminiClient
+from flaw_detector import ChunkedFlawDetector, merge_flaws
+from lxml_html_cleaner import LxmlHTMLCleaner
+from synthetic_paper import generate_paper
+
+
+PAPER = (
+    "<article><p>The model is trained on the test set for ten epochs. It then uses the learning rate.</p>"
+    "<p>Results are reported without variance.</p></article>"
+)
+
+
+def make_flaw(start, end, confidence=3, severity="medium"):
+    return {
+        "flaw_category": "4b",
+        "flaw_severity": severity,
+        "flaw_confidence": confidence,
+        "flaw_description": "d",
+        "start_of_flaw": start,
+        "end_of_flaw": end,
+    }
+
+
+def test_merge_flaws_drops_identical_spans_and_keeps_the_best():
+    low = make_flaw("The model is trained", "on the test set.", confidence=2)
+    high = make_flaw("the  model is TRAINED", "on the test set.", confidence=5)
+    other = make_flaw("Results are reported", "without variance.")
+    assert merge_flaws([[low, other], [high]]) == [high, other]
+
+
+def test_merge_flaws_keeps_flaws_sharing_only_one_anchor():
+    first = make_flaw("The model is trained", "on the test set.")
+    same_start = make_flaw("The model is trained", "for ten epochs.")
+    same_end = make_flaw("Hyperparameters are tuned", "on the test set.")
+    assert merge_flaws([[first], [same_start, same_end]]) == [first, same_start, same_end]
+
+
+def test_merge_flaws_keeps_distinct_categories_on_one_span():
+    method = dict(make_flaw("The model is trained", "on the test set.", confidence=2), flaw_category="1a")
+    results = dict(make_flaw("The model is trained", "on the test set.", confidence=5), flaw_category="3b")
+    assert merge_flaws([[method], [results]]) == [method, results]
+    assert merge_flaws([[method], [results]], html_content=PAPER) == [method, results]
+
+
+def test_merge_flaws_merges_overlapping_spans_of_a_category_in_the_paper():
+    whole = make_flaw("The model is trained", "for ten epochs.", confidence=2)
+    inside = make_flaw("trained on the", "test set", confidence=4)
+    chained = make_flaw("for ten epochs.", "the learning rate.", confidence=3)
+    other_category = dict(inside, flaw_category="1a")
+    apart = make_flaw("Results are reported", "without variance.")
+    merged = merge_flaws([[whole, apart], [inside, chained, other_category]], html_content=PAPER)
+    assert merged == [inside, apart, other_category]
+    # Without the paper, only identical anchors are duplicates
+    assert len(merge_flaws([[whole, apart], [inside, chained, other_category]])) == 5
+
+
+def test_merge_flaws_merges_overlapping_paragraph_ids():
+    flaw = {"flaw_category": "1a", "start_id": "p3", "flaw_confidence": 2}
+    better = {"flaw_category": "1a", "start_id": "p4", "end_id": "p3", "flaw_confidence": 4}
+    apart = {"flaw_category": "1a", "start_id": "p5"}
+    other_category = {"flaw_category": "2b", "start_id": "p3"}
+    assert merge_flaws([[flaw, "not a flaw"], [better, apart, other_category]]) == [better, apart, other_category]
+
+
+def test_chunked_detection_counts_failed_chunks():
+    html = LxmlHTMLCleaner().clean(generate_paper(sections=4, seed=1)[0])
+    fake = FakeGeminiClient(response_text=json.dumps([make_flaw("a b c d e", "f g h i j")]), fail_first=1, error_code=503)
+    detector = ChunkedFlawDetector(AsyncGeminiClient(model="m", client=fake, max_retries=0), max_tokens=3000, max_rerequests=0)
+    flaws = detector.detect(html)
+    assert detector.failed_chunks == 1
+    assert flaws == [make_flaw("a b c d e", "f g h i j")]
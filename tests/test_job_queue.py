@@ -0,0 +1,47 @@
+from job_queue import JobQueue
+
+
+def test_recover_requeues_jobs_of_a_crashed_worker(tmp_path):
+    queue_path = str(tmp_path / "jobs.sqlite")
+    queue = JobQueue(queue_path)
+    first = queue.enqueue("2501.00001")
+    second = queue.enqueue("2501.00002", stages=["download"])
+    assert queue.claim()["id"] == first
+    assert queue.claim()["id"] == second
+    queue.complete(second)
+    # The worker is killed while the first job is running
+    queue.close()
+
+    queue = JobQueue(queue_path)
+    assert queue.counts() == {"queued": 0, "running": 1, "done": 1, "failed": 0}
+    assert queue.recover() == 1
+    job = queue.claim()
+    assert job["id"] == first
+    assert job["attempts"] == 2
+    queue.close()
+
+
+def test_recover_gives_up_a_job_interrupted_max_attempts_times(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), max_attempts=2)
+    queue.enqueue("2501.00001")
+    queue.claim()
+    assert queue.recover() == 1
+    queue.claim()
+    assert queue.recover() == 0
+    assert queue.counts()["failed"] == 1
+    assert queue.claim() is None
+
+    assert queue.retry_failed() == 1
+    assert queue.claim()["attempts"] == 1
+    queue.close()
+
+
+def test_jobs_of_the_same_paper_do_not_run_together(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    first = queue.enqueue("https://arxiv.org/html/2501.00001")
+    queue.enqueue("2501.00001")
+    other = queue.enqueue("2501.00002")
+    assert queue.claim()["id"] == first
+    assert queue.claim()["id"] == other
+    assert queue.claim() is None
+    queue.close()
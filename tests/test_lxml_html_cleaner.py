@@ -0,0 +1,21 @@
+import pytest
+from html_downloader import HTML_Downloader
+from lxml_html_cleaner import LxmlHTMLCleaner
+from synthetic_paper import generate_paper
+
+
+def clean_with_bs4(raw_html, tmp_path):
+    downloader = HTML_Downloader(html_url="", html_file_name="", output_dir=str(tmp_path), parser_backend="html.parser")
+    return downloader.process_html(raw_html)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_lxml_cleaner_matches_bs4_cleaner(seed, tmp_path):
+    raw_html = generate_paper(sections=4, span_depth=4, seed=seed)[0]
+    assert LxmlHTMLCleaner().clean(raw_html) == clean_with_bs4(raw_html, tmp_path)
+
+
+def test_lxml_backend_of_the_downloader_matches_bs4_backend(tmp_path):
+    raw_html = generate_paper(sections=3, seed=5)[0]
+    downloader = HTML_Downloader(html_url="", html_file_name="", output_dir=str(tmp_path), parser_backend="lxml")
+    assert downloader.process_html(raw_html) == clean_with_bs4(raw_html, tmp_path)
@@ -0,0 +1,74 @@
+import json
+import os
+from async_gemini_client import AsyncGeminiClient
+from benchmark import LocalPaperServer
+from fake_gemini_client import FakeGeminiClient
+from pipeline import PaperManifest, PaperPipeline
+from synthetic_paper import generate_paper
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FLAWS = json.dumps([{
+    "flaw_category": "4b",
+    "flaw_severity": "low",
+    "flaw_confidence": 4,
+    "flaw_description": "d",
+    "start_of_flaw": "a b c d e",
+    "end_of_flaw": "f g h i j",
+}])
+
+
+def test_manifest_is_up_to_date_until_inputs_or_outputs_change(tmp_path):
+    output = tmp_path / "flaws.json"
+    output.write_text("[]")
+    PaperManifest(str(tmp_path)).record("detect", {"model": "m"}, ["flaws.json"])
+
+    manifest = PaperManifest(str(tmp_path))
+    assert manifest.is_up_to_date("detect", {"model": "m"})
+    assert not manifest.is_up_to_date("detect", {"model": "other"})
+    assert not manifest.is_up_to_date("annotate", {"model": "m"})
+
+    output.write_text("[{}]")
+    assert not manifest.is_up_to_date("detect", {"model": "m"})
+    output.unlink()
+    assert not manifest.is_up_to_date("detect", {"model": "m"})
+
+
+def test_unreadable_manifest_is_ignored(tmp_path):
+    (tmp_path / "manifest.json").write_text("{not json")
+    assert PaperManifest(str(tmp_path)).stages == {}
+
+
+def make_pipeline(papers_dir, fake):
+    return PaperPipeline(
+        papers_dir=str(papers_dir),
+        html_file_name="paper.html",
+        json_file_name="flaws.json",
+        annotated_file_name="annotated.html",
+        gemini=AsyncGeminiClient(model="m", client=fake, max_retries=0),
+        template_directory=REPO_DIRECTORY,
+        template_file="template.html",
+        parser_backend="lxml",
+        detection_mode="chunked",
+        chunk_max_tokens=3000
+    )
+
+
+def test_pipeline_skips_up_to_date_stages_and_reruns_partial_detections(tmp_path):
+    with LocalPaperServer() as server:
+        url = server.add_paper("2501.00001", generate_paper(sections=4, seed=2)[0])
+
+        failing = FakeGeminiClient(response_text=FLAWS, fail_first=1, error_code=503)
+        result = make_pipeline(tmp_path, failing).run([url])[0]
+        assert result["stages"] == {"download": "ran", "detect": "failed"}
+        assert os.path.isfile(tmp_path / "2501_00001" / "flaws.json")
+
+        fake = FakeGeminiClient(response_text=FLAWS)
+        result = make_pipeline(tmp_path, fake).run([url])[0]
+        assert result["stages"]["detect"] == "ran"
+        assert result["stages"]["annotate"] == "ran"
+
+        calls = fake.calls
+        result = make_pipeline(tmp_path, fake).run([url])[0]
+        assert result["stages"]["detect"] == "skipped"
+        assert result["stages"]["annotate"] == "skipped"
+        assert fake.calls == calls
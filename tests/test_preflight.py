@@ -0,0 +1,39 @@
+from flaw_detector import ChunkedFlawDetector
+from lxml_html_cleaner import LxmlHTMLCleaner
+from paper_serializer import html_to_compact_text
+from preflight import BatchPlanner, TokenCounter
+from prompt import get_prompt
+from synthetic_paper import generate_paper
+from utils import estimate_tokens, fill_paper_in_prompt
+
+HTML = LxmlHTMLCleaner().clean(generate_paper(sections=8, seed=1)[0])
+
+
+def prompt_tokens(serialization, paper):
+    return estimate_tokens(fill_paper_in_prompt(get_prompt(serialization), paper))
+
+
+def test_compact_serialization_counts_the_compact_prompt():
+    plan = BatchPlanner(TokenCounter(), serialization="compact").plan_paper(HTML, "paper")
+    compact_tokens = prompt_tokens("compact", html_to_compact_text(HTML))
+    assert plan["strategy"] == "whole"
+    assert plan["whole_tokens"] == compact_tokens
+    assert plan["compact_tokens"] == compact_tokens
+    assert plan["whole_tokens"] < prompt_tokens("compact", HTML)
+
+
+def test_html_paper_over_the_limit_is_sent_compact():
+    html_tokens = prompt_tokens("html", HTML)
+    plan = BatchPlanner(TokenCounter(), max_prompt_tokens=html_tokens - 1).plan_paper(HTML, "paper")
+    assert plan["whole_tokens"] == html_tokens
+    assert plan["compact_tokens"] == prompt_tokens("compact", html_to_compact_text(HTML))
+    assert plan["strategy"] == "compact"
+
+
+def test_compact_paper_over_the_limit_is_chunked_like_the_detector():
+    compact_tokens = prompt_tokens("compact", html_to_compact_text(HTML))
+    planner = BatchPlanner(TokenCounter(), serialization="compact", max_prompt_tokens=compact_tokens - 1, chunk_max_tokens=2000)
+    plan = planner.plan_paper(HTML, "paper")
+    chunks, _ = ChunkedFlawDetector(None, serialization="compact", max_tokens=2000).build_prompts(HTML)
+    assert plan["strategy"] == "chunked"
+    assert plan["requests"] == len(chunks)
@@ -0,0 +1,34 @@
+import io
+import pytest
+from html_downloader import HTML_Downloader, stamp_paragraph_ids
+from lxml_html_cleaner import LxmlHTMLCleaner
+from streaming_html_cleaner import StreamingHTMLCleaner
+from synthetic_paper import generate_paper
+
+
+def clean_with_bs4(raw_html, tmp_path):
+    downloader = HTML_Downloader(html_url="", html_file_name="", output_dir=str(tmp_path), parser_backend="html.parser")
+    return downloader.process_html(raw_html)
+
+
+def clean_stream(raw_html, chunk_size, paragraph_ids=False):
+    output = io.StringIO()
+    chunks = [raw_html[i:i + chunk_size] for i in range(0, len(raw_html), chunk_size)]
+    StreamingHTMLCleaner(paragraph_ids=paragraph_ids).clean_stream(chunks, output)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 97, 4096, 10 ** 7])
+def test_streaming_cleaner_matches_bs4_cleaner(chunk_size, tmp_path):
+    raw_html = generate_paper(sections=3, span_depth=4, seed=3)[0]
+    assert clean_stream(raw_html, chunk_size) == clean_with_bs4(raw_html, tmp_path)
+
+
+def test_streaming_cleaner_stamps_the_same_paragraph_ids(tmp_path):
+    raw_html = generate_paper(sections=3, seed=4)[0]
+    assert clean_stream(raw_html, 512, paragraph_ids=True) == stamp_paragraph_ids(clean_with_bs4(raw_html, tmp_path))
+
+
+def test_streaming_cleaner_without_article():
+    raw_html = "<html><body><nav>menu</nav><p> Some   <span>text</span> </p></body></html>"
+    assert clean_stream(raw_html, 7) == LxmlHTMLCleaner().clean(raw_html)
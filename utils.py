@@ -1,6 +1,10 @@
 import os
 import json
 import re
+import math
+
+# Rough number of characters per token for English text and markup
+CHARS_PER_TOKEN = 4
 
 
 def read_html_file(directory: str, filename: str) -> str:
@@ -50,6 +54,37 @@ def read_json_file(directory: str, filename: str):
     return data
 
 
+def genai_errors():
+    """
+    The `google.genai.errors` module, imported on first use: google.genai is slow to import and
+    only needed once a request is made (e.g. `except genai_errors().APIError` imports it only when
+    an exception reaches that clause).
+    """
+    from google.genai import errors
+    return errors
+
+
+def split_prompt(prompt: str, html_content: str) -> tuple:
+    """
+    Splits a prompt at the '{paper}' placeholder into its static prefix and the part that varies per paper.
+
+    The prefix (instructions and flaw criteria) is identical for every paper and can be cached
+    by the model provider, only the second part needs to be sent for each paper.
+
+    Args:
+        prompt (str): The prompt template containing the placeholder '{paper}'.
+        html_content (str): The HTML content of the paper.
+
+    Returns:
+        tuple: (static prefix, paper followed by the rest of the prompt)
+    """
+    if "{paper}" not in prompt:
+        raise ValueError("[-] The prompt does not contain the '{paper}' placeholder.")
+
+    prefix, suffix = prompt.split("{paper}", 1)
+    return prefix, html_content + suffix.replace("{paper}", html_content)
+
+
 def fill_paper_in_prompt(prompt: str, html_content: str) -> str:
     """
     Replaces the '{paper}' placeholder in the prompt with the HTML content.
@@ -61,10 +96,21 @@ def fill_paper_in_prompt(prompt: str, html_content: str) -> str:
     Returns:
         str: The prompt with the HTML content inserted.
     """
-    if "{paper}" not in prompt:
-        raise ValueError("[-] The prompt does not contain the '{paper}' placeholder.")
+    prefix, paper_part = split_prompt(prompt, html_content)
+    return prefix + paper_part
 
-    return prompt.replace("{paper}", html_content)
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast local estimate of the number of tokens of a text (no API call).
+
+    Args:
+        text (str): The text to estimate.
+
+    Returns:
+        int: Estimated number of tokens.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
 
 
 def save_html_to_file(html_content: str, directory: str, filename: str) -> str: